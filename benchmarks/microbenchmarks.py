@@ -0,0 +1,225 @@
+"""
+Mikrotesty wydajności funkcji przetwarzających obiekty (parsowanie odpowiedzi, budowa geometrii i obiektów QgsFeature).
+
+Dla każdego przypadku i rozmiaru danych mierzone są: czas na obiekt (minimum i mediana z kilku powtórzeń)
+oraz alokacje pamięci Pythona na obiekt (tracemalloc - bez pamięci alokowanej przez biblioteki C++ QGIS/GEOS).
+Dane wejściowe są generowane syntetycznie przed pomiarem i nie wliczają się do wyników.
+
+Przykłady (z katalogu głównego repozytorium, w środowisku z pyqgis):
+    python benchmarks/microbenchmarks.py --features 10000 --vertices 50 500 5000 --save baseline.json
+    python benchmarks/microbenchmarks.py -k uldk --features 1000000 --vertices 50 --compare baseline.json
+"""
+import argparse
+import fnmatch
+import gc
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qgis.core import QgsApplication, QgsVectorLayer  # noqa: E402
+
+CASES = {}
+
+
+def case(name):
+    """Rejestruje przypadek testowy: funkcja(features, vertices) zwraca funkcję do zmierzenia"""
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+# --- Dane syntetyczne --------------------------------------------------------------------------------------------
+
+def ring(index: int, vertices: int, size: float = 50.0):
+    """Pierścień wielokąta (działka) o `vertices` wierzchołkach, kolejne obiekty na siatce w EPSG:2180"""
+    center_x = 450000.0 + (index % 1000) * size * 2
+    center_y = 450000.0 + (index // 1000) * size * 2
+    points = [(center_x + size / 2 * math.cos(2 * math.pi * i / vertices),
+               center_y + size / 2 * math.sin(2 * math.pi * i / vertices)) for i in range(vertices)]
+    points.append(points[0])
+    return points
+
+
+def polygon_wkt(index: int, vertices: int) -> str:
+    return "POLYGON((" + ",".join(f"{x:.2f} {y:.2f}" for x, y in ring(index, vertices)) + "))"
+
+
+def uldk_rows(features: int, vertices: int):
+    # Powtarzające się geometrie ograniczają zużycie pamięci przez dane wejściowe przy dużej liczbie obiektów
+    geometries = [polygon_wkt(index, vertices) for index in range(min(features, 100))]
+    return [f"SRID=2180;{geometries[index % len(geometries)]}|mazowieckie|Warszawa|Warszawa|Obręb 0001|"
+            f"{index}|146501_8.0001.{index}" for index in range(features)]
+
+
+def geojson_features(features: int, vertices: int):
+    geometries = [{"type": "Polygon", "coordinates": [ring(index, vertices)]} for index in range(min(features, 100))]
+    return [{
+        "type": "Feature",
+        "id": index,
+        "geometry": geometries[index % len(geometries)],
+        "properties": {"nazwa": f"obiekt {index}", "numer": index, "powierzchnia": index * 1.5}
+    } for index in range(features)]
+
+
+# --- Przypadki -----------------------------------------------------------------------------------------------------
+
+@case("uldk_response_to_qgs_feature[resultcollector]")
+def resultcollector_uldk_response(features, vertices):
+    from gissupport_plugin.modules.uldk.uldk.resultcollector import ResultCollector
+    rows = uldk_rows(features, vertices)
+    return lambda: [ResultCollector.uldk_response_to_qgs_feature(row) for row in rows]
+
+
+@case("uldk_response_to_qgs_feature[layer_import]")
+def layer_import_uldk_response(features, vertices):
+    from gissupport_plugin.modules.uldk.modules.layer_import.worker import uldk_response_to_qgs_feature
+    rows = uldk_rows(features, vertices)
+    return lambda: [uldk_response_to_qgs_feature(row) for row in rows]
+
+
+@case("uldk_response_to_qgs_feature[point_layer_import]")
+def point_layer_import_uldk_response(features, vertices):
+    from gissupport_plugin.modules.uldk.modules.point_layer_import.worker import uldk_response_to_qgs_feature
+    rows = uldk_rows(features, vertices)
+    return lambda: [uldk_response_to_qgs_feature(row) for row in rows]
+
+
+@case("geojson2geom")
+def gisbox_geojson2geom(features, vertices):
+    from gissupport_plugin.modules.gis_box.layers.geojson import geojson2geom
+    geometries = [feature["geometry"] for feature in geojson_features(features, vertices)]
+    return lambda: [geojson2geom(geometry) for geometry in geometries]
+
+
+@case("GisboxFeatureLayer.geojson2features")
+def gisbox_geojson2features(features, vertices):
+    from gissupport_plugin.modules.gis_box.layers.gisbox_datasource import GisboxFeatureLayer
+    layer = QgsVectorLayer("Polygon?crs=EPSG:2180&field=id:integer&field=nazwa:string&field=numer:integer"
+                           "&field=powierzchnia:double", "benchmark", "memory")
+    # Minimalny stan obiektu warstwy GIS.Box potrzebny metodzie (bez połączenia z serwerem)
+    feature_layer = SimpleNamespace(
+        layers=[layer],
+        valid_fields=["id", "nazwa", "numer", "powierzchnia"],
+        datasource=SimpleNamespace(
+            attributes_schema={"attributes": [{"name": name} for name in ("id", "geom", "nazwa", "numer", "powierzchnia")]},
+            geom_column_name="geom",
+            id_column_name="id"
+        )
+    )
+    data = geojson_features(features, vertices)
+    return lambda: GisboxFeatureLayer.geojson2features(feature_layer, data)
+
+
+@case("LoadLayerToQgisTask.run")
+def usemaps_load_layer(features, vertices):
+    from gissupport_plugin.tools.usemaps_lite.layers import Layers
+    data = {"type": "FeatureCollection", "features": geojson_features(features, vertices)}
+    # Odpowiedź API podawana z pamięci - mierzona jest wyłącznie budowa obiektów
+    parent = SimpleNamespace(api=SimpleNamespace(simple_get=lambda endpoint: {"data": data}))
+
+    def run():
+        layer = QgsVectorLayer("Polygon?crs=EPSG:2180", "benchmark", "memory")
+        task = Layers.LoadLayerToQgisTask("benchmark", "00000000-0000-0000-0000-000000000000", layer, parent)
+        if not task.run():
+            raise RuntimeError(task.error_msg)
+    return run
+
+
+@case("PRGDownloadTask.response_as_features")
+def prg_response_as_features(features, vertices):
+    from gissupport_plugin.modules.data_downloader.prg.utils import PRGDownloadTask
+    content = "0\n" + "".join(f"SRID=2180;{polygon_wkt(index % 100, vertices)}|gmina {index}|{index:07d}\n"
+                              for index in range(features))
+    return lambda: PRGDownloadTask.response_as_features(content)
+
+
+# --- Pomiar --------------------------------------------------------------------------------------------------------
+
+def measure(func, features: int, rounds: int) -> dict:
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = func()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        "time_per_feature_us_min": round(min(timings) / features * 1e6, 3),
+        "time_per_feature_us_median": round(statistics.median(timings) / features * 1e6, 3),
+        "allocated_per_feature_b": round((after - before) / features, 1),
+        "peak_per_feature_b": round((peak - before) / features, 1),
+    }
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    """Wypisuje zmiany względem zapisanych wyników; zwraca False, jeśli czas wzrósł o więcej niż `threshold` %"""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    passed = True
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]["time_per_feature_us_min"]
+        new = result["time_per_feature_us_min"]
+        change = (new - old) / old * 100 if old else 0.0
+        regression = change > threshold
+        passed = passed and not regression
+        print(f"{'REGRESJA ' if regression else ''}{key}: {old} -> {new} us/obiekt ({change:+.1f}%)")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="pattern", default="*", help="wzorzec nazw przypadków (fnmatch, np. 'uldk*')")
+    parser.add_argument("--features", type=int, nargs="+", default=[10000], help="liczby obiektów")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[50, 500, 5000], help="liczby wierzchołków")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--save", help="zapis wyników do pliku JSON")
+    parser.add_argument("--compare", help="plik JSON z wynikami odniesienia")
+    parser.add_argument("--threshold", type=float, default=10.0, help="dopuszczalny wzrost czasu [%%]")
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    pattern = args.pattern if any(char in args.pattern for char in "*?[") else f"*{args.pattern}*"
+    results = {}
+    for name, factory in CASES.items():
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        for features in args.features:
+            for vertices in args.vertices:
+                key = f"{name}[features={features},vertices={vertices}]"
+                result = measure(factory(features, vertices), features, args.rounds)
+                results[key] = result
+                print(f"{key}: " + ", ".join(f"{k}={v}" for k, v in result.items()), flush=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"parameters": vars(args), "results": results}, file, indent=2)
+
+    passed = compare(results, args.compare, args.threshold) if args.compare else True
+    qgs.exitQgis()
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
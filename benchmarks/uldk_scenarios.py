@@ -0,0 +1,228 @@
+"""
+Testy wydajności importu działek z ULDK uruchamiane bez interfejsu QGIS (pyqgis).
+
+Skrypt uruchamia lokalny zastępnik ULDK (uldk_stub_server.py) w osobnym procesie, przekierowuje do niego
+wtyczkę (ULDKSearch.gugik_url) i wykonuje scenariusze:
+    csv   - wyszukiwanie działek po identyfikatorach (ULDKSearchWorker + ResultCollector), jak import z CSV,
+    point - import działek dla warstwy punktowej (PointLayerImportWorker),
+    layer - import działek dla warstwy liniowej (LayerImportWorker).
+Dla każdego scenariusza raportowane są: zapytania/s, działki/s, czas CPU i maksymalne zużycie pamięci (RSS).
+Maksymalny RSS mierzony jest osobno dla każdego scenariusza (Linux - VmHWM zerowany przed scenariuszem);
+gdzie nie jest to możliwe, wynik obejmuje cały proces (peak_rss_scope: process).
+
+Przykład (z katalogu głównego repozytorium, w środowisku z pyqgis):
+    python benchmarks/uldk_scenarios.py --scenario csv point --count 500 --latency 50 --json wyniki.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from qgis.core import (QgsApplication, QgsFeature, QgsGeometry, QgsPointXY,  # noqa: E402
+                       QgsVectorLayer)
+
+from uldk_stub_server import GRID_ORIGIN_X, GRID_ORIGIN_Y, PARCEL_SIZE  # noqa: E402
+
+SCENARIOS = ("csv", "point", "layer")
+
+
+def start_stub(args) -> subprocess.Popen:
+    command = [sys.executable, os.path.join(BENCHMARKS_DIR, "uldk_stub_server.py"),
+               "--port", str(args.port), "--latency", str(args.latency), "--jitter", str(args.jitter),
+               "--error-rate", str(args.error_rate), "--rate-limit", str(args.server_rate_limit),
+               "--vertices", str(args.vertices)]
+    if args.replay:
+        command += ["--replay", args.replay]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{args.port}/service.php"
+    for _ in range(50):
+        try:
+            urlopen(f"{url}?obiekt=wojewodztwo", timeout=1).read()
+            return process
+        except URLError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Nie udało się uruchomić zastępnika ULDK")
+
+
+def grid_point(index: int) -> QgsPointXY:
+    """Środek kolejnej komórki siatki działek zastępnika (co druga komórka - bez sąsiadów)"""
+    column, row = (index * 2) % 400, (index * 2) // 400
+    return QgsPointXY(GRID_ORIGIN_X + (column + 0.5) * PARCEL_SIZE, GRID_ORIGIN_Y + (row + 0.5) * PARCEL_SIZE)
+
+
+def point_layer(count: int) -> QgsVectorLayer:
+    layer = QgsVectorLayer("Point?crs=EPSG:2180", "benchmark_points", "memory")
+    features = []
+    for index in range(count):
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPointXY(grid_point(index)))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def line_layer(count: int) -> QgsVectorLayer:
+    """Linie przecinające trzy sąsiednie działki"""
+    layer = QgsVectorLayer("LineString?crs=EPSG:2180", "benchmark_lines", "memory")
+    features = []
+    for index in range(count):
+        start = grid_point(index * 3)
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPolylineXY([start, QgsPointXY(start.x() + 2.5 * PARCEL_SIZE, start.y())]))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def run_csv(count: int) -> int:
+    from gissupport_plugin.modules.uldk.uldk.api import ULDKSearchLogger, ULDKSearchParcel, ULDKSearchWorker
+    from gissupport_plugin.modules.uldk.uldk.resultcollector import ResultCollector
+
+    layer = ResultCollector.default_layer_factory(name="benchmark_csv")
+    features = []
+
+    def handle_found(uldk_response_dict):
+        for rows in uldk_response_dict.values():
+            for row in rows:
+                features.append(ResultCollector.uldk_response_to_qgs_feature(row))
+
+    teryts = {index: {"teryt": f"146501_8.{index % 200 + 1:04d}.{index + 1}"} for index in range(count)}
+    uldk_search = ULDKSearchLogger(ULDKSearchParcel(
+        "dzialka", ("geom_wkt", "wojewodztwo", "powiat", "gmina", "obreb", "numer", "teryt")))
+    worker = ULDKSearchWorker(uldk_search, teryts)
+    worker.found.connect(handle_found)
+    worker.search()
+    layer.dataProvider().addFeatures(features)
+    return len(features)
+
+
+def run_point(count: int) -> int:
+    from gissupport_plugin.modules.uldk.modules.point_layer_import.worker import PointLayerImportWorker
+
+    worker = PointLayerImportWorker(point_layer(count), False, "benchmark_point")
+    worker.search()
+    return worker.layer_found.featureCount()
+
+
+def run_layer(count: int) -> int:
+    from gissupport_plugin.modules.uldk.modules.layer_import.worker import LayerImportWorker
+
+    worker = LayerImportWorker(line_layer(max(1, count // 3)), False, "benchmark_layer")
+    worker.search()
+    return worker.layer_found.featureCount()
+
+
+def reset_peak_rss() -> bool:
+    """
+    Zeruje licznik maksymalnego RSS procesu (VmHWM, Linux), aby pomiar dotyczył tylko kolejnego scenariusza.
+    False, jeśli nie jest to możliwe - wtedy maksimum obejmuje cały proces od uruchomienia.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss: kB w Linuksie, bajty w macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(name: str, count: int) -> dict:
+    from gissupport_plugin.modules.uldk.uldk.metrics import ULDK_METRICS
+
+    ULDK_METRICS.reset()
+    peak_rss_per_scenario = reset_peak_rss()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    parcels = globals()[f"run_{name}"](count)
+    cpu_time = time.process_time() - cpu_start
+    wall_time = time.perf_counter() - wall_start
+
+    request_types = ULDK_METRICS.as_dict()["request_types"].values()
+    requests = sum(metrics["requests"] for metrics in request_types)
+    return {
+        "scenario": name,
+        "requests": requests,
+        "parcels": parcels,
+        "wall_s": round(wall_time, 3),
+        "cpu_s": round(cpu_time, 3),
+        "requests_per_s": round(requests / wall_time, 2) if wall_time else 0.0,
+        "parcels_per_s": round(parcels / wall_time, 2) if wall_time else 0.0,
+        "rate_limit_sleep_s": round(sum(metrics["rate_limit_sleep_s"] for metrics in request_types), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        # scenario - maksimum w trakcie scenariusza, process - maksimum narastające od uruchomienia skryptu
+        "peak_rss_scope": "scenario" if peak_rss_per_scenario else "process",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--count", type=int, default=200, help="liczba wyszukiwanych działek w scenariuszu")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="średni czas odpowiedzi zastępnika [ms]")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--server-rate-limit", type=int, default=0, help="limit zapytań/s po stronie zastępnika")
+    parser.add_argument("--vertices", type=int, default=50, help="liczba wierzchołków działki")
+    parser.add_argument("--replay", help="plik JSON Lines z nagranymi odpowiedziami ULDK")
+    parser.add_argument("--plugin-rate-limit", default="none",
+                        help="limit zapytań wtyczki jako 'zapytania/okres_s' (np. 5/3) lub 'none' - bez limitu")
+    parser.add_argument("--json", help="zapis wyników do pliku JSON")
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from gissupport_plugin.modules.uldk.uldk.api import ULDKSearch, ULDKSearchLogger, ULDK_RATE_LIMIT
+
+    ULDKSearch.gugik_url = f"http://127.0.0.1:{args.port}/service.php"
+    ULDKSearchLogger.log_requests = False
+    if args.plugin_rate_limit == "none":
+        ULDK_RATE_LIMIT.clamped_calls = sys.maxsize
+    else:
+        calls, period = args.plugin_rate_limit.split("/")
+        ULDK_RATE_LIMIT.clamped_calls = int(calls)
+        ULDK_RATE_LIMIT.period = float(period)
+
+    stub = start_stub(args)
+    results = []
+    try:
+        for name in args.scenario:
+            result = run_scenario(name, args.count)
+            results.append(result)
+            print(" | ".join(f"{key}: {value}" for key, value in result.items()), flush=True)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"parameters": vars(args), "results": results}, file, indent=2)
+
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
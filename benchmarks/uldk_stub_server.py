@@ -0,0 +1,218 @@
+"""
+Lokalny zastępnik usługi ULDK (uldk.gugik.gov.pl/service.php) do testów wydajności.
+
+Obsługuje zapytania GetParcelById, GetParcelByXY oraz listy jednostek administracyjnych (parametr teryt).
+Odpowiedzi są generowane syntetycznie (działki jako wielokąty o zadanej liczbie wierzchołków
+na regularnej siatce w EPSG:2180) lub odtwarzane z pliku JSON Lines z nagranymi odpowiedziami:
+    {"query": "request=GetParcelById&id=...", "body": "0\\nSRID=2180;POLYGON(...)|..."}
+
+Przykład:
+    python uldk_stub_server.py --port 8765 --latency 80 --jitter 20 --error-rate 0.01 --rate-limit 50
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Siatka syntetycznych działek (EPSG:2180)
+PARCEL_SIZE = 50.0
+GRID_ORIGIN_X = 450000.0
+GRID_ORIGIN_Y = 450000.0
+GRID_COLUMNS = 10000
+
+
+class StubConfig:
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, not_found_rate=0.0,
+                 rate_limit=0, vertices=50, recorded=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.rate_limit = rate_limit
+        self.vertices = max(4, vertices)
+        self.recorded = recorded or {}
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+        self.requests = 0
+        self.rejected = 0
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._lock = threading.Lock()
+
+    def uniform(self):
+        with self.random_lock:
+            return self.random.random()
+
+    def allow_request(self) -> bool:
+        """Limit zapytań na sekundę (0 - bez limitu), liczony w oknach jednosekundowych"""
+        with self._lock:
+            self.requests += 1
+            if not self.rate_limit:
+                return True
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_requests = 0
+            self._window_requests += 1
+            if self._window_requests > self.rate_limit:
+                self.rejected += 1
+                return False
+            return True
+
+
+def parcel_polygon_wkt(column: int, row: int, vertices: int) -> str:
+    """Działka jako wielokąt wpisany w komórkę siatki, o `vertices` wierzchołkach na obwodzie"""
+    min_x = GRID_ORIGIN_X + column * PARCEL_SIZE
+    min_y = GRID_ORIGIN_Y + row * PARCEL_SIZE
+    per_side = max(1, vertices // 4)
+    points = []
+    for side in range(4):
+        for step in range(per_side):
+            t = step / per_side * PARCEL_SIZE
+            if side == 0:
+                points.append((min_x + t, min_y))
+            elif side == 1:
+                points.append((min_x + PARCEL_SIZE, min_y + t))
+            elif side == 2:
+                points.append((min_x + PARCEL_SIZE - t, min_y + PARCEL_SIZE))
+            else:
+                points.append((min_x, min_y + PARCEL_SIZE - t))
+    points.append(points[0])
+    coordinates = ",".join(f"{x:.2f} {y:.2f}" for x, y in points)
+    return f"SRID=2180;POLYGON(({coordinates}))"
+
+
+def parcel_row(column: int, row: int, vertices: int) -> str:
+    precinct = f"{row % 9999 + 1:04d}"
+    teryt = f"146501_8.{precinct}.{column + 1}"
+    wkt = parcel_polygon_wkt(column, row, vertices)
+    return f"{wkt}|mazowieckie|Warszawa|Warszawa|Obręb {precinct}|{column + 1}|{teryt}"
+
+
+def cell_for_teryt(teryt: str):
+    digest = int(hashlib.md5(teryt.encode()).hexdigest()[:8], 16)
+    return digest % GRID_COLUMNS, (digest // GRID_COLUMNS) % GRID_COLUMNS
+
+
+def synthetic_body(params: dict, config: StubConfig) -> str:
+    request = params.get("request", "")
+    if config.not_found_rate and config.uniform() < config.not_found_rate:
+        return "-1 brak wyników\n"
+
+    if request == "GetParcelByXY":
+        x, y = [float(value) for value in params.get("xy", "0,0").split(",")[:2]]
+        column = int(math.floor((x - GRID_ORIGIN_X) / PARCEL_SIZE))
+        row = int(math.floor((y - GRID_ORIGIN_Y) / PARCEL_SIZE))
+        if column < 0 or row < 0:
+            return "-1 brak wyników\n"
+        return "0\n" + parcel_row(column, row, config.vertices) + "\n"
+
+    if request == "GetParcelById":
+        column, row = cell_for_teryt(params.get("id", ""))
+        return "0\n" + parcel_row(column, row, config.vertices) + "\n"
+
+    # Listy jednostek administracyjnych: obiekt=wojewodztwo|powiat|gmina|obreb, teryt=kod nadrzędny
+    level = params.get("obiekt", "")
+    parent = params.get("teryt", "")
+    rows = []
+    for number in range(1, 21):
+        if level == "wojewodztwo":
+            rows.append(f"województwo {number}|{number * 2:02d}")
+        elif level == "powiat":
+            rows.append(f"powiat {number}|{parent}{number:02d}")
+        elif level == "gmina":
+            rows.append(f"gmina {number}|{parent}{number:02d}_1")
+        else:
+            rows.append(f"obręb {number}|{parent}.{number:04d}")
+    return "0\n" + "\n".join(rows) + "\n"
+
+
+def create_handler(config: StubConfig):
+
+    class ULDKStubHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if config.latency_ms or config.jitter_ms:
+                delay = config.latency_ms + (config.uniform() * 2 - 1) * config.jitter_ms
+                time.sleep(max(0.0, delay) / 1000)
+
+            if not config.allow_request():
+                return self.respond(429, "Too Many Requests")
+            if config.error_rate and config.uniform() < config.error_rate:
+                return self.respond(503, "Service Unavailable")
+
+            query = urlparse(self.path).query
+            body = config.recorded.get(query)
+            if body is None:
+                params = {key: values[0] for key, values in parse_qs(query).items()}
+                body = synthetic_body(params, config)
+            self.respond(200, body)
+
+        def respond(self, status, body):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ULDKStubHandler
+
+
+def load_recorded(path: str) -> dict:
+    recorded = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                recorded[entry["query"]] = entry["body"]
+    return recorded
+
+
+def start_server(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Uruchamia serwer w wątku w tle; adres usługi: http://host:port/service.php"""
+    server = ThreadingHTTPServer((host, port), create_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="średni czas odpowiedzi [ms]")
+    parser.add_argument("--jitter", type=float, default=0.0, help="rozrzut czasu odpowiedzi [ms]")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="odsetek odpowiedzi HTTP 503")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="odsetek odpowiedzi '-1 brak wyników'")
+    parser.add_argument("--rate-limit", type=int, default=0, help="maks. liczba zapytań na sekundę (0 - bez limitu)")
+    parser.add_argument("--vertices", type=int, default=50, help="liczba wierzchołków syntetycznej działki")
+    parser.add_argument("--replay", help="plik JSON Lines z nagranymi odpowiedziami")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.not_found_rate, args.rate_limit,
+                        args.vertices, load_recorded(args.replay) if args.replay else None, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), create_handler(config))
+    server.daemon_threads = True
+    print(f"ULDK stub: http://{args.host}:{server.server_address[1]}/service.php", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
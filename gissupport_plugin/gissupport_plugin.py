@@ -34,6 +34,8 @@ from importlib import util
 from gissupport_plugin.modules.base import BaseModule
 from .resources import resources
 from .tools.gisbox_connection import GISBOX_CONNECTION
+from .tools.logger import LOG_BUFFER
+from .tools.transforms import TRANSFORM_CACHE
 
 PLUGIN_NAME = "Wtyczka GIS Support"
 
@@ -131,6 +133,9 @@ class GISSupportPlugin:
 
     def initGui(self):
 
+        LOG_BUFFER.start()
+        # Sygnały projektu podłączane są w wątku głównym, zanim transformacje zaczną pobierać zadania w tle
+        TRANSFORM_CACHE.connect_project()
         self.topMenu = self.iface.mainWindow().menuBar().addMenu(u'&GIS Support')
 
         #Load plugin modules
@@ -189,6 +194,9 @@ class GISSupportPlugin:
         self.toolbar.deleteLater()
         self.topMenu.clear()
         self.topMenu.deleteLater()
+        TRANSFORM_CACHE.disconnect_project()
+        TRANSFORM_CACHE.clear()
+        LOG_BUFFER.stop()
 
     def open_url(self, url):
         QDesktopServices.openUrl(QUrl(url))
\ No newline at end of file
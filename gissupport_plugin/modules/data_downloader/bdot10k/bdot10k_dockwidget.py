@@ -1,7 +1,8 @@
 import os
+from typing import List
 
 from qgis.PyQt import QtWidgets, uic
-from qgis.PyQt.QtCore import pyqtSignal
+from qgis.PyQt.QtCore import pyqtSignal, Qt
 from qgis._core import QgsMapLayerProxyModel
 
 from gissupport_plugin.tools.widgets.gs_select_area import GsSelectArea
@@ -23,6 +24,49 @@ class BDOT10kDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
 
         self.setWindowTitle("BDOT10k - Baza Danych Obiektów Topograficznych")
 
+        # Stan pobierania powiatów w trybie wielu powiatów (zachowywany przy zmianie województwa)
+        self.batchStatuses = {}
+        self.batchProgressBar.setVisible(False)
+
+    def fillPowiatList(self, powiaty: List[str], selected: set):
+        """Lista powiatów do zaznaczenia w trybie wielu powiatów"""
+        self.powListWidget.blockSignals(True)
+        self.powListWidget.clear()
+        for powiat in powiaty:
+            teryt_pow = powiat.split("|")[1].strip()
+            item = QtWidgets.QListWidgetItem()
+            item.setData(Qt.ItemDataRole.UserRole, teryt_pow)
+            item.setData(Qt.ItemDataRole.UserRole + 1, powiat)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if teryt_pow in selected else Qt.CheckState.Unchecked)
+            self.updatePowiatItemText(item)
+            self.powListWidget.addItem(item)
+        self.powListWidget.blockSignals(False)
+
+    def updatePowiatItemText(self, item: QtWidgets.QListWidgetItem):
+        text = item.data(Qt.ItemDataRole.UserRole + 1)
+        status = self.batchStatuses.get(item.data(Qt.ItemDataRole.UserRole))
+        item.setText(f"{text} - {status}" if status else text)
+
+    def setBatchItemStatus(self, teryt_pow: str, status: str):
+        self.batchStatuses[teryt_pow] = status
+        self.powListWidget.blockSignals(True)
+        for row in range(self.powListWidget.count()):
+            item = self.powListWidget.item(row)
+            if item.data(Qt.ItemDataRole.UserRole) == teryt_pow:
+                self.updatePowiatItemText(item)
+        self.powListWidget.blockSignals(False)
+
+    def clearBatchStatuses(self):
+        self.batchStatuses = {}
+        self.powListWidget.blockSignals(True)
+        for row in range(self.powListWidget.count()):
+            self.updatePowiatItemText(self.powListWidget.item(row))
+        self.powListWidget.blockSignals(False)
+
+    def setBatchProgress(self, progress: float):
+        self.batchProgressBar.setValue(round(progress))
+
     def closeEvent(self, event):
         self.closingPlugin.emit()
         event.accept()
@@ -0,0 +1,143 @@
+import os
+import re
+import zipfile
+from typing import List, Tuple
+
+from osgeo import gdal
+from qgis.core import Qgis, QgsTask
+
+from gissupport_plugin.tools.logger import LOG_BUFFER
+
+CONVERSION_SETTINGS_KEY = "gissupport/bdot10k/convert_gpkg"
+
+# Liczba zadań konwersji uruchamianych równolegle (każde konwertuje część klas)
+CONVERSION_TASKS = 4
+
+CLASS_NAME = re.compile(r"(OT_[A-Z]{4}_[APL])", re.IGNORECASE)
+
+
+def output_directory(zip_path: str) -> str:
+    """Katalog z plikami GeoPackage klas BDOT10k dla pobranego archiwum ZIP"""
+    return f"{os.path.splitext(zip_path)[0]}_gpkg"
+
+
+def conversion_items(zip_path: str) -> List[Tuple[str, str, int]]:
+    """
+    Pliki GML archiwum do konwersji: (ścieżka GDAL /vsizip/ pliku GML, ścieżka GeoPackage klasy, rozmiar pliku GML).
+    Pomijane są klasy już przekonwertowane z tego samego (lub starszego) archiwum.
+    """
+    directory = output_directory(zip_path)
+    zip_modified = os.path.getmtime(zip_path)
+    items = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            member = info.filename
+            if not member.lower().endswith((".xml", ".gml")):
+                continue
+            match = CLASS_NAME.search(os.path.basename(member))
+            class_name = match.group(1).upper() if match else os.path.splitext(os.path.basename(member))[0]
+            gpkg_path = os.path.join(directory, f"{class_name}.gpkg")
+            if os.path.exists(gpkg_path) and os.path.getmtime(gpkg_path) >= zip_modified:
+                continue
+            items.append((f"/vsizip/{zip_path}/{member}", gpkg_path, info.file_size))
+    return items
+
+
+def convert_class(gml_path: str, gpkg_path: str) -> bool:
+    """
+    Konwersja jednego pliku GML do GeoPackage z indeksem przestrzennym. Plik czytany jest bezpośrednio
+    z archiwum (bez rozpakowywania na dysk), a typy atrybutów wykrywane są przez sterownik GML.
+    GeoPackage zapisywany jest do pliku tymczasowego - przerwana konwersja nie zostawia niepełnego pliku.
+    """
+    os.makedirs(os.path.dirname(gpkg_path), exist_ok=True)
+    part_path = f"{os.path.splitext(gpkg_path)[0]}.part.gpkg"
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    source = gdal.OpenEx(gml_path, gdal.OF_VECTOR, open_options=["DOWNLOAD_SCHEMA=NO"])
+    if source is None:
+        return False
+    options = gdal.VectorTranslateOptions(
+        format="GPKG",
+        layerCreationOptions=["SPATIAL_INDEX=YES"],
+        options=["-gt", "65536"]
+    )
+    output = gdal.VectorTranslate(part_path, source, options=options)
+    source = None
+    if output is None:
+        return False
+    output = None
+    os.replace(part_path, gpkg_path)
+    return True
+
+
+class BDOT10kConversionBatch(QgsTask):
+    """Konwersja części klas BDOT10k - jedno z zadań podrzędnych BDOT10kConversionTask"""
+
+    def __init__(self, description: str, items: List[Tuple[str, str]]):
+        super().__init__(description, QgsTask.Flag.CanCancel)
+        self.items = items
+        self.failed = []
+
+    def run(self):
+        total = len(self.items) or 1
+        for index, (gml_path, gpkg_path) in enumerate(self.items):
+            if self.isCanceled():
+                return False
+            if not convert_class(gml_path, gpkg_path):
+                self.failed.append(gml_path)
+            self.setProgress((index + 1) * 100 / total)
+        return True
+
+
+class BDOT10kConversionTask(QgsTask):
+    """
+    Konwersja pobranych archiwów BDOT10k (GML) do plików GeoPackage - po jednym dla każdej klasy, w katalogu
+    obok archiwum. Klasy konwertowane są równolegle w zadaniach podrzędnych, a klasy przekonwertowane
+    wcześniej nie są konwertowane ponownie.
+    """
+
+    message_group_name = "GIS Support - BDOT10k Baza Danych Obiektów Topograficznych"
+
+    def __init__(self, description: str, zip_paths: List[str]):
+        super().__init__(description, QgsTask.Flag.CanCancel)
+        self.zip_paths = zip_paths
+        self.converted = 0
+        self.failed = []
+
+        items = []
+        for zip_path in zip_paths:
+            try:
+                items.extend(conversion_items(zip_path))
+            except (OSError, zipfile.BadZipFile) as error:
+                self.failed.append(zip_path)
+                LOG_BUFFER.log(f"{zip_path} - błąd odczytu archiwum: {error}", self.message_group_name,
+                               Qgis.MessageLevel.Warning)
+
+        # Klasy przydzielane na przemian, od największych - równomierny podział pracy między zadania podrzędne
+        items = [item[:2] for item in sorted(items, key=lambda item: item[2], reverse=True)]
+        self.items = items
+        self.batches = []
+        workers = min(CONVERSION_TASKS, len(items))
+        for index in range(workers):
+            batch = BDOT10kConversionBatch(f"{description} ({index + 1}/{workers})", items[index::workers])
+            self.addSubTask(batch, [], QgsTask.SubTaskDependency.ParentDependsOnSubTask)
+            self.batches.append(batch)
+
+    def run(self):
+        return not self.isCanceled()
+
+    def finished(self, result: bool):
+        if not result:
+            return
+        for batch in self.batches:
+            for path in batch.failed:
+                LOG_BUFFER.log(f"{path} - błąd konwersji do GeoPackage", self.message_group_name,
+                               Qgis.MessageLevel.Warning)
+            self.failed.extend(batch.failed)
+        self.converted = len(self.items) - sum(len(batch.failed) for batch in self.batches)
+        for zip_path in self.zip_paths:
+            if zip_path in self.failed:
+                continue
+            LOG_BUFFER.log(f"{output_directory(zip_path)} - przekonwertowano do GeoPackage", self.message_group_name,
+                           Qgis.MessageLevel.Info)
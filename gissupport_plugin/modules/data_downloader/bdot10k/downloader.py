@@ -2,17 +2,21 @@ from typing import List, Union
 from os.path import expanduser
 
 from qgis._core import QgsCoordinateReferenceSystem
-from qgis.core import Qgis, QgsApplication, QgsVectorLayer, QgsProject, QgsMapLayerProxyModel, QgsGeometry, QgsWkbTypes, QgsMessageLog
+from qgis.core import Qgis, QgsApplication, QgsVectorLayer, QgsProject, QgsMapLayerProxyModel, QgsGeometry, QgsWkbTypes
 from qgis.gui import QgsMessageBarItem, QgsMapTool
 from qgis.utils import iface
-from qgis.PyQt.QtCore import Qt
-from qgis.PyQt.QtWidgets import QFileDialog, QPushButton
+from qgis.PyQt.QtCore import QSettings, Qt
+from qgis.PyQt.QtWidgets import QFileDialog, QListWidgetItem, QPushButton
 
 from gissupport_plugin.modules.data_downloader.bdot10k.bdot10k_dockwidget import BDOT10kDockWidget
+from gissupport_plugin.modules.data_downloader.bdot10k.conversion import BDOT10kConversionTask, \
+    CONVERSION_SETTINGS_KEY
 from gissupport_plugin.modules.data_downloader.bdot10k.utils import BDOT10kDownloadTask, DrawPolygon, \
-    get_databox_layers, BDOT10kDataBoxDownloadTask, convert_multi_polygon_to_polygon, transform_geometry_to_2180, \
+    BDOT10kBatchDownloadTask, get_databox_layers, BDOT10kDataBoxDownloadTask, convert_multi_polygon_to_polygon, transform_geometry_to_2180, \
     BDOT10kClassDownloadTask, DataboxResponseException, check_geoportal_connection, GeoportalResponseException
+from gissupport_plugin.modules.data_downloader.download_manager import DOWNLOAD_MANAGER, DownloadJob
 from gissupport_plugin.modules.gis_box.modules.auto_digitization.tools import SelectRectangleTool
+from gissupport_plugin.tools.logger import LOG_BUFFER
 from gissupport_plugin.tools.teryt import Wojewodztwa, POWIATY
 
 class BDOT10kDownloader:
@@ -23,6 +27,10 @@ class BDOT10kDownloader:
         self.teryt_woj = ""
         self.teryt_pow = ""
         self.bdot10k_class = ""
+        self.bdot10k_batch_task = None
+        self.bdot10k_batch_selection = set()
+        self.bdot10k_conversion_task = None
+        DOWNLOAD_MANAGER.set_restore_handler("bdot10k", self.convert_restored_bdot10k)
 
         self.bdot10k_dockwidget = None
         self.selected_geom = QgsGeometry()
@@ -45,6 +53,16 @@ class BDOT10kDownloader:
         self.bdot10k_dockwidget.downloadButton.setEnabled(False)
         self.bdot10k_dockwidget.filepathLine.textChanged.connect(lambda text: self.set_powiat_class_button_state(text, self.bdot10k_dockwidget.downloadButton))
 
+        self.bdot10k_dockwidget.batchCheckBox.toggled.connect(self.set_bdot10k_batch_mode)
+        self.bdot10k_dockwidget.powListWidget.itemChanged.connect(self.update_bdot10k_batch_selection)
+        self.bdot10k_dockwidget.selectAllButton.clicked.connect(lambda: self.set_bdot10k_pow_list_checked(True))
+        self.bdot10k_dockwidget.selectNoneButton.clicked.connect(lambda: self.set_bdot10k_pow_list_checked(False))
+        self.set_bdot10k_batch_mode(False)
+
+        self.bdot10k_dockwidget.convertCheckBox.setChecked(QSettings().value(CONVERSION_SETTINGS_KEY, False, type=bool))
+        self.bdot10k_dockwidget.convertCheckBox.toggled.connect(
+            lambda checked: QSettings().setValue(CONVERSION_SETTINGS_KEY, checked))
+
         self.bdot10k_dockwidget.selectAreaWidget.geometryCreated.connect(self.set_geometry_from_signal)
 
         self.bdot10k_dockwidget.selectAreaWidget.methodChanged.connect(self.on_select_method_changed)
@@ -136,6 +154,11 @@ class BDOT10kDownloader:
 
         self.bdot10k_dockwidget.powComboBox.blockSignals(False)
 
+        self.bdot10k_dockwidget.fillPowiatList(
+            POWIATY.get(Wojewodztwa(self.bdot10k_dockwidget.wojComboBox.currentText()), []) if self.bdot10k_dockwidget.wojComboBox.currentText() else [],
+            self.bdot10k_batch_selection
+        )
+
     def get_teryt_pow(self, *args) -> None:
         """
         Zapisuje teryt wybranego powiatu z comboboxa.
@@ -146,6 +169,10 @@ class BDOT10kDownloader:
         """
         Uruchamia pobieranie danych BDOT10k.
         """
+        if self.bdot10k_dockwidget.batchCheckBox.isChecked():
+            self.download_bdot10k_batch()
+            return
+
         self.teryt_woj = self.bdot10k_dockwidget.wojComboBox.currentText().split("|")[1].strip() if self.bdot10k_dockwidget.wojComboBox.currentText() else ""
         self.teryt_pow = self.bdot10k_dockwidget.powComboBox.currentText().split("|")[1].strip() if self.bdot10k_dockwidget.powComboBox.currentText() else ""
 
@@ -164,10 +191,133 @@ class BDOT10kDownloader:
         self.task.progress_updated.connect(self.update_bdok10k_download_progress)
         self.task.download_finished.connect(self.show_bdot10k_success_message)
         self.task.task_failed.connect(self.handle_task_error)
+        if self.bdot10k_dockwidget.convertCheckBox.isChecked():
+            full_filepath = self.task.full_filepath
+            self.task.taskCompleted.connect(lambda: self.convert_bdot10k([full_filepath]))
 
         QgsApplication.taskManager().addTask(self.task)
 
 
+### pobieranie dla wielu powiatów
+    def set_bdot10k_batch_mode(self, enabled: bool) -> None:
+        """
+        Przełącza wybór jednego powiatu (combobox) i wielu powiatów (lista z zaznaczeniem).
+        """
+        self.bdot10k_dockwidget.powComboBox.setVisible(not enabled)
+        self.bdot10k_dockwidget.powListWidget.setVisible(enabled)
+        self.bdot10k_dockwidget.selectAllButton.setVisible(enabled)
+        self.bdot10k_dockwidget.selectNoneButton.setVisible(enabled)
+
+    def update_bdot10k_batch_selection(self, item: QListWidgetItem) -> None:
+        """
+        Zapisuje zaznaczenie powiatu - zaznaczenie obejmuje powiaty ze wszystkich województw.
+        """
+        teryt_pow = item.data(Qt.ItemDataRole.UserRole)
+        if item.checkState() == Qt.CheckState.Checked:
+            self.bdot10k_batch_selection.add(teryt_pow)
+        else:
+            self.bdot10k_batch_selection.discard(teryt_pow)
+
+    def set_bdot10k_pow_list_checked(self, checked: bool) -> None:
+        """
+        Zaznacza wszystkie powiaty wybranego województwa albo usuwa całe zaznaczenie.
+        """
+        if not checked:
+            self.bdot10k_batch_selection.clear()
+        pow_list = self.bdot10k_dockwidget.powListWidget
+        for row in range(pow_list.count()):
+            pow_list.item(row).setCheckState(Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked)
+
+    def download_bdot10k_batch(self) -> None:
+        """
+        Uruchamia pobieranie danych BDOT10k dla zaznaczonych powiatów.
+        """
+        if not self.bdot10k_batch_selection:
+            iface.messageBar().pushMessage("Przed pobraniem należy zaznaczyć powiaty",
+                                           level=Qgis.MessageLevel.Warning)
+            return
+
+        if not self.bdot10k_dockwidget.filepathLine.text():
+            iface.messageBar().pushMessage("Przed pobraniem należy wybrać ścieżkę zapisu danych",
+                                           level=Qgis.MessageLevel.Warning)
+            return
+
+        if self.bdot10k_batch_task is not None:
+            iface.messageBar().pushMessage("Trwa pobieranie danych BDOT10k dla wielu powiatów",
+                                           level=Qgis.MessageLevel.Warning)
+            return
+
+        self.bdot10k_dockwidget.clearBatchStatuses()
+        self.bdot10k_dockwidget.setBatchProgress(0)
+        self.bdot10k_dockwidget.batchProgressBar.setVisible(True)
+
+        task = BDOT10kBatchDownloadTask(f"Pobieranie danych BDOT10k ({len(self.bdot10k_batch_selection)} powiatów)",
+                                        sorted(self.bdot10k_batch_selection),
+                                        self.bdot10k_dockwidget.filepathLine.text())
+        task.item_progress.connect(self.bdot10k_dockwidget.setBatchItemStatus)
+        task.progressChanged.connect(self.bdot10k_dockwidget.setBatchProgress)
+        task.taskCompleted.connect(self.show_bdot10k_batch_message)
+        if self.bdot10k_dockwidget.convertCheckBox.isChecked():
+            task.taskCompleted.connect(lambda: self.convert_bdot10k(task.paths))
+        task.taskCompleted.connect(self.finish_bdot10k_batch)
+        task.taskTerminated.connect(self.finish_bdot10k_batch)
+        self.bdot10k_batch_task = task
+
+        QgsApplication.taskManager().addTask(task)
+
+    def show_bdot10k_batch_message(self) -> None:
+        """
+        Wyświetla podsumowanie pobierania danych BDOT10k dla wielu powiatów.
+        """
+        task = self.bdot10k_batch_task
+        message = f"Pobrano dane BDOT10k: {task.downloaded}, bez zmian: {task.unchanged}"
+        if task.failed:
+            iface.messageBar().pushMessage("Wtyczka GIS Support",
+                                           f"{message}, błąd pobierania: {', '.join(task.failed)}",
+                                           level=Qgis.MessageLevel.Warning)
+        else:
+            iface.messageBar().pushMessage("Wtyczka GIS Support", message, level=Qgis.MessageLevel.Success)
+
+    def finish_bdot10k_batch(self) -> None:
+        self.bdot10k_batch_task = None
+        self.bdot10k_dockwidget.batchProgressBar.setVisible(False)
+
+### konwersja do GeoPackage
+    def convert_bdot10k(self, zip_paths: List[str]) -> None:
+        """
+        Uruchamia konwersję pobranych archiwów BDOT10k do plików GeoPackage (po jednym dla każdej klasy).
+        """
+        if not zip_paths:
+            return
+        task = BDOT10kConversionTask("Konwersja danych BDOT10k do GeoPackage", zip_paths)
+        if not task.items:
+            LOG_BUFFER.log("Dane BDOT10k są już przekonwertowane do GeoPackage", task.message_group_name,
+                           Qgis.MessageLevel.Info)
+            return
+        task.taskCompleted.connect(lambda: self.show_bdot10k_conversion_message(task))
+        # Referencja zapobiega usunięciu zadania przed jego zakończeniem
+        self.bdot10k_conversion_task = task
+        QgsApplication.taskManager().addTask(task)
+
+    def convert_restored_bdot10k(self, job: DownloadJob) -> None:
+        """
+        Konwersja archiwum BDOT10k pobranego po wznowieniu przerwanego pobierania z poprzedniej sesji.
+        """
+        if QSettings().value(CONVERSION_SETTINGS_KEY, False, type=bool):
+            self.convert_bdot10k([job.path])
+
+    def show_bdot10k_conversion_message(self, task: BDOT10kConversionTask) -> None:
+        """
+        Wyświetla podsumowanie konwersji danych BDOT10k do GeoPackage.
+        """
+        message = f"Przekonwertowano klasy BDOT10k do GeoPackage: {task.converted}"
+        if task.failed:
+            iface.messageBar().pushMessage("Wtyczka GIS Support",
+                                           f"{message}, błąd konwersji: {len(task.failed)} (szczegóły w logu)",
+                                           level=Qgis.MessageLevel.Warning)
+        else:
+            iface.messageBar().pushMessage("Wtyczka GIS Support", message, level=Qgis.MessageLevel.Success)
+
     def update_bdok10k_download_progress(self, value: int) -> None:
         """
         Aktualizuje pasek postępu pobierania danych BDOT10k.
@@ -210,7 +360,7 @@ class BDOT10kDownloader:
                 self.bdot10k_dockwidget.boundsDownloadButton.setEnabled(True)
 
             except (ValueError, TypeError, RuntimeError) as e:
-                QgsMessageLog.logMessage(f"Błąd przetwarzania geometrii: {e}", "Wtyczka GIS Support", Qgis.MessageLevel.Warning)
+                LOG_BUFFER.log(f"Błąd przetwarzania geometrii: {e}", "Wtyczka GIS Support", Qgis.MessageLevel.Warning)
                 self.selected_geom = None
                 self.bdot10k_dockwidget.boundsDownloadButton.setEnabled(False)
         else:
@@ -285,8 +435,7 @@ class BDOT10kDownloader:
         Wyświetla komunikat o błędzie pobierania danych BDOT10k z DataBox.
         """
         iface.messageBar().pushMessage("Wtyczka GIS Support",
-                    """Na wybranym obszarze nie znajdują się obiekty wybranej warstwy
-                    lub liczba obiektów na wybranym obszarze jest większa niż 100 000""", level=Qgis.MessageLevel.Warning)
+                    "Na wybranym obszarze nie znajdują się obiekty wybranej warstwy", level=Qgis.MessageLevel.Warning)
 
 ### POBIERANIE DLA KLASY
 
@@ -1,10 +1,14 @@
-from io import BytesIO
 import json
+from concurrent.futures import CancelledError
+from typing import List
 
 from qgis.PyQt.QtCore import pyqtSignal, Qt
-from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsWkbTypes, QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsProject, QgsGeometry
+from qgis.core import QgsTask, Qgis, QgsWkbTypes, QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsProject, QgsGeometry
+from gissupport_plugin.modules.data_downloader.databox_fetch import DataboxFetchException, DataboxTiledFetch
+from gissupport_plugin.modules.data_downloader.download_manager import DOWNLOAD_MANAGER, DownloadException
+from gissupport_plugin.tools.logger import LOG_BUFFER
 from gissupport_plugin.tools.requests import NetworkHandler
-from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
+from qgis.PyQt.QtNetwork import QNetworkReply
 from qgis.PyQt.QtGui import QColor
 from qgis.gui import QgsMapTool, QgsRubberBand
 from qgis.utils import iface
@@ -22,27 +26,22 @@ class BDOT10kDownloadTask(QgsTask):
         self.teryt_pow = teryt_pow
         self.filepath = filepath
         self.url = f"https://opendata.geoportal.gov.pl/bdot10k/schemat2021/{self.teryt_woj}/{self.teryt_pow}_GML.zip"
+        self.full_filepath = f"{self.filepath}/{self.teryt_pow}_GML.zip"
         super().__init__(description, QgsTask.Flag.CanCancel)
 
     def run(self) -> bool:
-        response = NetworkHandler().get(self.url, True)
-
-        if response.error() != QNetworkReply.NetworkError.NoError:
+        full_filepath = self.full_filepath
+        job = DOWNLOAD_MANAGER.enqueue(self.url, full_filepath, kind="bdot10k")
+        try:
+            job.wait(feedback=self, progress_callback=self.progress_updated.emit)
+        except CancelledError:
+            job.cancel()
+            return False
+        except DownloadException as error:
+            self.log_message(f"{full_filepath} - błąd pobierania: {error}", level=Qgis.MessageLevel.Warning)
             self.task_failed.emit("Błąd pobierania danych. Sprawdź swoje połączenie z Internetem oraz czy usługa Geoportal.gov.pl działa.")
             return False
 
-        total_size = int(response.header(QNetworkRequest.KnownHeaders.ContentLengthHeader)) or 0
-        data = BytesIO(response.readAll().data())
-        bytes_received = 0
-        full_filepath = f"{self.filepath}/{self.teryt_pow}_GML.zip"
-        with open(full_filepath, 'wb') as file:
-            for chunk in iter(lambda: data.read(1024), b''):
-                file.write(chunk)
-                bytes_received += len(chunk)
-                if total_size > 0:
-                    progress = (bytes_received / total_size) * 100
-                    self.progress_updated.emit(progress)
-
         self.log_message(f"{full_filepath} - pobrano", level=Qgis.MessageLevel.Info)
         self.download_finished.emit(True)
 
@@ -52,7 +51,74 @@ class BDOT10kDownloadTask(QgsTask):
         pass
 
     def log_message(self, message: str, level: Qgis.MessageLevel) -> None:
-        QgsMessageLog.logMessage(message, self.message_group_name, level)
+        LOG_BUFFER.log(message, self.message_group_name, level)
+
+class BDOT10kBatchDownloadTask(QgsTask):
+    """
+    Pobieranie danych BDOT10k dla wielu powiatów. Wszystkie pliki trafiają do kolejki DOWNLOAD_MANAGER
+    (pobierane są najwyżej `max_concurrent` naraz), a pliki pobrane wcześniej i niezmienione na serwerze
+    nie są pobierane ponownie. Stan każdego powiatu przekazywany jest sygnałem `item_progress`, a podsumowanie
+    (`downloaded`, `unchanged`, `failed`) i ścieżki pobranych plików (`paths`) dostępne są po zakończeniu zadania.
+    """
+
+    message_group_name = "GIS Support - BDOT10k Baza Danych Obiektów Topograficznych"
+    item_progress = pyqtSignal(str, str)
+
+    def __init__(self, description: str, teryt_pows: List[str], filepath: str):
+        self.teryt_pows = teryt_pows
+        self.filepath = filepath
+        self.statuses = {}
+        self.paths = []
+        self.downloaded = 0
+        self.unchanged = 0
+        self.failed = []
+        super().__init__(description, QgsTask.Flag.CanCancel)
+
+    def run(self) -> bool:
+        jobs = {}
+        for teryt_pow in self.teryt_pows:
+            url = f"https://opendata.geoportal.gov.pl/bdot10k/schemat2021/{teryt_pow[:2]}/{teryt_pow}_GML.zip"
+            jobs[teryt_pow] = DOWNLOAD_MANAGER.enqueue(url, f"{self.filepath}/{teryt_pow}_GML.zip", kind="bdot10k")
+
+        try:
+            for teryt_pow, job in jobs.items():
+                try:
+                    job.wait(feedback=self, progress_callback=lambda _: self.update_progress(jobs))
+                except DownloadException as error:
+                    self.failed.append(teryt_pow)
+                    self.set_status(teryt_pow, "błąd")
+                    self.log_message(f"{job.path} - błąd pobierania: {error}", level=Qgis.MessageLevel.Warning)
+                    continue
+                self.paths.append(job.path)
+                if job.not_modified:
+                    self.unchanged += 1
+                    self.set_status(teryt_pow, "bez zmian")
+                else:
+                    self.downloaded += 1
+                    self.set_status(teryt_pow, "pobrano")
+                    self.log_message(f"{job.path} - pobrano", level=Qgis.MessageLevel.Info)
+                self.update_progress(jobs)
+        except CancelledError:
+            for job in jobs.values():
+                job.cancel()
+            return False
+
+        return True
+
+    def update_progress(self, jobs: dict):
+        """Postęp całego zadania oraz postęp powiatów w trakcie pobierania (sygnał tylko przy zmianie wartości)"""
+        for teryt_pow, job in jobs.items():
+            if not job.done() and job.progress() > 0:
+                self.set_status(teryt_pow, f"{job.progress():.0f}%")
+        self.setProgress(sum(job.progress() for job in jobs.values()) / len(jobs))
+
+    def set_status(self, teryt_pow: str, status: str):
+        if self.statuses.get(teryt_pow) != status:
+            self.statuses[teryt_pow] = status
+            self.item_progress.emit(teryt_pow, status)
+
+    def log_message(self, message: str, level: Qgis.MessageLevel) -> None:
+        LOG_BUFFER.log(message, self.message_group_name, level)
 
 class BDOT10kDataBoxDownloadTask(QgsTask):
     download_finished = pyqtSignal(bool)
@@ -62,38 +128,38 @@ class BDOT10kDataBoxDownloadTask(QgsTask):
     def __init__(self, description: str, layer: str, geojson: QgsGeometry):
         super().__init__(description, QgsTask.Flag.CanCancel)
         self.layer = layer
+        self.geometry = QgsGeometry(geojson)
 
         #Zabezpieczenie przed pustą geometrią
-        try:
-            json_str = geojson.asJson()
-            if json_str == 'null' or json_str is None:
-                # Jeśli asJson zwraca 'null', geometry jest puste/błędne
-                self.geojson = None
-            else:
-                self.geojson = json.loads(json_str)
-        except Exception:
-            self.geojson = None
-
-        if self.geojson is None:
-            QgsMessageLog.logMessage("Przekazano nieprawidłową geometrię do zadania pobierania!", "GIS Support", Qgis.MessageLevel.Warning)
+        if not self.has_valid_geometry():
+            LOG_BUFFER.log("Przekazano nieprawidłową geometrię do zadania pobierania!", "GIS Support", Qgis.MessageLevel.Warning)
             return
 
-        self.geojson["crs"] = {"type": "name", "properties": {"name": "EPSG:2180"}}
         self.url = f"https://api-oze.gisbox.pl/layers/{self.layer}?output_srid=2180&promote_to_multi=false"
 
+    def has_valid_geometry(self) -> bool:
+        return not self.geometry.isNull() and not self.geometry.isEmpty()
+
     def run(self) -> bool:
         # Sprawdzamy czy init przeszedł poprawnie
-        if not hasattr(self, 'geojson') or self.geojson is None:
+        if not self.has_valid_geometry():
             return False
 
-        handler = NetworkHandler()
-        response = handler.post(self.url, data=self.geojson, databox=True)
-        if details := response.get("details"):
-            self.downloaded_details.emit(f"Przekroczono limit danych ({details.get('limit')}) z Data.Box. Próbowano pobrać {details.get('count')} obiektów.")
+        # Obszar przekraczający limit obiektów Data.Box pobierany jest w częściach
+        fetch = DataboxTiledFetch(self.url, self.geometry, feedback=self, progress_callback=self.setProgress)
+        try:
+            features = fetch.fetch()
+        except CancelledError:
+            return False
+        except DataboxFetchException as error:
+            self.downloaded_details.emit(str(error))
             self.download_finished.emit(True)
             return False
 
-        self.downloaded_data.emit(response.get("data"))
+        if fetch.splits:
+            LOG_BUFFER.log(f"Pobrano {len(features)} obiektów z Data.Box w {fetch.requests} zapytaniach",
+                           "GIS Support", Qgis.MessageLevel.Info)
+        self.downloaded_data.emit(fetch.feature_collection(features))
         self.download_finished.emit(True)
         return True
 
@@ -109,27 +175,28 @@ class BDOT10kClassDownloadTask(QgsTask):
         super().__init__(description, QgsTask.Flag.CanCancel)
 
     def run(self) -> bool:
-        handler = NetworkHandler()
-        handler.downloadProgress.connect( lambda value: self.setProgress(value) )
-        response = handler.get(self.url, reply_only=True)
-        total_size = int(response.header(QNetworkRequest.KnownHeaders.ContentLengthHeader)) or 0
-        bytes_received = 0
         full_filepath = f"{self.filepath}/{self.bdot_class}.gpkg"
-        with open(full_filepath, 'wb') as file:
-            while (chunk:=response.read(1024)):
-                file.write(chunk)
-                bytes_received += len(chunk)
-                if total_size > 0:
-                    progress = (bytes_received / total_size) * 100
-                    self.progress_updated.emit(progress)
+        job = DOWNLOAD_MANAGER.enqueue(self.url, full_filepath)
+        try:
+            job.wait(feedback=self, progress_callback=self.update_download_progress)
+        except CancelledError:
+            job.cancel()
+            return False
+        except DownloadException as error:
+            self.log_message(f"{full_filepath} - błąd pobierania: {error}", level=Qgis.MessageLevel.Critical)
+            return False
 
         self.log_message(f"{full_filepath} - pobrano", level=Qgis.MessageLevel.Info)
         self.download_finished.emit(True)
 
         return True
 
+    def update_download_progress(self, progress: float):
+        self.setProgress(progress)
+        self.progress_updated.emit(progress)
+
     def log_message(self, message: str, level: Qgis.MessageLevel) -> None:
-        QgsMessageLog.logMessage(message, self.message_group_name, level)
+        LOG_BUFFER.log(message, self.message_group_name, level)
 
 def get_databox_layers():
     handler = NetworkHandler()
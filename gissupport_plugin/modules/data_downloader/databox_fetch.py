@@ -0,0 +1,179 @@
+import json
+import math
+from concurrent.futures import CancelledError
+from typing import Callable, List, Optional, Union
+
+from qgis.core import QgsFeedback, QgsGeometry, QgsRectangle, QgsTask, QgsWkbTypes
+from qgis.PyQt.QtCore import QUrl
+from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
+
+from gissupport_plugin.tools.http_client import HttpClient, HttpFuture, wait
+
+# Liczba zapytań o części obszaru wysyłanych jednocześnie
+DATABOX_CONCURRENCY = 4
+
+# Maksymalna liczba kolejnych podziałów obszaru (zabezpieczenie przed dzieleniem bez końca)
+DATABOX_MAX_DEPTH = 8
+
+
+class DataboxFetchException(Exception):
+    pass
+
+
+class DataboxTile:
+
+    def __init__(self, geometry: QgsGeometry, depth: int):
+        self.geometry = geometry
+        self.depth = depth
+
+    def payload(self) -> bytes:
+        geojson = json.loads(self.geometry.asJson())
+        geojson["crs"] = {"type": "name", "properties": {"name": "EPSG:2180"}}
+        return json.dumps(geojson).encode()
+
+    def split(self, count: int, limit: int) -> List['DataboxTile']:
+        """
+        Podział zasięgu części na siatkę k x k (k=2 jak w drzewie czwórkowym, więcej, jeśli serwer zgłosił
+        wielokrotne przekroczenie limitu) przyciętą do geometrii części. Puste przecięcia są pomijane, a przecięcia
+        wieloczęściowe (obszar wklęsły) rozbijane są na pojedyncze poligony - api-oze przyjmuje tylko poligon.
+        """
+        parts = max(2, math.ceil(math.sqrt(count / limit))) if limit > 0 else 2
+        extent = self.geometry.boundingBox()
+        width, height = extent.width() / parts, extent.height() / parts
+        tiles = []
+        for column in range(parts):
+            for row in range(parts):
+                x_min, y_min = extent.xMinimum() + column * width, extent.yMinimum() + row * height
+                cell = QgsGeometry.fromRect(QgsRectangle(x_min, y_min, x_min + width, y_min + height))
+                part = self.geometry.intersection(cell)
+                if part.type() != QgsWkbTypes.GeometryType.PolygonGeometry:
+                    part.convertGeometryCollectionToSubclass(QgsWkbTypes.GeometryType.PolygonGeometry)
+                if part.isEmpty() or part.type() != QgsWkbTypes.GeometryType.PolygonGeometry:
+                    continue
+                for polygon in part.asGeometryCollection():
+                    if not polygon.isEmpty():
+                        tiles.append(DataboxTile(polygon, self.depth + 1))
+        return tiles
+
+
+class DataboxTiledFetch:
+    """
+    Pobieranie obiektów z Data.Box dla obszaru przekraczającego limit liczby obiektów jednego zapytania.
+    Obszar (EPSG:2180) wysyłany jest najpierw w całości; część, dla której serwer zgłosi przekroczenie limitu
+    (`details.limit`/`count`), dzielona jest na mniejsze części pobierane równolegle. Obiekty leżące na
+    granicy części zwracane są dla każdej z nich - w wyniku zachowywany jest jeden, cały obiekt
+    (identyfikacja po `id` obiektu GeoJSON albo po jego pełnej treści).
+    """
+
+    def __init__(self, url: str, geometry: QgsGeometry,
+                 feedback: Union[QgsTask, QgsFeedback, None] = None,
+                 progress_callback: Optional[Callable[[float], None]] = None):
+        self.url = url
+        self.geometry = geometry
+        self.feedback = feedback
+        self.progress_callback = progress_callback
+        self.features = {}
+        self.crs = None
+        self.requests = 0
+        self.splits = 0
+
+    def fetch(self) -> List[dict]:
+        """Obiekty GeoJSON z całego obszaru; zgłasza DataboxFetchException lub CancelledError"""
+        client = HttpClient.instance()
+        total_area = self.geometry.area() or 1
+        done_area = 0.0
+        pending = [DataboxTile(self.geometry, 0)]
+        active = {}
+        try:
+            while pending or active:
+                while pending and len(active) < DATABOX_CONCURRENCY:
+                    tile = pending.pop(0)
+                    active[self.submit(client, tile)] = tile
+                wait(list(active), feedback=self.feedback, return_when_first=True)
+
+                for future in [future for future in active if future.done()]:
+                    tile = active.pop(future)
+                    split = self.handle_reply(tile, future)
+                    if split is None:
+                        done_area += tile.geometry.area()
+                    else:
+                        pending.extend(split)
+                if self.progress_callback is not None:
+                    self.progress_callback(min(100.0, done_area * 100 / total_area))
+        finally:
+            for future in active:
+                future.cancel()
+        return list(self.features.values())
+
+    def submit(self, client: HttpClient, tile: DataboxTile) -> HttpFuture:
+        request = QNetworkRequest(QUrl(self.url))
+        request.setHeader(QNetworkRequest.KnownHeaders.ContentTypeHeader, "application/json")
+        self.requests += 1
+        return client.submit(request, "POST", tile.payload())
+
+    def handle_reply(self, tile: DataboxTile, future: HttpFuture) -> Optional[List[DataboxTile]]:
+        """Zapisuje obiekty części albo zwraca jej podział, jeśli przekroczono limit"""
+        if future.cancelled():
+            raise CancelledError()
+        reply = future.pending.reply
+        body = bytes(reply.readAll())
+        status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        error = reply.error()
+        error_string = reply.errorString()
+        reply.deleteLater()
+
+        if error == QNetworkReply.NetworkError.NoError:
+            try:
+                collection = json.loads(body)
+            except ValueError:
+                collection = None
+            if not isinstance(collection, dict):
+                raise DataboxFetchException("Niepoprawna odpowiedź serwera Data.Box.")
+            self.crs = self.crs or collection.get("crs")
+            for feature in collection.get("features", []):
+                self.features.setdefault(self.feature_key(feature), feature)
+            return
+
+        details = self.limit_details(status_code, body)
+        if details is None and error == QNetworkReply.NetworkError.ContentAccessDenied:
+            # Część usług (np. adresy PRG) sygnalizuje przekroczenie limitu odmową dostępu, bez liczby obiektów -
+            # obszar dzielony jest wtedy na cztery części
+            if tile.depth >= DATABOX_MAX_DEPTH:
+                raise DataboxFetchException("Przekroczono limit danych. Zmniejsz wskazany obszar.")
+            details = {}
+        if details is None:
+            if error in (QNetworkReply.NetworkError.TimeoutError, QNetworkReply.NetworkError.OperationCanceledError,
+                         QNetworkReply.NetworkError.UnknownServerError):
+                raise DataboxFetchException("Przekroczono czas oczekiwania na odpowiedź serwera.")
+            raise DataboxFetchException(f"Błąd pobierania danych z Data.Box: {error_string}")
+        if tile.depth >= DATABOX_MAX_DEPTH:
+            raise DataboxFetchException(
+                f"Przekroczono limit danych ({details.get('limit')}) z Data.Box mimo podziału obszaru. "
+                f"Próbowano pobrać {details.get('count')} obiektów.")
+        self.splits += 1
+        return tile.split(int(details.get("count") or 0), int(details.get("limit") or 0))
+
+    def feature_collection(self, features: List[dict]) -> str:
+        """Połączone obiekty jako FeatureCollection (z układem współrzędnych z odpowiedzi serwera)"""
+        collection = {"type": "FeatureCollection", "features": features}
+        if self.crs:
+            collection["crs"] = self.crs
+        return json.dumps(collection)
+
+    @staticmethod
+    def limit_details(status_code: Optional[int], body: bytes) -> Optional[dict]:
+        """Szczegóły przekroczenia limitu obiektów z odpowiedzi 400 (None dla innych błędów)"""
+        if status_code != 400:
+            return
+        try:
+            detail = json.loads(body).get("detail")
+        except (ValueError, AttributeError):
+            return
+        if isinstance(detail, dict) and "limit" in detail:
+            return detail
+
+    @staticmethod
+    def feature_key(feature: dict) -> str:
+        if feature.get("id") is not None:
+            return str(feature["id"])
+        return json.dumps(feature, sort_keys=True)
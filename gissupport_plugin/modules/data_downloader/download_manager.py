@@ -0,0 +1,467 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError
+from typing import Callable, Optional, Union
+
+from qgis.core import Qgis, QgsApplication, QgsFeedback, QgsTask
+from qgis.PyQt.QtCore import QObject, QSettings, Qt, QUrl, pyqtSignal
+from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
+
+from gissupport_plugin.tools.http_client import HttpClient, HttpFuture, wait
+from gissupport_plugin.tools.logger import LOG_BUFFER
+
+DOWNLOADS_DB = os.path.join(QgsApplication.qgisSettingsDirPath(), "gissupport", "downloads.sqlite")
+
+CONCURRENCY_SETTINGS_KEY = "gissupport/downloads/max_concurrent"
+DEFAULT_CONCURRENCY = 3
+
+# ETag obiektów S3 (przesłanych w jednej części) to suma MD5 treści pliku
+MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+
+class DownloadException(Exception):
+    pass
+
+
+class DownloadJob:
+    """
+    Plik w kolejce DownloadManager. Zadania, które dodały plik do kolejki, czekają na jego pobranie przez wait()
+    (ten sam plik dodany przez kilka zadań pobierany jest raz). `not_modified` oznacza, że plik na dysku jest
+    aktualny (odpowiedź 304) i nie był pobierany ponownie. `kind` i `meta` pozwalają dokończyć obsługę pliku
+    wznowionego z poprzedniej sesji (DownloadManager.set_restore_handler).
+    """
+
+    def __init__(self, job_id: int, url: str, path: str, sha256: Optional[str] = None,
+                 kind: Optional[str] = None, meta=None, restored: bool = False):
+        self.id = job_id
+        self.url = url
+        self.path = path
+        self.sha256 = sha256.lower() if sha256 else None
+        self.kind = kind
+        self.meta = meta
+        self.restored = restored
+        self.bytes_received = 0
+        self.total = -1
+        self.error = None
+        self.not_modified = False
+        self.cancelled = False
+        self.waiters = 1
+        self.manager = None
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        """Rezygnacja jednego z oczekujących zadań - pobieranie jest przerywane, gdy zrezygnują wszystkie"""
+        if self.manager is None:
+            self.cancelled = True
+            return
+        with self.manager.lock:
+            self.waiters = max(0, self.waiters - 1)
+            if not self.waiters:
+                self.cancelled = True
+
+    def set_progress(self, bytes_received: int, total: int):
+        self.bytes_received = bytes_received
+        self.total = total
+
+    def progress(self) -> float:
+        if self.done():
+            return 100.0
+        if self.total <= 0:
+            return 0.0
+        return min(100.0, self.bytes_received * 100 / self.total)
+
+    def wait(self, feedback: Union[QgsTask, QgsFeedback, None] = None,
+             progress_callback: Optional[Callable[[float], None]] = None):
+        """
+        Czeka na pobranie pliku. Zgłasza CancelledError po anulowaniu (również zadania `feedback` - wtedy
+        oczekujący musi zrezygnować z pliku przez cancel()) oraz DownloadException po błędzie pobierania
+        lub weryfikacji pliku.
+        """
+        while not self._done.wait(0.1):
+            if feedback is not None and feedback.isCanceled():
+                raise CancelledError()
+            if progress_callback is not None:
+                progress_callback(self.progress())
+        if self.cancelled:
+            raise CancelledError()
+        if self.error:
+            raise DownloadException(self.error)
+        if progress_callback is not None:
+            progress_callback(100.0)
+
+    def finish(self, error: Optional[str] = None):
+        self.error = error
+        self._done.set()
+
+
+class DownloadManager(QObject):
+    """
+    Wspólna kolejka pobierania plików modułu danych do pobrania.
+
+    Pliki pobierane są w jednym zadaniu QGIS (DownloadQueueTask), najwyżej `max_concurrent` naraz, a postęp
+    zadania obejmuje wszystkie pliki w kolejce. Kolejka zapisywana jest w bazie SQLite - pliki, których pobieranie
+    przerwało zamknięcie QGIS, można wznowić przez restore() (pliki z trwałym błędem, np. 404 lub niezgodną
+    sumą kontrolną, usuwane są z kolejki). Pobieranie przerwane w trakcie wznawiane jest od końca
+    pliku .part (nagłówek Range), a plik pobrany wcześniej z tego samego adresu pobierany jest tylko wtedy,
+    gdy zmienił się na serwerze (nagłówki If-None-Match/If-Modified-Since). Po pobraniu sprawdzany jest rozmiar
+    pliku oraz jego suma SHA-256 (jeśli została podana) lub MD5 zgodna z ETag serwera S3.
+    """
+
+    job_queued = pyqtSignal()
+    restored_finished = pyqtSignal(object)
+
+    def __init__(self, path: str = DOWNLOADS_DB):
+        super().__init__()
+        self.path = path
+        self.max_concurrent = max(1, QSettings().value(CONCURRENCY_SETTINGS_KEY, DEFAULT_CONCURRENCY, type=int))
+        self.task = None
+        self._queue = deque()
+        self._batch = []
+        self._jobs = {}
+        self._restore_handlers = {}
+        self._worker_running = False
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        # Zadanie kolejki uruchamiane jest zawsze w wątku głównym, również gdy plik dodał wątek zadania
+        self.job_queued.connect(self.start_worker, Qt.ConnectionType.QueuedConnection)
+        self.restored_finished.connect(self.handle_restored, Qt.ConnectionType.QueuedConnection)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=10)
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    sha256 TEXT,
+                    kind TEXT,
+                    meta TEXT
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    downloaded REAL NOT NULL
+                );
+            """)
+            # Kolumny dodane po utworzeniu pierwszej wersji bazy
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(jobs)")}
+            for column in ("kind", "meta"):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        return connection
+
+    def set_max_concurrent(self, max_concurrent: int):
+        self.max_concurrent = max(1, max_concurrent)
+        QSettings().setValue(CONCURRENCY_SETTINGS_KEY, self.max_concurrent)
+
+    def enqueue(self, url: str, path: str, sha256: Optional[str] = None, kind: Optional[str] = None,
+                meta=None) -> DownloadJob:
+        """
+        Dodaje plik do kolejki (może być wywołane z dowolnego wątku). Jeśli ten sam plik jest już w kolejce lub
+        w trakcie pobierania, zwracane jest istniejące zadanie - dwa pobierania nie zapisują jednego pliku .part.
+        """
+        with self.lock:
+            job = self._jobs.get(path)
+            if job is not None and not job.done():
+                job.waiters += 1
+                job.cancelled = False
+                return job
+            with self.connection:
+                # Ponowne pobranie pliku zastępuje jego wcześniejszy wpis w kolejce
+                self.connection.execute("DELETE FROM jobs WHERE path = ?", (path,))
+                cursor = self.connection.execute(
+                    "INSERT INTO jobs (url, path, sha256, kind, meta) VALUES (?, ?, ?, ?, ?)",
+                    (url, path, sha256, kind, json.dumps(meta))
+                )
+            job = DownloadJob(cursor.lastrowid, url, path, sha256, kind, meta)
+            self._add(job)
+        return job
+
+    def interrupted_jobs(self) -> list:
+        """
+        Wpisy kolejki z poprzedniej sesji, których pobieranie można wznowić (istnieje plik .part).
+        Pozostałe wpisy (bez pobranej części pliku) są usuwane.
+        """
+        rows = self.connection.execute("SELECT id, url, path, sha256, kind, meta FROM jobs ORDER BY id").fetchall()
+        with self.lock:
+            queued = {job.id for job in self._jobs.values()}
+        rows = [row for row in rows if row[0] not in queued]
+        stale = [row for row in rows if not os.path.exists(f"{row[2]}.part")]
+        with self.connection:
+            self.connection.executemany("DELETE FROM jobs WHERE id = ?", [(row[0],) for row in stale])
+        return [row for row in rows if row not in stale]
+
+    def restore(self) -> int:
+        """Wznawia pobieranie plików przerwane w poprzedniej sesji; zwraca ich liczbę"""
+        rows = self.interrupted_jobs()
+        with self.lock:
+            rows = [row for row in rows if row[2] not in self._jobs]
+            for job_id, url, path, sha256, kind, meta in rows:
+                job = DownloadJob(job_id, url, path, sha256, kind, json.loads(meta) if meta else None, restored=True)
+                # Pliku wznowionego nie oczekuje żadne zadanie
+                job.waiters = 0
+                self._add(job)
+        return len(rows)
+
+    def discard_interrupted(self):
+        """Usuwa z kolejki pliki przerwane w poprzedniej sesji razem z ich plikami .part"""
+        for job_id, _, path, *_ in self.interrupted_jobs():
+            try:
+                os.remove(f"{path}.part")
+            except OSError:
+                pass
+            with self.connection:
+                self.connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def set_restore_handler(self, kind: str, handler: Callable[[DownloadJob], None]):
+        """Funkcja wywoływana w wątku głównym po pobraniu wznowionego pliku rodzaju `kind`"""
+        self._restore_handlers[kind] = handler
+
+    def handle_restored(self, job: DownloadJob):
+        handler = self._restore_handlers.get(job.kind)
+        if handler is not None:
+            handler(job)
+
+    def _add(self, job: DownloadJob):
+        job.manager = self
+        with self.lock:
+            self._queue.append(job)
+            self._batch.append(job)
+            self._jobs[job.path] = job
+        self.job_queued.emit()
+
+    def start_worker(self):
+        with self.lock:
+            if self._worker_running or not self._queue:
+                return
+            self._worker_running = True
+        self.task = DownloadQueueTask(self)
+        QgsApplication.taskManager().addTask(self.task)
+
+    def stop_worker(self, force: bool = False) -> bool:
+        """Kończy pracę zadania kolejki, o ile kolejka jest pusta (sprawdzane pod blokadą, żeby nie zgubić plików)"""
+        with self.lock:
+            if self._queue and not force:
+                return False
+            self._worker_running = False
+            self._batch = [job for job in self._queue]
+            return True
+
+    def next_job(self) -> Optional[DownloadJob]:
+        while True:
+            with self.lock:
+                if not self._queue:
+                    return
+                job = self._queue.popleft()
+                if not job.cancelled:
+                    return job
+                self.finish_job(job)
+
+    def cancel_job(self, job: DownloadJob) -> bool:
+        """
+        Kończy przerwane pobieranie pliku, o ile nadal nikt go nie oczekuje - plik ponownie dodany do kolejki
+        w trakcie przerywania wraca na jej początek. Zwraca True, jeśli pobieranie zostało zakończone.
+        """
+        with self.lock:
+            if not job.cancelled:
+                self._queue.appendleft(job)
+                return False
+            self.finish_job(job)
+            return True
+
+    def cancel_queued(self):
+        with self.lock:
+            jobs = list(self._queue)
+            self._queue.clear()
+        for job in jobs:
+            job.cancelled = True
+            self.finish_job(job)
+
+    def finish_job(self, job: DownloadJob, error: Optional[str] = None, resumable: bool = False):
+        """
+        Zakończenie pobierania pliku. Wpis w kolejce pozostaje tylko po przejściowym błędzie (`resumable`),
+        gdy plik .part może zostać wznowiony - pliki z trwałym błędem lub anulowane są z niej usuwane.
+        """
+        with self.lock:
+            if self._jobs.get(job.path) is job:
+                del self._jobs[job.path]
+        if error is None or not resumable:
+            with self.connection:
+                self.connection.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+        job.finish(error)
+
+    def progress(self) -> float:
+        """Łączny postęp wszystkich plików bieżącej kolejki [%]"""
+        with self.lock:
+            batch = list(self._batch)
+        if not batch:
+            return 100.0
+        return sum(job.progress() for job in batch) / len(batch)
+
+    def conditional_headers(self, job: DownloadJob) -> dict:
+        """Nagłówki pobrania warunkowego dla pliku pobranego wcześniej z tego samego adresu i niezmienionego na dysku"""
+        row = self.connection.execute("SELECT url, etag, last_modified, size FROM files WHERE path = ?",
+                                      (job.path,)).fetchone()
+        if not row or row[0] != job.url or not os.path.exists(job.path) or os.path.getsize(job.path) != row[3]:
+            return {}
+        headers = {}
+        if row[1]:
+            headers[b"If-None-Match"] = row[1].encode()
+        if row[2]:
+            headers[b"If-Modified-Since"] = row[2].encode()
+        return headers
+
+    def verify(self, job: DownloadJob, reply: QNetworkReply) -> Optional[str]:
+        """Sprawdzenie rozmiaru i sumy kontrolnej pobranego pliku; zwraca opis błędu albo None"""
+        size = os.path.getsize(job.path)
+        expected_size = self.expected_size(reply)
+        sha256, md5 = file_digests(job.path)
+        etag = bytes(reply.rawHeader(b"ETag")).decode(errors="ignore") or None
+        # ETag jest sumą MD5 treści tylko dla plików z S3 (wysłanych jednym zapytaniem) - inne serwery
+        # mogą zwracać ETag o tej samej postaci, który sumą kontrolną nie jest
+        md5_etag = MD5_ETAG.match(etag or "") if self.is_s3_reply(reply) else None
+
+        error = None
+        if expected_size is not None and size != expected_size:
+            error = f"niezgodny rozmiar pliku ({size} z {expected_size} B)"
+        elif job.sha256 and sha256 != job.sha256:
+            error = "niezgodna suma kontrolna SHA-256"
+        elif md5_etag and md5 != md5_etag.group(1):
+            error = "suma kontrolna MD5 niezgodna z ETag"
+        if error:
+            os.remove(job.path)
+            return error
+
+        last_modified = bytes(reply.rawHeader(b"Last-Modified")).decode(errors="ignore") or None
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, url, etag, last_modified, size, sha256, downloaded) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.path, job.url, etag, last_modified, size, sha256, time.time())
+            )
+
+    @staticmethod
+    def is_s3_reply(reply: QNetworkReply) -> bool:
+        """
+        Odpowiedź serwera zgodnego z S3 (nagłówki x-amz-*), której ETag jest sumą MD5 - z wyjątkiem obiektów
+        szyfrowanych kluczem KMS
+        """
+        if not any(bytes(name).lower().startswith(b"x-amz-") for name in reply.rawHeaderList()):
+            return False
+        encryption = bytes(reply.rawHeader(b"x-amz-server-side-encryption")).decode(errors="ignore")
+        return not encryption.startswith("aws:kms")
+
+    @staticmethod
+    def expected_size(reply: QNetworkReply) -> Optional[int]:
+        """Rozmiar całego pliku według nagłówków Content-Range (odpowiedź 206) lub Content-Length"""
+        content_range = bytes(reply.rawHeader(b"Content-Range")).decode(errors="ignore")
+        if "/" in content_range and not content_range.endswith("/*"):
+            return int(content_range.rsplit("/", 1)[1])
+        if reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute) == 200:
+            length = reply.header(QNetworkRequest.KnownHeaders.ContentLengthHeader)
+            return int(length) if length is not None else None
+
+
+def file_digests(path: str):
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(chunk)
+            md5.update(chunk)
+    return sha256.hexdigest(), md5.hexdigest()
+
+
+class DownloadQueueTask(QgsTask):
+    """Zadanie pobierające pliki z kolejki DownloadManager, dopóki kolejka nie jest pusta"""
+
+    message_group_name = "GIS Support - Dane do pobrania"
+
+    def __init__(self, manager: DownloadManager):
+        super().__init__("Pobieranie plików", QgsTask.Flag.CanCancel)
+        self.manager = manager
+
+    def run(self):
+        client = HttpClient.instance()
+        active = {}
+        try:
+            while True:
+                while len(active) < self.manager.max_concurrent:
+                    job = self.manager.next_job()
+                    if job is None:
+                        break
+                    active[self.start(client, job)] = job
+                if not active:
+                    if self.manager.stop_worker():
+                        return True
+                    continue
+
+                for future, job in active.items():
+                    if job.cancelled:
+                        future.cancel()
+                try:
+                    wait(list(active), timeout=0.2, feedback=self, return_when_first=True)
+                except TimeoutError:
+                    pass
+                for future in [future for future in active if future.done()]:
+                    self.finish(active.pop(future), future)
+                self.setProgress(self.manager.progress())
+        except CancelledError:
+            for job in active.values():
+                job.cancelled = True
+                self.manager.finish_job(job)
+            self.manager.cancel_queued()
+            self.manager.stop_worker(force=True)
+            return False
+
+    def start(self, client: HttpClient, job: DownloadJob) -> HttpFuture:
+        request = QNetworkRequest(QUrl(job.url))
+        for name, value in self.manager.conditional_headers(job).items():
+            request.setRawHeader(name, value)
+        future = client.download(request, job.path, resume=True)
+        future.pending.downloadProgress.connect(job.set_progress)
+        return future
+
+    def finish(self, job: DownloadJob, future: HttpFuture):
+        reply = future.pending.reply
+        if future.cancelled() or reply is None:
+            self.manager.cancel_job(job)
+            return
+
+        status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        resumable = False
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            error = reply.errorString()
+            # Błąd sieci lub serwera (5xx) jest przejściowy - odpowiedź 4xx (np. 404, 416) oznacza trwały błąd
+            resumable = (status_code is None or status_code >= 500) and os.path.exists(f"{job.path}.part")
+        elif status_code == 304:
+            job.not_modified = True
+            error = None
+        else:
+            error = self.manager.verify(job, reply)
+        reply.deleteLater()
+
+        if error:
+            LOG_BUFFER.log(f"{job.path} - błąd pobierania: {error}", self.message_group_name, Qgis.MessageLevel.Warning)
+        self.manager.finish_job(job, error, resumable)
+        if job.restored and not error:
+            self.manager.restored_finished.emit(job)
+
+
+DOWNLOAD_MANAGER = DownloadManager()
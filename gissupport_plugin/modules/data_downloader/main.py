@@ -1,12 +1,15 @@
-from qgis.PyQt.QtWidgets import QToolButton, QMenu
+from qgis.core import Qgis
+from qgis.PyQt.QtWidgets import QMenu, QPushButton, QToolButton
 from qgis.utils import iface
 
 
 from gissupport_plugin.modules.base import BaseModule
+from gissupport_plugin.modules.data_downloader.download_manager import DOWNLOAD_MANAGER
 from gissupport_plugin.modules.data_downloader.bdot10k.downloader import BDOT10kDownloader
 from gissupport_plugin.modules.data_downloader.prg.downloader import PRGDownloader
 from gissupport_plugin.modules.data_downloader.nmpt.downloader import NMPTdownloader
 from gissupport_plugin.modules.data_downloader.prg_address.downloader import PRGAddressDownloader
+from gissupport_plugin.tools.logger import LOG_BUFFER
 
 
 class DataDownloaderModule(BaseModule, PRGDownloader, PRGAddressDownloader, BDOT10kDownloader, NMPTdownloader):
@@ -19,6 +22,8 @@ class DataDownloaderModule(BaseModule, PRGDownloader, PRGAddressDownloader, BDOT
         BDOT10kDownloader.__init__(self)
         NMPTdownloader.__init__(self)
 
+        self.show_interrupted_downloads()
+
         self.download_action = self.parent.add_action(
             icon_path=':/plugins/gissupport_plugin/data_downloader/dane_do_pobrania.svg',
             text=self.module_name,
@@ -82,3 +87,31 @@ class DataDownloaderModule(BaseModule, PRGDownloader, PRGAddressDownloader, BDOT
 
         self.toolButton = self.parent.toolbar.widgetForAction(self.download_action)
         self.toolButton.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+
+    def show_interrupted_downloads(self):
+        """
+        Komunikat o plikach, których pobieranie przerwało zamknięcie QGIS - użytkownik decyduje,
+        czy wznowić pobieranie (od miejsca przerwania), czy usunąć pobrane części plików.
+        """
+        interrupted = len(DOWNLOAD_MANAGER.interrupted_jobs())
+        if not interrupted:
+            return
+        self.interrupted_message = iface.messageBar().createMessage(
+            "Wtyczka GIS Support", f"Przerwane pobieranie plików z poprzedniej sesji: {interrupted}")
+        resume_button = QPushButton("Wznów", self.interrupted_message)
+        resume_button.clicked.connect(self.resume_interrupted_downloads)
+        discard_button = QPushButton("Odrzuć", self.interrupted_message)
+        discard_button.clicked.connect(self.discard_interrupted_downloads)
+        self.interrupted_message.layout().addWidget(resume_button)
+        self.interrupted_message.layout().addWidget(discard_button)
+        iface.messageBar().pushWidget(self.interrupted_message, Qgis.MessageLevel.Info)
+
+    def resume_interrupted_downloads(self):
+        restored = DOWNLOAD_MANAGER.restore()
+        LOG_BUFFER.log(f"Wznowiono pobieranie plików z poprzedniej sesji: {restored}", "GIS Support - Dane do pobrania",
+                       Qgis.MessageLevel.Info)
+        iface.messageBar().popWidget(self.interrupted_message)
+
+    def discard_interrupted_downloads(self):
+        DOWNLOAD_MANAGER.discard_interrupted()
+        iface.messageBar().popWidget(self.interrupted_message)
@@ -10,7 +10,8 @@ from qgis.PyQt.QtWidgets import QFileDialog
 
 from gissupport_plugin.modules.data_downloader.nmpt.nmpt_dockwidget import NMPTdockWidget
 from gissupport_plugin.modules.gis_box.modules.auto_digitization.tools import SelectRectangleTool
-from gissupport_plugin.modules.data_downloader.nmpt.utils import NMPTdownloadTask
+from gissupport_plugin.modules.data_downloader.nmpt.utils import MAX_AREA_HA, NMPTdownloadTask
+from gissupport_plugin.modules.data_downloader.nmpt.tile_cache import TILE_CACHE
 
 def update_download_button_state_dec(func):
 
@@ -86,6 +87,11 @@ class NMPTdownloader:
 
         self.nmpt_dockwidget.selectAreaWidget.selectLayerCb.layerChanged.connect(self.on_layer_change)
 
+        self.nmpt_dockwidget.cacheSizeSpinBox.setValue(TILE_CACHE.max_size_mb)
+        self.nmpt_dockwidget.cacheSizeSpinBox.editingFinished.connect(self.change_cache_size)
+        self.nmpt_dockwidget.clearCacheButton.clicked.connect(self.clear_cache)
+        self.update_cache_info()
+
         iface.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.nmpt_dockwidget)
         self.nmpt_dockwidget.hide()
 
@@ -95,6 +101,23 @@ class NMPTdownloader:
             self.init_nmpt_dockwidget()
         
         self.nmpt_dockwidget.setVisible(not self.nmpt_dockwidget.isVisible())
+        if self.nmpt_dockwidget.isVisible():
+            self.update_cache_info()
+
+    def update_cache_info(self):
+
+        count, size = TILE_CACHE.stats()
+        self.nmpt_dockwidget.cacheInfoLabel.setText(f"Kafle: {count} ({size / 1024 / 1024:.0f} MB)")
+
+    def change_cache_size(self):
+
+        TILE_CACHE.set_max_size(self.nmpt_dockwidget.cacheSizeSpinBox.value())
+        self.update_cache_info()
+
+    def clear_cache(self):
+
+        TILE_CACHE.clear()
+        self.update_cache_info()
 
     @update_download_button_state_dec
     def data_radiobutton_state(self, button):
@@ -184,7 +207,7 @@ class NMPTdownloader:
         if area == 0:
             self.area_under_limit = False
 
-        elif area > 1000:
+        elif area > MAX_AREA_HA:
             self.nmpt_dockwidget.maxAreaReachedLabel.setVisible(True)
             self.area_under_limit = False
 
@@ -245,6 +268,7 @@ class NMPTdownloader:
 
     def load_nmpt_to_project(self, filepath_and_layer_name: list):
 
+        self.update_cache_info()
         layer = QgsRasterLayer(*filepath_and_layer_name)
         layer.setCrs(QgsCoordinateReferenceSystem(2180))
         QgsProject.instance().addMapLayer(layer)
@@ -252,4 +276,5 @@ class NMPTdownloader:
                     "Pomyślnie pobrano NM(P)T", level=Qgis.MessageLevel.Info))
 
     def handle_task_error(self, error_message):
+        self.update_cache_info()
         iface.messageBar().pushMessage("Wtyczka GIS Support", error_message, level=Qgis.MessageLevel.Critical)
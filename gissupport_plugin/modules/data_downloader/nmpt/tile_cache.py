@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+
+from qgis.core import QgsApplication
+from qgis.PyQt.QtCore import QSettings
+
+CACHE_DIR = os.path.join(QgsApplication.qgisSettingsDirPath(), "gissupport", "nmpt_tiles")
+
+SIZE_SETTINGS_KEY = "gissupport/nmpt/cache_size_mb"
+DEFAULT_SIZE_MB = 2048
+
+KEY_CONDITION = "model = ? AND datum = ? AND resolution = ? AND grid_col = ? AND grid_row = ?"
+
+
+class TileCache:
+    """
+    Pamięć podręczna pobranych kafli NM(P)T zachowywana między sesjami: pliki kafli w katalogu `directory`
+    oraz indeks SQLite. Kluczem kafla jest (model, układ wysokościowy, rozdzielczość, kolumna, wiersz siatki).
+
+    Łączny rozmiar kafli ograniczony jest do `max_size_mb` - po przekroczeniu usuwane są kafle najdawniej użyte,
+    z wyjątkiem kafli przypiętych przez trwające zadania (pin/unpin), które jeszcze z nich korzystają.
+    Obiekt może być używany z wielu wątków (każdy wątek ma własne połączenie z bazą).
+    """
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+        self.max_size_mb = max(0, QSettings().value(SIZE_SETTINGS_KEY, DEFAULT_SIZE_MB, type=int))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Liczba zadań korzystających z kafla (klucz) - takie kafle nie są usuwane
+        self._pinned = Counter()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            connection = self._local.connection = sqlite3.connect(os.path.join(self.directory, "tiles.sqlite"),
+                                                                  timeout=10)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS tiles (
+                    model TEXT NOT NULL,
+                    datum TEXT NOT NULL,
+                    resolution REAL NOT NULL,
+                    grid_col INTEGER NOT NULL,
+                    grid_row INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, datum, resolution, grid_col, grid_row)
+                ) WITHOUT ROWID
+            """)
+        return connection
+
+    def set_max_size(self, max_size_mb: int):
+        self.max_size_mb = max(0, max_size_mb)
+        QSettings().setValue(SIZE_SETTINGS_KEY, self.max_size_mb)
+        self.evict()
+
+    def tile_path(self, key: Tuple[str, str, float, int, int], extension: str) -> str:
+        """Ścieżka, pod którą należy zapisać kafel przed dodaniem go do pamięci podręcznej"""
+        model, datum, resolution, column, row = key
+        return os.path.join(self.directory, f"{model}_{datum}_{resolution:g}_{column}_{row}{extension}")
+
+    def get(self, key: Tuple[str, str, float, int, int]) -> Optional[str]:
+        """Ścieżka kafla z pamięci podręcznej (None, jeśli kafla nie ma lub jego plik został usunięty)"""
+        with self._lock, self.connection:
+            row = self.connection.execute(
+                f"SELECT filename FROM tiles WHERE {KEY_CONDITION}",
+                key
+            ).fetchone()
+            if not row:
+                return
+            path = os.path.join(self.directory, row[0])
+            if not os.path.exists(path):
+                self.connection.execute(f"DELETE FROM tiles WHERE {KEY_CONDITION}", key)
+                return
+            self.connection.execute(
+                f"UPDATE tiles SET last_used = ? WHERE {KEY_CONDITION}",
+                (time.time(), *key)
+            )
+            return path
+
+    def pin(self, keys: Iterable[Tuple[str, str, float, int, int]]):
+        """Chroni kafle przed usunięciem przez evict() i clear() do czasu wywołania unpin()"""
+        with self._lock:
+            self._pinned.update(self.normalize_key(key) for key in keys)
+
+    def unpin(self, keys: Iterable[Tuple[str, str, float, int, int]]):
+        with self._lock:
+            self._pinned.subtract(self.normalize_key(key) for key in keys)
+            self._pinned = +self._pinned
+
+    @staticmethod
+    def normalize_key(key) -> Tuple[str, str, float, int, int]:
+        model, datum, resolution, column, row = key
+        return model, datum, float(resolution), int(column), int(row)
+
+    def add(self, key: Tuple[str, str, float, int, int], path: str):
+        """Rejestruje kafel zapisany pod ścieżką z tile_path(); nadmiar usuwa dopiero evict()"""
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO tiles (model, datum, resolution, grid_col, grid_row, filename, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, os.path.basename(path), os.path.getsize(path), time.time())
+            )
+
+    def evict(self):
+        """Usuwa najdawniej użyte kafle, aż łączny rozmiar nie przekracza limitu"""
+        max_size = self.max_size_mb * 1024 * 1024
+        with self._lock, self.connection:
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+            if total <= max_size:
+                return
+            rows = self.connection.execute(
+                "SELECT model, datum, resolution, grid_col, grid_row, filename, size FROM tiles ORDER BY last_used").fetchall()
+            for *key, filename, size in rows:
+                if total <= max_size:
+                    break
+                if self.normalize_key(key) in self._pinned:
+                    continue
+                self._remove_file(filename)
+                self.connection.execute(f"DELETE FROM tiles WHERE {KEY_CONDITION}", key)
+                total -= size
+
+    def stats(self) -> Tuple[int, int]:
+        """Liczba kafli i ich łączny rozmiar w bajtach"""
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tiles").fetchone()
+
+    def clear(self):
+        """Usuwa wszystkie kafle poza przypiętymi przez trwające zadania"""
+        with self._lock, self.connection:
+            rows = self.connection.execute(
+                "SELECT model, datum, resolution, grid_col, grid_row, filename FROM tiles").fetchall()
+            for *key, filename in rows:
+                if self.normalize_key(key) in self._pinned:
+                    continue
+                self._remove_file(filename)
+                self.connection.execute(f"DELETE FROM tiles WHERE {KEY_CONDITION}", key)
+
+    def _remove_file(self, filename: str):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except OSError:
+            pass
+
+
+TILE_CACHE = TileCache()
@@ -1,17 +1,79 @@
+import math
 import os
-from io import BytesIO
+from concurrent.futures import CancelledError
+from typing import List, Tuple
 
+from osgeo import gdal
 from qgis.PyQt.QtCore import pyqtSignal
-from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsRectangle
-from gissupport_plugin.tools.requests import NetworkHandler
+from qgis.core import QgsTask, Qgis, QgsRectangle
+from gissupport_plugin.tools.http_client import HostPolicy, HttpClient
+from gissupport_plugin.tools.logger import LOG_BUFFER
+from gissupport_plugin.modules.data_downloader.download_manager import DOWNLOAD_MANAGER, DownloadException
+from gissupport_plugin.modules.data_downloader.nmpt.tile_cache import TILE_CACHE
+
+# Kafle NM(P)T mają do kilkudziesięciu MB - dłuższy czas oczekiwania na dane i ponowienia po błędach przejściowych
+HttpClient.set_host_policy('mapy.geoportal.gov.pl', HostPolicy(max_connections=4, timeout=300000, retries=2))
+
+
+def register_restored_tile(job):
+    """Kafel pobrany po wznowieniu przerwanego pobierania z poprzedniej sesji trafia do pamięci podręcznej"""
+    TILE_CACHE.add(tuple(job.meta), job.path)
+    TILE_CACHE.evict()
+
+
+DOWNLOAD_MANAGER.set_restore_handler("nmpt_tile", register_restored_tile)
+
+
+# Maksymalna powierzchnia pobierania [ha] - zasięg dzielony jest na kafle poniżej limitu usługi (1000 ha)
+MAX_AREA_HA = 50000
+
+
+def coverage_url(data_format: str, datum_format: str, bbox: QgsRectangle) -> str:
+    """Adres zapytania GetCoverage usługi WCS Geoportalu dla zasięgu `bbox` (EPSG:2180)"""
+    if data_format == 'DigitalSurfaceModel':
+        datum_prefix = 'DSM'
+        datum_letter = 'P'
+        res = '0.5'
+    else:
+        datum_prefix = 'DTM'
+        datum_letter = ''
+        res = '1'
+
+    if data_format == 'DigitalTerrainModelFormatTIFF':
+        file_format = 'tiff'
+        datum_format_suffix = '_TIFF'
+    else:
+        file_format = 'x-aaigrid'
+        datum_format_suffix = ''
+
+    url = (
+        "https://mapy.geoportal.gov.pl/wss/service/PZGIK/NM"
+        f"{datum_letter}T/GRID1/WCS/{data_format}"
+        "?service=wcs&request=GetCoverage&version=1.0.0&coverage="
+        f"{datum_prefix}_PL-{datum_format}-NH"
+        f"{datum_format_suffix}&format=image%2F{file_format}"
+        f"&bbox={bbox.xMinimum()}%2C{bbox.yMinimum()}"
+        f"%2C{bbox.xMaximum()}%2C{bbox.yMaximum()}"
+        f"&resx={res}&resy={res}&crs=EPSG%3A2180"
+    )
+
+    return url
 
 
 class NMPTdownloadTask(QgsTask):
+    """
+    Pobieranie NM(P)T dla zasięgu `bbox`. Zasięg pokrywany jest kaflami siatki o boku TILE_SIZE metrów
+    (poniżej limitu powierzchni usługi). Kafle brane są z pamięci podręcznej (TILE_CACHE), a brakujące pobierane
+    przez kolejkę DOWNLOAD_MANAGER i dodawane do niej - ponowne pobranie obszaru (również sąsiedniego lub po błędzie)
+    pobiera tylko brakujące kafle. Plik wynikowy składany jest z kafli i przycinany do zasięgu `bbox`.
+    """
     
     message_group_name = "GIS Support - Numeryczny Model (Pokrycia) Terenu"
     download_filepath = pyqtSignal(list)
     task_failed = pyqtSignal(str)
 
+    TILE_SIZE = 1000
+
     def __init__(
             self,
             description: str,
@@ -23,52 +85,109 @@ class NMPTdownloadTask(QgsTask):
         self.data_format = data_format
         self.datum_format = datum_format
         self.file_format = '.tiff' if data_format == 'DigitalTerrainModelFormatTIFF' else '.asc'
+        self.resolution = 0.5 if data_format == 'DigitalSurfaceModel' else 1.0
         self.bbox = bbox
         self.filepath = filepath
-        self.url = self.prepare_url()
+        self.tiles = self.prepare_tiles()
         super().__init__(description, QgsTask.Flag.CanCancel)
 
+    def prepare_tiles(self) -> List[Tuple[tuple, QgsRectangle]]:
+        """Kafle siatki TILE_SIZE pokrywające zasięg pobierania: (klucz pamięci podręcznej, zasięg kafla)"""
+        size = self.TILE_SIZE
+        tiles = []
+        for column in range(math.floor(self.bbox.xMinimum() / size), math.ceil(self.bbox.xMaximum() / size)):
+            for row in range(math.floor(self.bbox.yMinimum() / size), math.ceil(self.bbox.yMaximum() / size)):
+                key = (self.data_format, self.datum_format, self.resolution, column, row)
+                tiles.append((key, QgsRectangle(column * size, row * size, (column + 1) * size, (row + 1) * size)))
+        return tiles
 
-    def prepare_url(self):
-        if self.data_format == 'DigitalSurfaceModel':
-            datum_prefix = 'DSM'
-            datum_letter = 'P'
-            res = '0.5'
-        else:
-            datum_prefix = 'DTM'
-            datum_letter = ''
-            res = '1'
-
-        if self.data_format == 'DigitalTerrainModelFormatTIFF':
-            file_format = 'tiff'
-            datum_format_suffix = '_TIFF'
-        else:
-            file_format = 'x-aaigrid'
-            datum_format_suffix = ''
-
-        url = (
-            "https://mapy.geoportal.gov.pl/wss/service/PZGIK/NM"
-            f"{datum_letter}T/GRID1/WCS/{self.data_format}"
-            "?service=wcs&request=GetCoverage&version=1.0.0&coverage="
-            f"{datum_prefix}_PL-{self.datum_format}-NH"
-            f"{datum_format_suffix}&format=image%2F{file_format}"
-            f"&bbox={self.bbox.xMinimum()}%2C{self.bbox.yMinimum()}"
-            f"%2C{self.bbox.xMaximum()}%2C{self.bbox.yMaximum()}"
-            f"&resx={res}&resy={res}&crs=EPSG%3A2180"
-        )
-
-        return url
+    def prepare_url(self, bbox: QgsRectangle):
+        return coverage_url(self.data_format, self.datum_format, bbox)
 
     def run(self):
-        handler = NetworkHandler()
-        response = handler.get(self.url, True)
+        # Kafle zadania chronione są przed usunięciem z pamięci podręcznej (np. po zakończeniu innego pobierania)
+        # do czasu złożenia pliku wynikowego
+        keys = [key for key, _ in self.tiles]
+        TILE_CACHE.pin(keys)
+        try:
+            result = self.download_tiles()
+        finally:
+            TILE_CACHE.unpin(keys)
+        # Nadmiar pamięci podręcznej usuwany dopiero po złożeniu pliku wynikowego z potrzebnych kafli
+        TILE_CACHE.evict()
+        return result
+
+    def download_tiles(self) -> bool:
+        tile_paths = {key: TILE_CACHE.get(key) for key, _ in self.tiles}
+        missing = [(key, bbox) for key, bbox in self.tiles if tile_paths[key] is None]
+        if missing:
+            self.log_message(f"Kafle z pamięci podręcznej: {len(self.tiles) - len(missing)}, do pobrania: {len(missing)}",
+                             level=Qgis.MessageLevel.Info)
+
+        # Kafle pobierane są przez wspólną kolejkę pobierania - przerwane pobieranie kafla jest wznawiane
+        jobs = {key: DOWNLOAD_MANAGER.enqueue(self.prepare_url(bbox), TILE_CACHE.tile_path(key, self.file_format),
+                                              kind="nmpt_tile", meta=list(key))
+                for key, bbox in missing}
+        failed = 0
+        try:
+            for key, job in jobs.items():
+                try:
+                    job.wait(feedback=self, progress_callback=lambda _: self.update_tile_progress(jobs))
+                except DownloadException as error:
+                    failed += 1
+                    self.log_message(f"{os.path.basename(job.path)} - błąd pobierania: {error}",
+                                     level=Qgis.MessageLevel.Warning)
+                    continue
+                TILE_CACHE.add(key, job.path)
+                tile_paths[key] = job.path
+        except CancelledError:
+            for job in jobs.values():
+                job.cancel()
+            return False
+
+        if failed:
+            self.task_failed.emit(
+                f"Nie pobrano {failed} z {len(self.tiles)} kafli NM(P)T. Sprawdź swoje połączenie z Internetem oraz "
+                "czy usługa Geoportal.gov.pl działa - ponowne pobranie tego samego obszaru uzupełni brakujące kafle.")
+            return False
+
+        full_filepath = self.unique_filepath(self.file_format)
+        if not self.build_output(full_filepath, list(tile_paths.values())):
+            self.task_failed.emit("Nie udało się utworzyć pliku z pobranych kafli NM(P)T.")
+            return False
 
-        if response.error() != 0:
-            self.task_failed.emit("Błąd pobierania danych. Sprawdź swoje połączenie z Internetem oraz czy usługa Geoportal.gov.pl działa.")
+        self.log_message(f"{full_filepath} - pobrano", level=Qgis.MessageLevel.Info)
+        self.download_filepath.emit([full_filepath, self.data_format])
+
+        return True
+
+    def build_output(self, full_filepath: str, tile_paths: List[str]) -> bool:
+        """Złożenie kafli (mozaika VRT w pamięci) w jeden plik przycięty do zasięgu pobierania"""
+        vrt_path = f"/vsimem/nmpt_{id(self)}.vrt"
+        vrt = gdal.BuildVRT(vrt_path, tile_paths)
+        if vrt is None:
+            return False
+        proj_win = [self.bbox.xMinimum(), self.bbox.yMaximum(), self.bbox.xMaximum(), self.bbox.yMinimum()]
+        if self.file_format == '.tiff':
+            options = gdal.TranslateOptions(format='GTiff', projWin=proj_win,
+                                            creationOptions=['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER'])
+        else:
+            options = gdal.TranslateOptions(format='AAIGrid', projWin=proj_win)
+        output = gdal.Translate(full_filepath, vrt, options=options)
+        vrt = None
+        gdal.Unlink(vrt_path)
+        if output is None:
             return False
+        output = None
+        return True
+
+    def update_tile_progress(self, jobs: dict):
+        """Postęp zadania: kafle z pamięci podręcznej oraz postęp pobierania pozostałych kafli"""
+        cached = len(self.tiles) - len(jobs)
+        self.setProgress((cached * 100 + sum(job.progress() for job in jobs.values())) / len(self.tiles))
 
-        data = BytesIO(response.readAll().data())
-        base_filepath = os.path.join(self.filepath, f"{self.data_format}{self.file_format}")
+    def unique_filepath(self, extension: str) -> str:
+        base_filepath = os.path.join(self.filepath, f"{self.data_format}{extension}")
 
         full_filepath = base_filepath
         counter = 1
@@ -76,18 +195,10 @@ class NMPTdownloadTask(QgsTask):
             name, ext = os.path.splitext(base_filepath)
             full_filepath = f"{name}_{counter}{ext}"
             counter += 1
-
-        with open(full_filepath, 'wb') as file:
-            for chunk in iter(lambda: data.read(1024), b''):
-                file.write(chunk)
-
-        self.log_message(f"{full_filepath} - pobrano", level=Qgis.MessageLevel.Info)
-        self.download_filepath.emit([full_filepath, self.data_format])
-
-        return True
+        return full_filepath
 
     def finished(self, result: bool):
         pass
 
     def log_message(self, message: str, level: Qgis.MessageLevel):
-        QgsMessageLog.logMessage(message, self.message_group_name, level)
+        LOG_BUFFER.log(message, self.message_group_name, level)
@@ -1,10 +1,10 @@
 from enum import Enum
 import requests
 
-from qgis.core import QgsGeometry, QgsFeature, QgsTask, QgsCoordinateReferenceSystem, QgsVectorLayer, QgsProject, \
-    QgsMessageLog, Qgis
+from qgis.core import QgsGeometry, QgsFeature, QgsTask, QgsCoordinateReferenceSystem, QgsVectorLayer, QgsProject, Qgis
 from qgis.PyQt.QtCore import QCoreApplication
 
+from gissupport_plugin.tools.logger import LOG_BUFFER
 from gissupport_plugin.tools.requests import NetworkHandler
 
 
@@ -128,4 +128,4 @@ class PRGDownloadTask(QgsTask):
         return result
 
     def log_message(self, message: str, level: Qgis.MessageLevel):
-        QgsMessageLog.logMessage(message, self.message_group_name, level)
+        LOG_BUFFER.log(message, self.message_group_name, level)
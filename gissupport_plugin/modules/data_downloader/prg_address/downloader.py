@@ -242,7 +242,6 @@ class PRGAddressDownloader:
         Wyświetla komunikat o błędzie pobierania danych `PRG - punkty adresowe` z DataBox.
         """
         iface.messageBar().pushMessage("Wtyczka GIS Support",
-                                       """Na wybranym obszarze nie znajdują się obiekty wybranej warstwy
-                                       lub liczba obiektów na wybranym obszarze jest większa niż 100 000""",
+                                       "Na wybranym obszarze nie znajdują się obiekty wybranej warstwy",
                                        level=Qgis.MessageLevel.Warning)
 
@@ -1,12 +1,12 @@
-import json
-from io import BytesIO
+from concurrent.futures import CancelledError
 
-from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
 from qgis.PyQt.QtCore import pyqtSignal
-from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsGeometry, QgsCoordinateReferenceSystem, QgsProject, QgsCoordinateTransform
+from qgis.core import QgsTask, Qgis, QgsGeometry, QgsCoordinateReferenceSystem, QgsProject, QgsCoordinateTransform
 from qgis.utils import iface
 
-from gissupport_plugin.tools.requests import NetworkHandler
+from gissupport_plugin.modules.data_downloader.databox_fetch import DataboxFetchException, DataboxTiledFetch
+from gissupport_plugin.modules.data_downloader.download_manager import DOWNLOAD_MANAGER, DownloadException
+from gissupport_plugin.tools.logger import LOG_BUFFER
 
 
 class PRGAddressDownloadTask(QgsTask):
@@ -22,25 +22,18 @@ class PRGAddressDownloadTask(QgsTask):
         super().__init__(description, QgsTask.Flag.CanCancel)
 
     def run(self):
-        handler = NetworkHandler()
-        response = handler.get(self.url, True)
-
-        if response.error() != QNetworkReply.NetworkError.NoError:
+        full_filepath = f"{self.filepath}/{self.teryt_p}_GML.zip"
+        job = DOWNLOAD_MANAGER.enqueue(self.url, full_filepath)
+        try:
+            job.wait(feedback=self, progress_callback=self.progress_updated.emit)
+        except CancelledError:
+            job.cancel()
+            return False
+        except DownloadException as error:
+            self.log_message(f"{full_filepath} - błąd pobierania: {error}", level=Qgis.MessageLevel.Warning)
             self.task_failed.emit("Błąd pobierania danych. Sprawdź swoje połączenie z Internetem oraz czy usługa Geoportal.gov.pl działa.")
             return False
 
-        total_size = int(response.header(QNetworkRequest.KnownHeaders.ContentLengthHeader)) or 0
-        data = BytesIO(response.readAll().data())
-        bytes_received = 0
-        full_filepath = f"{self.filepath}/{self.teryt_p}_GML.zip"
-        with open(full_filepath, 'wb') as file:
-            for chunk in iter(lambda: data.read(1024), b''):
-                file.write(chunk)
-                bytes_received += len(chunk)
-                if total_size > 0:
-                    progress = (bytes_received / total_size) * 100
-                    self.progress_updated.emit(progress)
-
         self.log_message(f"{full_filepath} - pobrano", level=Qgis.MessageLevel.Info)
         self.download_finished.emit(True)
 
@@ -50,44 +43,43 @@ class PRGAddressDownloadTask(QgsTask):
         pass
 
     def log_message(self, message: str, level: Qgis.MessageLevel):
-        QgsMessageLog.logMessage(message, self.message_group_name, level)
+        LOG_BUFFER.log(message, self.message_group_name, level)
 
 class PRGAddressDataBoxDownloadTask(QgsTask):
+    message_group_name = "GIS Support - Punkty adresowe PRG"
     download_finished = pyqtSignal(bool)
     downloaded_data = pyqtSignal(str)
     downloaded_details = pyqtSignal(str)
 
     def __init__(self, description: str, layer: str, geojson: QgsGeometry):
         self.layer = layer
-        self.geojson = json.loads(geojson.asJson())
-        self.geojson["crs"] = {"type": "name", "properties": {"name": "EPSG:2180"}}
+        self.geometry = QgsGeometry(geojson)
         self.bbox = geojson.boundingBox()
         self.url = f"https://databox.gis.support/api/2.0/functions/GetFeaturesByGeoJSON/prg_punkty_adresowe"
         super().__init__(description, QgsTask.Flag.CanCancel)
 
     def run(self):
-        handler = NetworkHandler()
-        response = handler.post(self.url, data=self.geojson, databox=True)
-        if details := response.get("details"):
-            self.downloaded_details.emit(f"Przekroczono limit danych ({details.get('limit')}) z Data.Box. Próbowano pobrać {details.get('count')} obiektów.")
-            self.download_finished.emit(True)
+        # Obszar przekraczający limit obiektów Data.Box pobierany jest w częściach
+        fetch = DataboxTiledFetch(self.url, self.geometry, feedback=self, progress_callback=self.setProgress)
+        try:
+            features = fetch.fetch()
+        except CancelledError:
             return False
-        elif error := response.get("error"):
-            if msg := response.get("msg"):
-                self.downloaded_details.emit(msg)
-            else:
-                self.downloaded_details.emit(f"Błąd pobierania danych z Data.Box.")
+        except DataboxFetchException as error:
+            self.downloaded_details.emit(str(error))
             self.download_finished.emit(True)
             return False
 
-        response_data = response.get("data")
-        features = json.loads(response_data)["features"]
-        geojson_dict = {"type": "FeatureCollection", "features": features}
-
-        self.downloaded_data.emit(json.dumps(geojson_dict))
+        if fetch.splits:
+            self.log_message(f"Pobrano {len(features)} obiektów z Data.Box w {fetch.requests} zapytaniach",
+                             level=Qgis.MessageLevel.Info)
+        self.downloaded_data.emit(fetch.feature_collection(features))
         self.download_finished.emit(True)
         return True
 
+    def log_message(self, message: str, level: Qgis.MessageLevel):
+        LOG_BUFFER.log(message, self.message_group_name, level)
+
 def convert_multi_polygon_to_polygon(geometry: QgsGeometry):
     # rubber bandy zwracają multipoligony, konieczne jest rozbicie geometrii przed wysłaniem do api oze
     geometry.convertToSingleType()
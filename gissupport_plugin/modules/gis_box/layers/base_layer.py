@@ -1,11 +1,11 @@
 # coding: utf-8
-from qgis.core import (QgsCoordinateTransform, QgsCoordinateReferenceSystem,
-                       QgsProject, QgsMapLayer)
+from qgis.core import QgsProject, QgsMapLayer
 from qgis.utils import iface
 from qgis.PyQt.QtCore import QObject
 
 from gissupport_plugin.tools.logger import Logger
 from gissupport_plugin.tools.project_variables import save_layer_mapping
+from gissupport_plugin.tools.transforms import get_transform
 
 
 class BaseLayer(QObject, Logger):
@@ -91,11 +91,7 @@ class BaseLayer(QObject, Logger):
             return
         if layer.crs().authid() != QgsProject.instance().crs().authid():
             extent = layer.extent()
-            fromCrs = QgsCoordinateReferenceSystem(layer.crs().authid())
-            toCrs = QgsCoordinateReferenceSystem(
-                QgsProject.instance().crs().authid())
-            transformation = QgsCoordinateTransform(
-                fromCrs, toCrs, QgsProject.instance())
+            transformation = get_transform(layer.crs(), QgsProject.instance().crs())
             extent = transformation.transform(extent)
         else:
             extent = layer.extent()
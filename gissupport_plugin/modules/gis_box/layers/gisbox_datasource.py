@@ -1,7 +1,7 @@
 import time
 
 from typing import List, Iterable, Any
-from qgis.core import (QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsEditFormConfig, QgsEditorWidgetSetup,
+from qgis.core import (QgsEditFormConfig, QgsEditorWidgetSetup,
                        QgsAttributeEditorContainer, QgsAttributeEditorField, QgsMapLayer, NULL, QgsFieldConstraints,
                        QgsProject, QgsVectorLayer, QgsTask, QgsApplication, QgsFeature, Qgis, QgsFeatureRequest)
 from qgis.utils import iface
@@ -14,6 +14,7 @@ from gissupport_plugin.tools.logger import Logger
 from .geojson import geojson2geom
 from gissupport_plugin.tools.gisbox_connection import GISBOX_CONNECTION
 from gissupport_plugin.tools.project_variables import save_layer_mapping
+from gissupport_plugin.tools.transforms import get_transform
 
 
 class GisboxDataSource(QObject, Logger):
@@ -148,11 +149,7 @@ class GisboxFeatureLayer(QObject, Logger):
             return
         if layer.crs().authid() != QgsProject.instance().crs().authid():
             extent = layer.extent()
-            fromCrs = QgsCoordinateReferenceSystem(layer.crs().authid())
-            toCrs = QgsCoordinateReferenceSystem(
-                QgsProject.instance().crs().authid())
-            transformation = QgsCoordinateTransform(
-                fromCrs, toCrs, QgsProject.instance())
+            transformation = get_transform(layer.crs(), QgsProject.instance().crs())
             extent = transformation.transform(extent)
         else:
             extent = layer.extent()
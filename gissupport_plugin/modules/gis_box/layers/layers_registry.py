@@ -1,17 +1,20 @@
+import json
 import time
 from typing import List, Union
 
 from qgis.PyQt.QtCore import pyqtSignal, QObject
+from qgis.PyQt.QtNetwork import QNetworkReply
 from qgis.core import QgsProject
 from qgis.utils import iface
 
-from . import RELATION_VALUES_MAPPING_REGISTRY
+from . import DATA_SOURCE_REGISTRY, RELATION_VALUES_MAPPING_REGISTRY
 
 from .basemap_layer import BaseMapLayer
-from .gisbox_datasource import GisboxFeatureLayer
+from .gisbox_datasource import GisboxDataSource, GisboxFeatureLayer
 
 from gissupport_plugin.tools.logger import Logger
 from gissupport_plugin.tools.gisbox_connection import GISBOX_CONNECTION
+from gissupport_plugin.tools.http_client import gather
 from gissupport_plugin.tools.project_variables import get_layer_mapping
 
 
@@ -134,6 +137,8 @@ class LayersRegistry(QObject, Logger):
         group_id = group_data[1]
         group = self.getGroupById(group_id)
 
+        self.prefetchDataSources([self.layers.get(layer_id) for layer_id in group['layers']])
+
         root = QgsProject.instance().layerTreeRoot()
         qgis_group = root.addGroup(group_name)
         for layer_id in group['layers']:
@@ -142,6 +147,26 @@ class LayersRegistry(QObject, Logger):
                 layer_class.loadLayer(group=qgis_group)
         iface.mapCanvas().refresh()
 
+    def prefetchDataSources(self, layer_classes: List[Union[GisboxFeatureLayer, BaseMapLayer, None]]):
+        """ Równoległe pobranie brakujących metadanych źródeł danych dla wczytywanych warstw """
+        datasource_names = {getattr(layer_class, 'datasource_name', None) for layer_class in layer_classes}
+        datasource_names = [name for name in datasource_names if name and name not in DATA_SOURCE_REGISTRY]
+        if len(datasource_names) < 2:
+            return
+
+        futures = [GISBOX_CONNECTION.submit(f'/api/dataio/data_sources/{name}/metadata?cache={time.time()}')
+                   for name in datasource_names]
+        for name, reply in zip(datasource_names, gather(futures)):
+            # Źródła, których nie udało się pobrać, zostaną pobrane przy wczytywaniu warstwy
+            if reply is None or reply.error() != QNetworkReply.NetworkError.NoError:
+                continue
+            try:
+                datasource_meta = json.loads(bytearray(reply.readAll()))
+            except ValueError:
+                continue
+            if datasource_meta.get('data'):
+                DATA_SOURCE_REGISTRY[name] = GisboxDataSource(datasource_meta['data'])
+
 
 # Stworzenie instancji klasy
 layers_registry = LayersRegistry()
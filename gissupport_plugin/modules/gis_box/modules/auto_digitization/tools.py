@@ -9,6 +9,8 @@ from qgis.core import (Qgis, QgsWkbTypes, QgsGeometry, QgsProject, QgsDistanceAr
 from qgis.gui import QgsRubberBand, QgsMapTool, QgsMapToolIdentifyFeature
 from qgis.utils import iface
 
+from gissupport_plugin.tools.transforms import get_transform
+
 
 class SelectRectangleTool(QgsMapTool):
     geometryChanged = pyqtSignal(float)
@@ -185,8 +187,7 @@ class SelectFeaturesTool(QgsMapToolIdentifyFeature):
                     layer_crs = identify[0].mLayer.crs()
                     crs_2180 = QgsCoordinateReferenceSystem.fromEpsgId(2180)
                     if layer_crs != crs_2180:
-                        transformation = QgsCoordinateTransform(layer_crs, crs_2180, QgsProject.instance())
-                        geom.transform(transformation)
+                        geom.transform(get_transform(layer_crs, crs_2180))
 
                     self.tempGeom.addGeometry(geom, identify[0].mLayer)
                     self.tempGeom2.addGeometry(geom)
@@ -23,8 +23,11 @@
 """
 
 import os, csv
+from itertools import islice
+from concurrent.futures import CancelledError
 from qgis.core import Qgis
 from gissupport_plugin.tools.requests import NetworkHandler
+from gissupport_plugin.tools.transforms import get_transform
 #Nie każdy instalator QGIS ma wbudowanego matplotliba, a bibliotek zewnętrznych nie można instalować
 # dla wtyczek w oficjalnym repo
 # https://github.com/gis-support/gis-support-plugin/issues/4
@@ -35,15 +38,23 @@ except ImportError:
     matplotlib_library = False
 
 from qgis.PyQt import QtGui, uic
-from qgis.PyQt.QtWidgets import QDockWidget, QInputDialog, QFileDialog
+from qgis.PyQt.QtWidgets import QDockWidget, QInputDialog, QFileDialog, QHeaderView
 from qgis.PyQt.QtCore import pyqtSignal, QVariant
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import (QgsMapLayerProxyModel, QgsField, Qgis, QgsTask, QgsApplication,
     QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsProject, QgsVectorLayer,
-    QgsFeature, QgsWkbTypes, QgsGeometry, QgsExpression, QgsFeatureRequest)
+    QgsFeature, QgsWkbTypes, QgsGeometry, QgsFeatureRequest, QgsPointXY,
+    QgsVectorLayerFeatureSource, QgsCurve, QgsCurvePolygon)
 from qgis.utils import iface
 
+from ..height_cache import HEIGHT_CACHE
+from ..height_query import HeightQueryEngine, HeightQueryException
+from ..models import ProfileTableModel
+from ..raster_source import RasterHeightSource, numpy_library
+if numpy_library:
+    import numpy
 from ..tools import IdentifyTool, ProfileTool
+from ..zonal_stats import STATISTICS_FIELDS, WcsHeightSource, ZonalStatisticsTask
 from .info_dialog import InfoDialog
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
@@ -56,19 +67,36 @@ class GugikNmtDockWidget(QDockWidget, FORM_CLASS):
     on_message = pyqtSignal(str, object, int)
 
     GUGIK_URL = 'https://services.gugik.gov.pl/nmt/'
+    HEIGHT_PAGE_SIZE = 5000
+    ZONAL_TASKS = 4
 
     def __init__(self, parent=None):
         """Constructor."""
         super(GugikNmtDockWidget, self).__init__(parent)
         self.setupUi(self)
 
-        self.cbLayers.setFilters(QgsMapLayerProxyModel.Filter.PointLayer)
+        self.cbLayers.setFilters(QgsMapLayerProxyModel.Filter.PointLayer | QgsMapLayerProxyModel.Filter.LineLayer | QgsMapLayerProxyModel.Filter.PolygonLayer)
+        self.cbHeightSource.setFilters(QgsMapLayerProxyModel.Filter.RasterLayer)
+        self.cbHeightSource.setAllowEmptyLayer(True, 'Usługa GUGiK NMT')
+        self.cbHeightSource.setLayer(None)
+        self.cbHeightSource.setEnabled(numpy_library)
+        self.cbZonalLayer.setFilters(QgsMapLayerProxyModel.Filter.PolygonLayer)
+        self.cbZonalModel.addItem('NMT', 'DigitalTerrainModelFormatTIFF')
+        self.cbZonalModel.addItem('NMPT', 'DigitalSurfaceModel')
+        self.profileModel = ProfileTableModel(self)
+        self.tvData.setModel(self.profileModel)
+        self.tvData.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         self.menageSignals()
         self.registerTools()
         self.setButtonIcons()
         #Referencje
         self.savedFeats = []
+        self.profile = None
+        self.zonalTask = None
         self.infoDialog = InfoDialog()
+        self.dsbCacheGrid.setValue(HEIGHT_CACHE.grid)
+        self.dsbCacheGrid.valueChanged.connect(HEIGHT_CACHE.set_grid)
+        self.tbClearCache.clicked.connect(self.clearHeightCache)
 
     def setButtonIcons(self):
         """ Ustawienie ikonek dla przycisków """
@@ -76,6 +104,7 @@ class GugikNmtDockWidget(QDockWidget, FORM_CLASS):
         self.tbExportCsv.setIcon(QgsApplication.getThemeIcon('mActionAddTable.svg'))
         self.tbCreateTempLyr.setIcon(QgsApplication.getThemeIcon('mActionFileSave.svg'))
         self.tbExtendLayer.setIcon(QgsApplication.getThemeIcon('mActionStart.svg'))
+        self.tbZonalStats.setIcon(QgsApplication.getThemeIcon('mActionStart.svg'))
         self.tbMakeLine.setIcon(QgsApplication.getThemeIcon('mActionAddPolyline.svg'))
         self.tbShowProfile.setIcon(QgsApplication.getThemeIcon('mActionAddImage.svg'))
         self.tbResetPoints.setIcon(QgsApplication.getThemeIcon('mIconDelete.svg'))
@@ -87,6 +116,7 @@ class GugikNmtDockWidget(QDockWidget, FORM_CLASS):
         #Kontrolki
         self.cbLayers.layerChanged.connect(self.cbLayerChanged)
         self.tbExtendLayer.clicked.connect(self.extendLayerByHeight)
+        self.tbZonalStats.clicked.connect(self.calculateZonalStatistics)
         self.cbxUpdateField.stateChanged.connect(self.switchFieldsCb)
         self.tbCreateTempLyr.clicked.connect(self.createTempLayer)
         self.tbExportCsv.clicked.connect(self.exportToCsv)
@@ -110,6 +140,11 @@ class GugikNmtDockWidget(QDockWidget, FORM_CLASS):
     def showInfo(self):
         self.infoDialog.show()
 
+    def clearHeightCache(self):
+        """ Usunięcie zapamiętanych wysokości """
+        HEIGHT_CACHE.clear()
+        self.on_message.emit('Wyczyszczono pamięć podręczną wysokości', Qgis.MessageLevel.Info, 3)
+
     def showMessage(self, message, level, time=5):
         """ Wyświetlanie wiadomości na pasku """
         iface.messageBar().pushMessage('Narzędzie GUGiK NMT:', message, level, time)
@@ -135,54 +170,56 @@ class GugikNmtDockWidget(QDockWidget, FORM_CLASS):
         # http://services.gugik.gov.pl/nmt/?request=GetHbyXY&x=486617&y=637928
         project_crs = QgsProject.instance().crs().authid()
         point = self.transformGeometry(geom, project_crs).asPoint()
+        cached_height = HEIGHT_CACHE.get(point)
+        if cached_height is not None:
+            return str(cached_height)
         x, y = point.y(), point.x()
         response = self.createRequest(f'?request=GetHbyXY&x={x}&y={y}')
         if 'error' in response:
             self.on_message.emit(response['error'], Qgis.MessageLevel.Critical, 5)
             return
         else:
+            try:
+                HEIGHT_CACHE.set(point, float(response['data']))
+            except ValueError:
+                pass
             return response['data']
 
-    def getPointsHeights(self, feats_meta):
+    def createRasterSource(self):
+        """ Lokalny raster wybrany jako źródło wysokości - tworzony w wątku głównym, przed uruchomieniem zadania """
+        layer = self.cbHeightSource.currentLayer()
+        if RasterHeightSource.is_available(layer):
+            return RasterHeightSource(layer)
+
+    def getPointsHeights(self, xs, ys, task: QgsTask = None, raster_source: RasterHeightSource = None):
         """
-        Pobieranie wysokości dla większej ilości punktów. Jeśli ich liczba > 200 -
-        lista zostaje podzielona na mniejsze częśći i dopiero dla tych części wysyłane są
-        requesty do api
+        Pobieranie wysokości dla punktów o współrzędnych `xs`, `ys` (EPSG:2180) - z lokalnego rastra,
+        jeśli został wskazany, a dla pozostałych punktów z usługi GUGiK (HeightQueryEngine).
+        Zwraca wysokości w kolejności punktów (z NumPy jako tablicę).
         """
-        self.points_coords = [f.split('%20')[::-1] for f in feats_meta]
-        if isinstance(feats_meta, dict):
-            feats_meta = list(feats_meta.keys())
-        if len(feats_meta) <= 200:
-            response = self.createRequest('?request=GetHByPointList&list=%s'%','.join(feats_meta))
-            if 'error' in response:
-                self.on_message.emit(response['error'], Qgis.MessageLevel.Critical, 5)
-                return
-            else:
-                return response['data']
-
+        if raster_source is not None:
+            heights = raster_source.get_heights(xs, ys, task)
+            missing = numpy.flatnonzero(numpy.isnan(heights)).tolist()
         else:
-            chunks = [feats_meta[i:i + 200] for i in range(0, len(feats_meta), 200)]
-            responses = []
-            for chunk in chunks:
-                response = self.createRequest('?request=GetHByPointList&list=%s'%','.join(chunk))
-                if 'error' in response:
-                    self.on_message.emit(response['error'], Qgis.MessageLevel.Critical, 5)
-                    return
-                else:
-                    responses.append(response['data'])
-
-            responses = ','.join(responses)
-            return responses
+            heights = numpy.full(len(xs), numpy.nan) if numpy_library else [None] * len(xs)
+            missing = list(range(len(xs)))
+        if not missing:
+            return heights
+        try:
+            missing_heights = HeightQueryEngine().get_heights([QgsPointXY(xs[index], ys[index]) for index in missing], task)
+        except HeightQueryException as e:
+            self.on_message.emit(str(e), Qgis.MessageLevel.Critical, 5)
+            return
+        except CancelledError:
+            return
+        for index, height in zip(missing, missing_heights):
+            heights[index] = height
+        return heights
 
     def transformGeometry(self, geometry, current_crs, dest_crs='EPSG:2180', multi=False):
         """ Transformacja geometrii """
         if current_crs != dest_crs:
-            ct = QgsCoordinateTransform(
-                QgsCoordinateReferenceSystem(current_crs),
-                QgsCoordinateReferenceSystem(dest_crs),
-                QgsProject().instance()
-                )
-            geometry.transform(ct)
+            geometry.transform(get_transform(current_crs, dest_crs))
         if multi:
             point = geometry.asGeometryCollection()[0].asPoint()
             return f'{point.y()}%20{point.x()}'
@@ -203,45 +240,162 @@ class GugikNmtDockWidget(QDockWidget, FORM_CLASS):
         layer = self.cbLayers.currentLayer()
         if not layer:
             return
-        exp = QgsExpression('num_geometries($geometry) > 1')
-        multipart_features = [f for f in layer.getFeatures(QgsFeatureRequest(exp))]
-        if multipart_features:
-            self.on_message.emit("Rozszerzenie nie jest możliwe, ponieważ warstwa zawiera obiekty o wieloczęściowych geometriach", Qgis.MessageLevel.Warning, 5)
         if self.cbxUpdateField.isChecked():
             field_id = layer.dataProvider().fields().indexFromName(self.cbFields.currentText())
         elif 'nmt_wys' not in layer.fields().names():
             field_id = self.createNewField(layer)
         else:
             field_id = layer.dataProvider().fields().indexFromName('nmt_wys')
+        request = QgsFeatureRequest().setNoAttributes()
         if self.cbxSelectedOnly.isChecked():
-            feats = layer.selectedFeatures()
+            request.setFilterFids(layer.selectedFeatureIds())
+            count = layer.selectedFeatureCount()
         else:
-            feats = list(layer.getFeatures())
-        data = {'feats':feats, 'field_id':field_id}
+            count = layer.featureCount()
+        field = layer.dataProvider().fields().field(field_id)
+        data = {
+            'source': QgsVectorLayerFeatureSource(layer),
+            'request': request,
+            'count': count,
+            'transform': get_transform(layer.crs(), 'EPSG:2180'),
+            'provider': layer.dataProvider(),
+            'field_id': field_id,
+            'integer': field.type() in [QVariant.LongLong, QVariant.Int],
+            'layer_name': layer.name(),
+            'raster_source': self.createRasterSource()
+        }
         self.task2 = QgsTask.fromFunction('Dodawanie pola z wysokościa...', self.addHeightToFields, data=data)
         QgsApplication.taskManager().addTask(self.task2)
 
     def addHeightToFields(self, task: QgsTask, data):
-        """ Dodawanie wysokości dla punktów """
-        layer = self.cbLayers.currentLayer()
-        layer_crs = layer.crs().authid()
-        feats_meta = {self.transformGeometry(feat.geometry(), layer_crs, multi=True):feat.id()
-            for feat in data.get('feats')}
-        if not feats_meta:
-            return
+        """
+        Dodawanie wysokości dla obiektów warstwy - obiekty odczytywane są porcjami po HEIGHT_PAGE_SIZE,
+        a wysokości każdej porcji zapisywane od razu. Dla linii, poligonów i obiektów wieloczęściowych
+        zapisywana jest średnia wysokość wierzchołków (bez wierzchołków zamykających pierścienie).
+        Obiekty bez geometrii są pomijane.
+        """
         field_id = data.get('field_id')
-        field = layer.dataProvider().fields().field(field_id)
-        response = self.getPointsHeights(feats_meta).split(',')
-        to_change = {}
-        for r in response:
-            coords, height = r.replace(' ', '%20', 1).split(' ')
-            if field.type() in [QVariant.LongLong, QVariant.Int]:
-                height = int(float(height))
-            to_change[feats_meta.get(coords)] = {field_id:height}
-        layer.dataProvider().changeAttributeValues(to_change)
-        self.on_message.emit(f'Pomyślnie dodano pole z wysokościa do warstwy: {layer.name()}', Qgis.MessageLevel.Success, 4)
+        provider = data.get('provider')
+        transform = data.get('transform')
+        total = data.get('count') or 1
+        features = data.get('source').getFeatures(data.get('request'))
+        done = 0
+        skipped = 0
+        while True:
+            page = list(islice(features, self.HEIGHT_PAGE_SIZE))
+            if not page:
+                break
+            fids, offsets, xs, ys = [], [0], [], []
+            for feat in page:
+                geometry = feat.geometry()
+                if geometry.isEmpty():
+                    skipped += 1
+                    continue
+                geometry.transform(transform)
+                for vertex in self.heightSampleVertices(geometry):
+                    xs.append(vertex.x())
+                    ys.append(vertex.y())
+                if len(xs) == offsets[-1]:
+                    skipped += 1
+                    continue
+                fids.append(feat.id())
+                offsets.append(len(xs))
+            heights = self.getPointsHeights(xs, ys, task, data.get('raster_source')) if xs else []
+            if heights is None or task.isCanceled():
+                return
+            to_change = {}
+            for fid, start, end in zip(fids, offsets, offsets[1:]):
+                height = sum(heights[start:end]) / (end - start)
+                to_change[fid] = {field_id: int(height) if data.get('integer') else float(height)}
+            provider.changeAttributeValues(to_change)
+            done += len(page)
+            task.setProgress(min(100, done * 100 / total))
+        if skipped:
+            self.on_message.emit(f'Dodano pole z wysokościa do warstwy: {data.get("layer_name")}, pominięto obiekty bez geometrii: {skipped}', Qgis.MessageLevel.Warning, 5)
+        else:
+            self.on_message.emit(f'Pomyślnie dodano pole z wysokościa do warstwy: {data.get("layer_name")}', Qgis.MessageLevel.Success, 4)
         del self.task2
 
+    @staticmethod
+    def heightSampleVertices(geometry: QgsGeometry):
+        """
+        Wierzchołki, dla których pobierana jest wysokość obiektu. Wierzchołek zamykający pierścień
+        (lub zamkniętą linię) jest pomijany - inaczej punkt początkowy liczony byłby w średniej dwa razy.
+        """
+        for part in geometry.constParts():
+            if isinstance(part, QgsCurvePolygon):
+                curves = [part.exteriorRing()] + [part.interiorRing(i) for i in range(part.numInteriorRings())]
+            elif isinstance(part, QgsCurve):
+                curves = [part]
+            else:
+                yield from part.vertices()
+                continue
+            for curve in curves:
+                if curve is None:
+                    continue
+                vertices = list(curve.vertices())
+                if curve.isClosed() and len(vertices) > 1:
+                    vertices = vertices[:-1]
+                yield from vertices
+
+    def calculateZonalStatistics(self):
+        """
+        Statystyki wysokości dla poligonów - z lokalnego rastra wskazanego jako źródło wysokości,
+        a bez niego z modelu pobieranego z Geoportalu dla każdego poligonu
+        """
+        layer = self.cbZonalLayer.currentLayer()
+        if not layer:
+            return
+        if not numpy_library:
+            self.on_message.emit("Nie wykryto biblioteki NumPy, która jest wymagana do obliczenia statystyk wysokości.", Qgis.MessageLevel.Warning, 5)
+            return
+        request = QgsFeatureRequest().setNoAttributes()
+        if self.cbxZonalSelectedOnly.isChecked():
+            request.setFilterFids(layer.selectedFeatureIds())
+        features = [(feat.id(), feat.geometry()) for feat in layer.getFeatures(request) if feat.hasGeometry()]
+        if not features:
+            self.on_message.emit('Brak poligonów do obliczenia statystyk', Qgis.MessageLevel.Warning, 5)
+            return
+        field_ids = self.createStatisticsFields(layer)
+        batches = []
+        for index in range(min(self.ZONAL_TASKS, len(features))):
+            height_source = self.createRasterSource() or WcsHeightSource(self.cbZonalModel.currentData())
+            transform = QgsCoordinateTransform(get_transform(layer.crs(), height_source.crs))
+            batches.append((features[index::self.ZONAL_TASKS], transform, height_source))
+        self.zonalTask = ZonalStatisticsTask('Obliczanie statystyk wysokości...', batches)
+        self.zonalTask.calculated.connect(
+            lambda results, layer_id=layer.id(): self.writeZonalStatistics(layer_id, field_ids, results))
+        self.zonalTask.taskTerminated.connect(self.resetZonalTask)
+        QgsApplication.taskManager().addTask(self.zonalTask)
+
+    def resetZonalTask(self):
+        """ Zadanie statystyk przerwane (anulowane lub zakończone błędem) """
+        self.zonalTask = None
+
+    def createStatisticsFields(self, layer):
+        """ Utworzenie brakujących pól na statystyki wysokości i zwrócenie ich id """
+        data_provider = layer.dataProvider()
+        new_fields = [QgsField(name, QVariant.Double) for name in STATISTICS_FIELDS if name not in layer.fields().names()]
+        if new_fields:
+            data_provider.addAttributes(new_fields)
+            layer.updateFields()
+        return [data_provider.fields().indexFromName(name) for name in STATISTICS_FIELDS]
+
+    def writeZonalStatistics(self, layer_id, field_ids, results):
+        """ Zapis obliczonych statystyk do warstwy (w wątku głównym) """
+        self.zonalTask = None
+        layer = QgsProject.instance().mapLayer(layer_id)
+        if not layer:
+            return
+        to_change = {fid: dict(zip(field_ids, statistics)) for fid, statistics in results.items() if statistics}
+        layer.dataProvider().changeAttributeValues(to_change)
+        layer.triggerRepaint()
+        skipped = len(results) - len(to_change)
+        if skipped:
+            self.on_message.emit(f'Nie udało się obliczyć statystyk wysokości dla {skipped} obiektów warstwy: {layer.name()}', Qgis.MessageLevel.Warning, 5)
+        else:
+            self.on_message.emit(f'Pomyślnie obliczono statystyki wysokości dla warstwy: {layer.name()}', Qgis.MessageLevel.Success, 4)
+
     def createTempLayer(self):
         """
         Tworzenie warstwy tymczasowej i dodanie do niej punktów,
@@ -280,47 +434,42 @@ class GugikNmtDockWidget(QDockWidget, FORM_CLASS):
         self.identifyTool.reset()
         del self.task
 
+    def setProfile(self, stations, xs, ys, heights):
+        """ Zapamiętanie profilu i przekazanie tablic odległości i wysokości do modelu tabeli """
+        self.profile = (stations, xs, ys, heights)
+        self.profileModel.setProfile(stations, heights)
+
+    def clearProfile(self):
+        self.profile = None
+        self.profileModel.clear()
+
     def exportToCsv(self):
         """ Eksport wysokości wraz z interwałami do pliku csv """
-        rows = self.twData.rowCount()
-        if rows < 1:
+        if not self.profile:
             return
         path, _ = QFileDialog.getSaveFileName(filter=f'*.csv')
         if not path:
             return
-        rows = self.twData.rowCount()
         if not path.lower().endswith('.csv'):
             path += '.csv'
+        stations, xs, ys, heights = self.profile
         with open(path, 'w') as f:
             writer = csv.writer(f, delimiter=';')
-            to_write = [['Odległość', 'Wysokość npm', 'x', 'y']]
-            for row in range(rows):
-                if self.twData.item(row, 1):
-                    dist = self.twData.item(row, 0).text() + 'm'
-                    val = self.twData.item(row, 1).text()
-                    x, y = self.points_coords[row]
-                    to_write.append([
-                        dist, val, round(float(x)), round(float(y))
-                    ])
-            writer.writerows(to_write)
+            writer.writerow(['Odległość', 'Wysokość npm', 'x', 'y'])
+            writer.writerows(
+                [f'{station:.2f}m', '' if height is None else f'{height:.2f}', round(x), round(y)]
+                for station, x, y, height in zip(stations, xs, ys, heights)
+            )
         self.on_message.emit(f'Wygenerowano plik csv w miejscu: {path}', Qgis.MessageLevel.Success, 4)   
 
     def generatePlot(self):
         """ Wyświetlenie profilu podłużnego """
         if not matplotlib_library:
-            self.on_message.emit("Nie wykryto biblioteki matplotlib. W celu prawidłowego działania wyświetalnia profilu proszę ją doinstalować.", Qgis.MessageLevel.Warning, 5)
+            self.on_message.emit("Nie wykryto biblioteki matplotlib. W celu prawidłowego działania wyświetalnia profilu proszę ją doinstalować.", Qgis.MessageLevel.Warning, 5)
             return
-        rows = self.twData.rowCount()
-        if rows < 1:
+        if not self.profile:
             return
-        dist_list = []
-        values = []
-        for row in range(rows):
-            if self.twData.item(row, 1):
-                dist = self.twData.item(row, 0).text()
-                val = self.twData.item(row, 1).text()
-                dist_list.append(float(dist))
-                values.append(float(val))
+        dist_list, _, _, values = self.profile
         fig, ax = plt.subplots()
         ax.set(xlabel='Interwał [m]', ylabel='Wysokość npm',
             title='Profil podłużny')
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from qgis.core import QgsApplication, QgsPointXY
+from qgis.PyQt.QtCore import QSettings
+
+CACHE_PATH = os.path.join(QgsApplication.qgisSettingsDirPath(), "gissupport", "gugik_nmt_heights.sqlite")
+
+GRID_SETTINGS_KEY = "gissupport/gugik_nmt/cache_grid"
+DEFAULT_GRID = 0.5
+
+
+class HeightCache:
+    """
+    Pamięć podręczna wysokości z usługi GUGiK NMT: LRU w pamięci oraz baza SQLite zachowywana między sesjami.
+
+    Kluczem jest punkt w EPSG:2180 przyciągnięty do siatki o oczku `grid` metrów - punkty odległe o kilka
+    centymetrów otrzymują tę samą wysokość. Wpisy są rozdzielone według oczka siatki, więc zmiana siatki
+    nie zwraca wysokości zapisanych dla innej. Obiekt może być używany z wielu wątków
+    (każdy wątek ma własne połączenie z bazą).
+    """
+
+    def __init__(self, path: str = CACHE_PATH, memory_size: int = 100000):
+        self.path = path
+        self.memory_size = memory_size
+        self.grid = max(0.01, QSettings().value(GRID_SETTINGS_KEY, DEFAULT_GRID, type=float))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS heights (
+                    grid INTEGER NOT NULL,
+                    ix INTEGER NOT NULL,
+                    iy INTEGER NOT NULL,
+                    height REAL NOT NULL,
+                    PRIMARY KEY (grid, ix, iy)
+                ) WITHOUT ROWID
+            """)
+        return connection
+
+    def set_grid(self, grid: float):
+        self.grid = max(0.01, grid)
+        QSettings().setValue(GRID_SETTINGS_KEY, self.grid)
+
+    def key(self, point: QgsPointXY) -> tuple:
+        # Oczko siatki zapisywane w milimetrach, żeby uniknąć porównywania liczb zmiennoprzecinkowych
+        return int(round(self.grid * 1000)), int(round(point.x() / self.grid)), int(round(point.y() / self.grid))
+
+    def get_many(self, points: Iterable[QgsPointXY]) -> List[Optional[float]]:
+        """Wysokości punktów (None dla punktów spoza pamięci podręcznej)"""
+        keys = [self.key(point) for point in points]
+        heights = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for index, key in enumerate(keys):
+                height = self._memory.get(key)
+                if height is None:
+                    missing.append(index)
+                else:
+                    self._memory.move_to_end(key)
+                    heights[index] = height
+        if not missing:
+            return heights
+
+        found = {}
+        cursor = self.connection.cursor()
+        for index in missing:
+            key = keys[index]
+            if key in found:
+                heights[index] = found[key]
+                continue
+            row = cursor.execute("SELECT height FROM heights WHERE grid = ? AND ix = ? AND iy = ?", key).fetchone()
+            if row:
+                heights[index] = found[key] = row[0]
+        if found:
+            self._remember(found)
+        return heights
+
+    def get(self, point: QgsPointXY) -> Optional[float]:
+        return self.get_many([point])[0]
+
+    def set_many(self, points: Iterable[QgsPointXY], heights: Iterable[Optional[float]]):
+        entries = {self.key(point): height for point, height in zip(points, heights) if height is not None}
+        if not entries:
+            return
+        self._remember(entries)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO heights (grid, ix, iy, height) VALUES (?, ?, ?, ?)",
+                (key + (height,) for key, height in entries.items())
+            )
+
+    def set(self, point: QgsPointXY, height: float):
+        self.set_many([point], [height])
+
+    def _remember(self, entries: dict):
+        with self._lock:
+            for key, height in entries.items():
+                self._memory[key] = height
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with self.connection:
+            self.connection.execute("DELETE FROM heights")
+
+
+HEIGHT_CACHE = HeightCache()
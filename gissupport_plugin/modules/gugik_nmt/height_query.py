@@ -0,0 +1,160 @@
+import time
+from collections import deque
+from typing import List, Optional, Union
+
+from qgis.core import QgsFeedback, QgsPointXY, QgsTask
+from qgis.PyQt.QtCore import QUrl
+from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
+
+from gissupport_plugin.tools.http_client import HostPolicy, HttpClient, as_completed
+
+from .height_cache import HEIGHT_CACHE, HeightCache
+
+GUGIK_NMT_URL = 'https://services.gugik.gov.pl/nmt/'
+
+HttpClient.set_host_policy('services.gugik.gov.pl', HostPolicy(max_connections=4))
+
+
+class HeightQueryException(Exception):
+    pass
+
+
+class HeightQueryEngine:
+    """
+    Pobieranie wysokości dla listy punktów (EPSG:2180) zapytaniami GetHByPointList.
+
+    Lista dzielona jest na części, których wielkość dobierana jest na bieżąco: adres zapytania nie może przekroczyć
+    MAX_URL_LENGTH, a czas odpowiedzi powinien być zbliżony do TARGET_LATENCY. Jednocześnie wysyłanych jest
+    najwyżej `max_in_flight` zapytań, ponawiane są tylko części zakończone błędem (przy odpowiedzi 414 dzielone
+    na pół), a wysokości zwracane są w kolejności punktów. Przed wysłaniem zapytań sprawdzana jest pamięć podręczna
+    wysokości - pobierane są tylko brakujące punkty, każde oczko siatki pamięci podręcznej raz.
+    """
+
+    MAX_URL_LENGTH = 7500
+    TARGET_LATENCY = 2.0
+    MIN_CHUNK_SIZE = 10
+    MAX_CHUNK_SIZE = 1000
+
+    def __init__(self, url: str = GUGIK_NMT_URL, max_in_flight: int = 4, retries: int = 2,
+                 initial_chunk_size: int = 100, cache: Optional[HeightCache] = HEIGHT_CACHE):
+        self.url = url
+        self.cache = cache
+        self.max_in_flight = max(1, max_in_flight)
+        self.retries = retries
+        self.chunk_size = initial_chunk_size
+        self._seconds_per_point = None
+
+    @staticmethod
+    def format_point(point: QgsPointXY) -> str:
+        # Usługa przyjmuje współrzędne w kolejności geodezyjnej (X - północ, Y - wschód)
+        return f'{point.y():.2f}%20{point.x():.2f}'
+
+    def chunk_url(self, coordinates: List[str]) -> str:
+        return f"{self.url}?request=GetHByPointList&list={','.join(coordinates)}"
+
+    def next_chunk_end(self, coordinates: List[str], start: int) -> int:
+        """Koniec kolejnej części listy - według bieżącej wielkości części i limitu długości adresu"""
+        length = len(self.chunk_url([]))
+        end = start
+        while end < len(coordinates) and end - start < self.chunk_size:
+            length += len(coordinates[end]) + 1
+            if length > self.MAX_URL_LENGTH and end > start:
+                break
+            end += 1
+        return end
+
+    def update_chunk_size(self, latency: float, points_count: int):
+        seconds_per_point = latency / points_count
+        if self._seconds_per_point is None:
+            self._seconds_per_point = seconds_per_point
+        else:
+            self._seconds_per_point = 0.7 * self._seconds_per_point + 0.3 * seconds_per_point
+        if self._seconds_per_point > 0:
+            chunk_size = int(self.TARGET_LATENCY / self._seconds_per_point)
+            self.chunk_size = max(self.MIN_CHUNK_SIZE, min(self.MAX_CHUNK_SIZE, chunk_size))
+
+    @staticmethod
+    def parse_response(reply: QNetworkReply, points_count: int) -> Optional[List[float]]:
+        """Wysokości z odpowiedzi ('X Y H,X Y H,...') albo None, jeśli odpowiedź jest błędna lub niepełna"""
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            return None
+        content = reply.readAll().data().decode().strip()
+        entries = content.split(',') if content else []
+        if len(entries) != points_count:
+            return None
+        try:
+            return [float(entry.rsplit(' ', 1)[1]) for entry in entries]
+        except (IndexError, ValueError):
+            return None
+
+    def get_heights(self, points: List[QgsPointXY],
+                    feedback: Union[QgsTask, QgsFeedback, None] = None) -> List[float]:
+        """
+        Wysokości punktów w kolejności listy. Zgłasza HeightQueryException, jeśli część listy nie została pobrana
+        mimo ponowień, oraz concurrent.futures.CancelledError po anulowaniu zadania.
+        """
+        if self.cache is None:
+            return self.query_heights(points, feedback)
+
+        heights = self.cache.get_many(points)
+        missing = {}
+        for index, height in enumerate(heights):
+            if height is None:
+                missing.setdefault(self.cache.key(points[index]), []).append(index)
+        if not missing:
+            return heights
+
+        missing_points = [points[indexes[0]] for indexes in missing.values()]
+        missing_heights = self.query_heights(missing_points, feedback)
+        self.cache.set_many(missing_points, missing_heights)
+        for indexes, height in zip(missing.values(), missing_heights):
+            for index in indexes:
+                heights[index] = height
+        return heights
+
+    def query_heights(self, points: List[QgsPointXY],
+                      feedback: Union[QgsTask, QgsFeedback, None] = None) -> List[float]:
+        """Wysokości punktów pobierane z usługi, z pominięciem pamięci podręcznej"""
+        coordinates = [self.format_point(point) for point in points]
+        heights = [None] * len(coordinates)
+        client = HttpClient.instance()
+
+        cursor = 0
+        failed_chunks = deque()
+        in_flight = {}
+        try:
+            while cursor < len(coordinates) or failed_chunks or in_flight:
+                while len(in_flight) < self.max_in_flight and (failed_chunks or cursor < len(coordinates)):
+                    if failed_chunks:
+                        start, end, attempts = failed_chunks.popleft()
+                    else:
+                        start, end, attempts = cursor, self.next_chunk_end(coordinates, cursor), 0
+                        cursor = end
+                    future = client.submit(QNetworkRequest(QUrl(self.chunk_url(coordinates[start:end]))))
+                    in_flight[future] = (start, end, attempts, time.perf_counter())
+
+                future = next(as_completed(list(in_flight), feedback=feedback))
+                start, end, attempts, started = in_flight.pop(future)
+                reply = future.result()
+                values = self.parse_response(reply, end - start)
+                reply.deleteLater()
+                if values is not None:
+                    heights[start:end] = values
+                    self.update_chunk_size(time.perf_counter() - started, end - start)
+                    continue
+
+                if attempts >= self.retries:
+                    raise HeightQueryException(
+                        f'Nie udało się pobrać wysokości dla {end - start} punktów: {reply.errorString()}')
+                status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+                if status_code == 414 and end - start > 1:
+                    middle = (start + end) // 2
+                    self.chunk_size = max(self.MIN_CHUNK_SIZE, (end - start) // 2)
+                    failed_chunks.extendleft([(middle, end, attempts + 1), (start, middle, attempts + 1)])
+                else:
+                    failed_chunks.appendleft((start, end, attempts + 1))
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+        return heights
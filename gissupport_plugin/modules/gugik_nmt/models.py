@@ -0,0 +1,44 @@
+from qgis.PyQt.QtCore import QAbstractTableModel, Qt, QModelIndex
+
+
+class ProfileTableModel(QAbstractTableModel):
+    """
+    Tabela profilu (odległość, wysokość) oparta bezpośrednio na tablicach profilu - bez kopiowania wartości
+    do elementów tabeli. Wartości formatowane są dopiero przy wyświetlaniu widocznych wierszy.
+    """
+
+    HEADERS = ('Odległość', 'Wysokość npm')
+
+    def __init__(self, parent=None):
+        super(ProfileTableModel, self).__init__(parent)
+        self.stations = []
+        self.heights = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.stations)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def setProfile(self, stations, heights):
+        self.beginResetModel()
+        self.stations = stations
+        self.heights = heights
+        self.endResetModel()
+
+    def clear(self):
+        self.setProfile([], [])
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return super(ProfileTableModel, self).headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return
+        values = self.stations if index.column() == 0 else self.heights
+        value = values[index.row()]
+        if value is None:
+            return
+        return f'{value:.2f}'
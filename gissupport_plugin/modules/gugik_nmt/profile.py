@@ -0,0 +1,44 @@
+from typing import Tuple
+
+from qgis.core import QgsGeometry
+
+from .raster_source import numpy_library
+
+if numpy_library:
+    import numpy
+
+
+def line_vertices(geometry: QgsGeometry) -> Tuple[list, list]:
+    """Współrzędne wierzchołków linii (dla linii wieloczęściowej - pierwszej części)"""
+    if geometry.isMultipart():
+        polyline = geometry.asMultiPolyline()[0]
+    else:
+        polyline = geometry.asPolyline()
+    return [point.x() for point in polyline], [point.y() for point in polyline]
+
+
+def profile_stations(geometry: QgsGeometry, interval: float) -> Tuple[list, list, list]:
+    """
+    Punkty profilu co `interval` metrów wzdłuż linii: (odległości od początku, x, y).
+
+    Z NumPy wierzchołki odczytywane są raz, a współrzędne punktów interpolowane liniowo względem skumulowanych
+    długości odcinków (wynik w tablicach). Bez NumPy punkty wyznaczane są przez QgsGeometry.interpolate().
+    """
+    if not numpy_library:
+        stations, xs, ys = [], [], []
+        for index in range(int(geometry.length() / interval) + 1):
+            point = geometry.interpolate(index * interval).asPoint()
+            stations.append(index * interval)
+            xs.append(point.x())
+            ys.append(point.y())
+        return stations, xs, ys
+
+    vertices_x, vertices_y = (numpy.asarray(values, dtype=numpy.float64) for values in line_vertices(geometry))
+    segments = numpy.hypot(numpy.diff(vertices_x), numpy.diff(vertices_y))
+    # Odcinki zerowej długości (powtórzone wierzchołki) zaburzałyby interpolację
+    keep = numpy.concatenate(([True], segments > 0))
+    vertices_x, vertices_y = vertices_x[keep], vertices_y[keep]
+    distances = numpy.concatenate(([0.0], numpy.cumsum(segments[segments > 0])))
+
+    stations = numpy.arange(int(distances[-1] / interval) + 1) * interval
+    return stations, numpy.interp(stations, distances, vertices_x), numpy.interp(stations, distances, vertices_y)
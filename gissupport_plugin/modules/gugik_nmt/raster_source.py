@@ -0,0 +1,134 @@
+import math
+from typing import Optional, Union
+
+from qgis.core import (Qgis, QgsCoordinateReferenceSystem, QgsFeedback, QgsPointXY, QgsRasterLayer, QgsRectangle,
+                       QgsTask)
+
+from gissupport_plugin.tools.transforms import get_transform
+
+# Nie każdy instalator QGIS ma wbudowanego NumPy - bez niego wysokości pobierane są wyłącznie z usługi GUGiK
+try:
+    import numpy
+    numpy_library = True
+except ImportError:
+    numpy_library = False
+
+CRS_2180 = QgsCoordinateReferenceSystem.fromEpsgId(2180)
+
+
+def numpy_dtype(data_type: Qgis.DataType):
+    dtypes = {
+        Qgis.DataType.Byte: numpy.uint8,
+        Qgis.DataType.UInt16: numpy.uint16,
+        Qgis.DataType.Int16: numpy.int16,
+        Qgis.DataType.UInt32: numpy.uint32,
+        Qgis.DataType.Int32: numpy.int32,
+        Qgis.DataType.Float32: numpy.float32,
+        Qgis.DataType.Float64: numpy.float64,
+    }
+    # Typ Int8 jest dostępny od QGIS 3.30
+    if hasattr(Qgis.DataType, "Int8"):
+        dtypes[Qgis.DataType.Int8] = numpy.int8
+    return dtypes.get(data_type)
+
+
+class RasterHeightSource:
+    """
+    Odczyt wysokości z lokalnego rastra NMT (np. pobranego narzędziem NMPT) zamiast z usługi GUGiK.
+
+    Punkty grupowane są według kafli rastra o boku TILE_SIZE pikseli - każdy potrzebny kafel odczytywany jest
+    raz jako blok danych, a wartości pikseli (najbliższy piksel) pobierane są z tablicy NumPy.
+    Obiekt należy utworzyć w wątku głównym (kopiuje dostawcę danych warstwy), a używać można w zadaniu QgsTask.
+    """
+
+    TILE_SIZE = 512
+    # Maksymalna liczba pikseli pasa odczytywanego przez read_window()
+    WINDOW_CELLS = 4 * 1024 * 1024
+
+    def __init__(self, layer: QgsRasterLayer, band: int = 1):
+        self.name = layer.name()
+        self.band = band
+        self.provider = layer.dataProvider().clone()
+        self.extent = layer.extent()
+        self.columns = layer.width()
+        self.rows = layer.height()
+        self.pixel_width = self.extent.width() / self.columns
+        self.pixel_height = self.extent.height() / self.rows
+        self.crs = layer.crs()
+        self.transform = None if layer.crs() == CRS_2180 else get_transform(CRS_2180, layer.crs())
+
+    @staticmethod
+    def is_available(layer: Optional[QgsRasterLayer]) -> bool:
+        return numpy_library and layer is not None and layer.isValid() \
+            and numpy_dtype(layer.dataProvider().dataType(1)) is not None
+
+    def get_heights(self, xs, ys, feedback: Union[QgsTask, QgsFeedback, None] = None):
+        """Wysokości punktów o współrzędnych `xs`, `ys` (EPSG:2180) jako tablica; NaN poza rastrem i bez danych"""
+        xs = numpy.asarray(xs, dtype=numpy.float64)
+        ys = numpy.asarray(ys, dtype=numpy.float64)
+        if self.transform is not None:
+            points = [self.transform.transform(QgsPointXY(x, y)) for x, y in zip(xs, ys)]
+            xs = numpy.fromiter((point.x() for point in points), dtype=numpy.float64, count=len(points))
+            ys = numpy.fromiter((point.y() for point in points), dtype=numpy.float64, count=len(points))
+
+        columns = numpy.floor((xs - self.extent.xMinimum()) / self.pixel_width).astype(numpy.int64)
+        rows = numpy.floor((self.extent.yMaximum() - ys) / self.pixel_height).astype(numpy.int64)
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+
+        values = numpy.full(len(xs), numpy.nan)
+        tiles_per_row = (self.columns + self.TILE_SIZE - 1) // self.TILE_SIZE
+        tile_ids = numpy.where(inside, (rows // self.TILE_SIZE) * tiles_per_row + columns // self.TILE_SIZE, -1)
+
+        for tile_id in numpy.unique(tile_ids[inside]):
+            if feedback is not None and feedback.isCanceled():
+                break
+            selected = tile_ids == tile_id
+            row_start = int(tile_id // tiles_per_row) * self.TILE_SIZE
+            column_start = int(tile_id % tiles_per_row) * self.TILE_SIZE
+            tile = self.read_tile(row_start, column_start)
+            values[selected] = tile[rows[selected] - row_start, columns[selected] - column_start]
+
+        return values
+
+    def read_tile(self, row_start: int, column_start: int):
+        """Kafel rastra jako tablica float64 z wartościami NaN w pikselach bez danych"""
+        width = min(self.TILE_SIZE, self.columns - column_start)
+        height = min(self.TILE_SIZE, self.rows - row_start)
+        return self.read_block(row_start, column_start, height, width)
+
+    def read_window(self, extent: QgsRectangle):
+        """
+        Piksele rastra pokrywające zasięg `extent` (w układzie rastra), odczytywane pasami wierszy nie większymi
+        niż WINDOW_CELLS pikseli - generator par (tablica jak w read_block, zasięg pasa wyrównany do pikseli).
+        Dla zasięgu leżącego poza rastrem nie zwraca nic.
+        """
+        column_start = max(0, math.floor((extent.xMinimum() - self.extent.xMinimum()) / self.pixel_width))
+        column_end = min(self.columns, math.ceil((extent.xMaximum() - self.extent.xMinimum()) / self.pixel_width))
+        row_start = max(0, math.floor((self.extent.yMaximum() - extent.yMaximum()) / self.pixel_height))
+        row_end = min(self.rows, math.ceil((self.extent.yMaximum() - extent.yMinimum()) / self.pixel_height))
+        if column_end <= column_start or row_end <= row_start:
+            return
+        width = column_end - column_start
+        strip_rows = max(1, self.WINDOW_CELLS // width)
+        for strip_start in range(row_start, row_end, strip_rows):
+            height = min(strip_rows, row_end - strip_start)
+            yield (self.read_block(strip_start, column_start, height, width),
+                   self.block_extent(strip_start, column_start, height, width))
+
+    def block_extent(self, row_start: int, column_start: int, height: int, width: int) -> QgsRectangle:
+        x_min = self.extent.xMinimum() + column_start * self.pixel_width
+        y_max = self.extent.yMaximum() - row_start * self.pixel_height
+        return QgsRectangle(x_min, y_max - height * self.pixel_height, x_min + width * self.pixel_width, y_max)
+
+    def read_block(self, row_start: int, column_start: int, height: int, width: int):
+        """Blok rastra jako tablica float64 z wartościami NaN w pikselach bez danych"""
+        extent = self.block_extent(row_start, column_start, height, width)
+        block = self.provider.block(self.band, extent, width, height)
+        dtype = numpy_dtype(block.dataType())
+        if not block.isValid() or dtype is None:
+            return numpy.full((height, width), numpy.nan)
+
+        tile = numpy.frombuffer(bytes(block.data()), dtype=dtype).reshape(height, width).astype(numpy.float64)
+        if block.hasNoDataValue():
+            tile[tile == block.noDataValue()] = numpy.nan
+        return tile
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from qgis.PyQt.QtCore import Qt, pyqtSignal
-from qgis.PyQt.QtWidgets import QInputDialog, QTableWidgetItem
+from qgis.PyQt.QtWidgets import QInputDialog
 from qgis.PyQt.QtGui import QCursor, QPixmap, QColor
 from qgis.core import (QgsMapLayer, QgsWkbTypes, QgsGeometry, QgsProject, Qgis, QgsDistanceArea,
     QgsCoordinateTransformContext, QgsUnitTypes, QgsCoordinateReferenceSystem, QgsCoordinateTransform,
@@ -9,6 +9,8 @@ from qgis.core import (QgsMapLayer, QgsWkbTypes, QgsGeometry, QgsProject, Qgis,
 from qgis.gui import QgsRubberBand, QgsMapTool
 from qgis.utils import iface
 
+from .profile import profile_stations
+
 class IdentifyTool(QgsMapTool):
     """ Narzędzie identyfikacji wysokości """
 
@@ -173,47 +175,30 @@ class ProfileTool(QgsMapTool):
             self.parent.on_message.emit('Długość linii krótsza lub równa podanemu interwałowi', Qgis.MessageLevel.Critical, 5)
             self.reset()
             return
-        try:
-            num_points = meters_len/interval
-        except ZeroDivisionError:
+        if interval <= 0:
             self.parent.on_message.emit('Interwał musi być większy od 0', Qgis.MessageLevel.Critical, 4)
             self.reset()
             return
-        points_on_line = []
-        max_interval = 0
-        intervals = []
-        for i in range(int(num_points)+1):
-            pt = geom.interpolate(float(max_interval)).asPoint()
-            points_on_line.append(f'{pt.y()}%20{pt.x()}')
-            intervals.append(max_interval)
-            max_interval += interval
-        data = {'points':points_on_line, 'intervals':intervals}
-        self.task = QgsTask.fromFunction('Pobieranie wysokości dla przekroju...', self.generateProfileFromPoints, data=data)
+        stations, xs, ys = profile_stations(geom, interval)
+        data = {'stations': stations, 'xs': xs, 'ys': ys, 'raster_source': self.parent.createRasterSource()}
+        self.task = QgsTask.fromFunction('Pobieranie wysokości dla przekroju...', self.generateProfileFromPoints,
+            on_finished=self.profileGenerated, data=data)
         QgsApplication.taskManager().addTask(self.task)
 
     def generateProfileFromPoints(self, task: QgsTask, data):
         """ Pobranie wysokości dla punktów na linii """
-        points_on_line = data.get('points')
-        intervals = data.get('intervals')
-        response = self.parent.getPointsHeights(points_on_line).split(',')
-        heights = []
-        for r in response:
-            _, height = r.rsplit(' ', 1)
-            heights.append(height)
-        if heights and intervals:   
-            self.fillTable(heights, intervals)
-        self.parent.on_message.emit('Pomyślnie wygenerowano profil', Qgis.MessageLevel.Success, 4)
-        self.task = None
+        heights = self.parent.getPointsHeights(data.get('xs'), data.get('ys'), task, data.get('raster_source'))
+        if heights is None:
+            return
+        return data.get('stations'), data.get('xs'), data.get('ys'), heights
 
-    def fillTable(self, heights, intervals):
-        """ Wypełnienie tabelii interwałami i wysokościami dla nich """
-        for idx, interval in enumerate(intervals):
-            try:
-                self.parent.twData.setRowCount(idx+1)
-                self.parent.twData.setItem(idx, 0, QTableWidgetItem(f'{interval}'))
-                self.parent.twData.setItem(idx, 1, QTableWidgetItem(heights[idx]))
-            except:
-                return
+    def profileGenerated(self, exception, result=None):
+        """ Wypełnienie tabeli po pobraniu wysokości (w wątku głównym) """
+        self.task = None
+        if exception is not None or result is None:
+            return
+        self.parent.setProfile(*result)
+        self.parent.on_message.emit('Pomyślnie wygenerowano profil', Qgis.MessageLevel.Success, 4)
 
     def calculateDistance(self, geometry):
         """ Obliczenie długości linii w odpowiedniej jednostce """
@@ -229,7 +214,7 @@ class ProfileTool(QgsMapTool):
         self.tempLine.reset(QgsWkbTypes.GeometryType.LineGeometry)
         self.tempGeom.reset(QgsWkbTypes.GeometryType.LineGeometry)
         self.parent.dsbLineLength.setValue(0)
-        self.parent.twData.setRowCount(0)
+        self.parent.clearProfile()
 
     def deactivate(self):
         """ Reagowanie zmiany aktywności narzędzia """
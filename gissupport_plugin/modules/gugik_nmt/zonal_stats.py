@@ -0,0 +1,191 @@
+import os
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+
+from qgis.core import QgsCoordinateTransform, QgsGeometry, QgsRasterLayer, QgsRectangle, QgsTask
+from qgis.PyQt.QtCore import QUrl, pyqtSignal
+from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
+
+from gissupport_plugin.modules.data_downloader.nmpt.utils import coverage_url
+from gissupport_plugin.tools.http_client import HttpClient
+
+from .raster_source import CRS_2180, RasterHeightSource, numpy_library
+
+if numpy_library:
+    import numpy
+
+STATISTICS_FIELDS = ('nmt_min', 'nmt_max', 'nmt_sred', 'nmt_p10', 'nmt_med', 'nmt_p90')
+PERCENTILES = (10, 50, 90)
+# Maksymalny rozmiar macierzy wiersze x krawędzie przy rasteryzacji poligonu (ogranicza zużycie pamięci)
+MASK_CHUNK_CELLS = 4 * 1024 * 1024
+
+
+def polygon_edges(geometry: QgsGeometry):
+    """Krawędzie wszystkich pierścieni (zewnętrznych i wewnętrznych) poligonu jako tablice początków i końców"""
+    polygons = geometry.asMultiPolygon() if geometry.isMultipart() else [geometry.asPolygon()]
+    rings = [numpy.array([(point.x(), point.y()) for point in ring]) for polygon in polygons for ring in polygon
+             if len(ring) > 1]
+    if not rings:
+        return numpy.empty((0, 2)), numpy.empty((0, 2))
+    return numpy.concatenate([ring[:-1] for ring in rings]), numpy.concatenate([ring[1:] for ring in rings])
+
+
+def polygon_mask(starts, ends, extent: QgsRectangle, rows: int, columns: int):
+    """
+    Rasteryzacja poligonu (krawędzie z polygon_edges) do maski pikseli okna `extent` o wymiarach `rows` x `columns`
+    - piksel należy do poligonu, jeśli jego środek leży wewnątrz (reguła parzystości, więc otwory i części poligonu
+    nie wymagają osobnej obsługi). Dla środków wierszy wyznaczane są przecięcia z krawędziami, a każde przecięcie
+    zmienia przynależność pikseli leżących na prawo od niego (suma skumulowana w wierszu). Uwzględniane są tylko
+    krawędzie przecinające okno, a wiersze przetwarzane są porcjami (najwyżej MASK_CHUNK_CELLS par wiersz-krawędź).
+    """
+    pixel_width = extent.width() / columns
+    pixel_height = extent.height() / rows
+    inside_window = (numpy.maximum(starts[:, 1], ends[:, 1]) >= extent.yMinimum()) \
+        & (numpy.minimum(starts[:, 1], ends[:, 1]) <= extent.yMaximum())
+    starts, ends = starts[inside_window], ends[inside_window]
+
+    mask = numpy.zeros((rows, columns), dtype=bool)
+    chunk_rows = max(1, MASK_CHUNK_CELLS // max(1, len(starts)))
+    for first_row in range(0, rows, chunk_rows):
+        last_row = min(rows, first_row + chunk_rows)
+        centers_y = extent.yMaximum() - (numpy.arange(first_row, last_row) + 0.5) * pixel_height
+
+        crosses = (starts[:, 1] > centers_y[:, None]) != (ends[:, 1] > centers_y[:, None])
+        row_indexes, edge_indexes = numpy.nonzero(crosses)
+        x_start, y_start = starts[edge_indexes, 0], starts[edge_indexes, 1]
+        x_end, y_end = ends[edge_indexes, 0], ends[edge_indexes, 1]
+        crossings_x = x_start + (centers_y[row_indexes] - y_start) * (x_end - x_start) / (y_end - y_start)
+
+        first_columns = numpy.clip(numpy.ceil((crossings_x - extent.xMinimum()) / pixel_width - 0.5), 0, columns)
+        toggles = numpy.zeros((last_row - first_row, columns + 1), dtype=numpy.int32)
+        numpy.add.at(toggles, (row_indexes, first_columns.astype(numpy.int64)), 1)
+        mask[first_row:last_row] = numpy.cumsum(toggles, axis=1)[:, :columns] % 2 == 1
+    return mask
+
+
+def elevation_statistics(values) -> Optional[List[float]]:
+    """Minimum, maksimum, średnia i percentyle wysokości (w kolejności STATISTICS_FIELDS)"""
+    values = values[~numpy.isnan(values)]
+    if not values.size:
+        return
+    percentiles = numpy.percentile(values, PERCENTILES)
+    return [float(value) for value in (values.min(), values.max(), values.mean(dtype=numpy.float64), *percentiles)]
+
+
+def polygon_statistics(geometry: QgsGeometry, height_source) -> Optional[List[float]]:
+    """
+    Statystyki wysokości pikseli, których środki leżą w poligonie (geometria w układzie źródła wysokości).
+    Zasięg poligonu odczytywany jest pasami wierszy - w pamięci pozostają tylko wysokości pikseli poligonu.
+    """
+    starts, ends = polygon_edges(geometry)
+    # Poligon mniejszy od piksela - wysokość piksela, w którym leży punkt wewnątrz poligonu
+    point = geometry.pointOnSurface().asPoint()
+    values, point_value = [], None
+    for strip, extent in height_source.read_window(geometry.boundingBox()):
+        rows, columns = strip.shape
+        values.append(strip[polygon_mask(starts, ends, extent, rows, columns)].astype(numpy.float32))
+        if point_value is None and extent.contains(point):
+            row = min(rows - 1, max(0, int((extent.yMaximum() - point.y()) / (extent.height() / rows))))
+            column = min(columns - 1, max(0, int((point.x() - extent.xMinimum()) / (extent.width() / columns))))
+            point_value = strip[row, column:column + 1]
+
+    values = numpy.concatenate(values) if values else numpy.empty(0, dtype=numpy.float32)
+    if values.size:
+        return elevation_statistics(values)
+    if point_value is not None:
+        return elevation_statistics(point_value)
+
+
+class WcsHeightSource:
+    """
+    Wysokości z usługi WCS Geoportalu (NMT lub NMPT), pobierane osobno dla zasięgu każdego poligonu.
+    Udostępnia read_window() jak RasterHeightSource - model zapisywany jest strumieniowo do pliku tymczasowego,
+    otwieranego jako raster i usuwanego po odczycie wszystkich pasów.
+    """
+
+    # Limit powierzchni zasięgu jak w narzędziu NMPT (1000 ha)
+    MAX_AREA = 10000000
+
+    def __init__(self, data_format: str, datum_format: str = 'EVRF2007'):
+        self.data_format = data_format
+        self.datum_format = datum_format
+        self.crs = CRS_2180
+        self.resolution = 0.5 if data_format == 'DigitalSurfaceModel' else 1
+        self.suffix = '.tiff' if data_format == 'DigitalTerrainModelFormatTIFF' else '.asc'
+
+    def read_window(self, extent: QgsRectangle) -> Iterator[Tuple[object, QgsRectangle]]:
+        bbox = extent.buffered(self.resolution)
+        if bbox.area() > self.MAX_AREA:
+            return
+        request = QNetworkRequest(QUrl(coverage_url(self.data_format, self.datum_format, bbox)))
+        descriptor, path = tempfile.mkstemp(suffix=self.suffix)
+        os.close(descriptor)
+        reply = HttpClient.instance().download(request, path).result()
+        reply.deleteLater()
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            os.remove(path)
+            return
+
+        try:
+            layer = QgsRasterLayer(path, 'wcs', 'gdal')
+            if not RasterHeightSource.is_available(layer):
+                return
+            layer.setCrs(CRS_2180)
+            yield from RasterHeightSource(layer).read_window(extent)
+        finally:
+            layer = None
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ZonalStatisticsBatch(QgsTask):
+    """Obliczenie statystyk dla części poligonów - jedno z zadań podrzędnych ZonalStatisticsTask"""
+
+    def __init__(self, description: str, features: List[Tuple[int, QgsGeometry]],
+                 transform: QgsCoordinateTransform, height_source):
+        super().__init__(description, QgsTask.Flag.CanCancel)
+        self.features = features
+        self.transform = transform
+        self.height_source = height_source
+        self.results = {}
+
+    def run(self):
+        total = len(self.features) or 1
+        for index, (fid, geometry) in enumerate(self.features):
+            if self.isCanceled():
+                return False
+            geometry.transform(self.transform)
+            self.results[fid] = polygon_statistics(geometry, self.height_source)
+            self.setProgress((index + 1) * 100 / total)
+        return True
+
+
+class ZonalStatisticsTask(QgsTask):
+    """
+    Statystyki wysokości (min, max, średnia, percentyle) dla poligonów. Poligony dzielone są na części liczone
+    równolegle w zadaniach podrzędnych (każde z własnym źródłem wysokości), a wyniki przekazywane są sygnałem
+    `calculated` w wątku głównym, po zakończeniu wszystkich części.
+    """
+
+    calculated = pyqtSignal(dict)
+
+    def __init__(self, description: str, batches: List[Tuple[list, QgsCoordinateTransform, object]]):
+        super().__init__(description, QgsTask.Flag.CanCancel)
+        self.batches = []
+        for index, (features, transform, height_source) in enumerate(batches, 1):
+            batch = ZonalStatisticsBatch(f'{description} ({index}/{len(batches)})', features, transform, height_source)
+            self.addSubTask(batch, [], QgsTask.SubTaskDependency.ParentDependsOnSubTask)
+            self.batches.append(batch)
+
+    def run(self):
+        return not self.isCanceled()
+
+    def finished(self, result: bool):
+        if not result:
+            return
+        results = {}
+        for batch in self.batches:
+            results.update(batch.results)
+        self.calculated.emit(results)
@@ -10,8 +10,10 @@ from gissupport_plugin.modules.uldk.modules.map_point_search.main import MapPoin
 from gissupport_plugin.modules.uldk.modules.layer_import.main import LayerImport
 from gissupport_plugin.modules.uldk.modules.teryt_search.main import TerytSearch
 from gissupport_plugin.modules.uldk.modules.from_csv_file.main import FromCSVFile
+from gissupport_plugin.modules.uldk.modules.request_stats.main import RequestStatsDialog
 from gissupport_plugin.modules.uldk.plugin_dockwidget import wyszukiwarkaDzialekDockWidget
 from gissupport_plugin.modules.uldk.resources import resources
+from gissupport_plugin.modules.uldk.uldk.api import ULDKSearchLogger
 from gissupport_plugin.modules.uldk.uldk.resultcollector import ResultCollectorSingle
 
 class Main(BaseModule):
@@ -22,6 +24,8 @@ class Main(BaseModule):
 
         self.canvas = iface.mapCanvas()
         self.dockwidget = wyszukiwarkaDzialekDockWidget()
+        ULDKSearchLogger.load_settings()
+        self.request_stats_dialog = None
 
         collector = ResultCollectorSingle(self)
 
@@ -55,6 +59,12 @@ class Main(BaseModule):
             "Wybierz narzędzie i kliknij na mapę.\n"
             "Narzędzie wyszuka działkę, w której zawierają się współrzędne kliknięcia."))
 
+        self.dockwidget.checkbox_map_point_search_prefetch.setChecked(self.module_map_point_search.prefetch_enabled)
+        self.dockwidget.checkbox_map_point_search_prefetch.toggled.connect(
+            self.module_map_point_search.set_prefetch_enabled)
+
+        self.dockwidget.btnRequestStats.clicked.connect(self.show_request_stats)
+
         self.dockwidget.labelLayerInfo.setPixmap(QPixmap(icon_info_path))
         #Zarejestrowanie we wtyczce
 
@@ -86,6 +96,12 @@ class Main(BaseModule):
         """ Wyłączenie modułu """
         iface.removeDockWidget(self.dockwidget)
 
+    def show_request_stats(self):
+        if self.request_stats_dialog is None:
+            self.request_stats_dialog = RequestStatsDialog()
+        self.request_stats_dialog.show()
+        self.request_stats_dialog.raise_()
+
     def toggle_map_point_search_tool(self, checked):
         """
         Włącza/wyłącza narzędzie identyfikacji działek w zależności od stanu akcji.
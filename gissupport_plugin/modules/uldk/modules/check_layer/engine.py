@@ -0,0 +1,200 @@
+import hashlib
+import os
+import sqlite3
+import time
+from urllib.error import HTTPError
+
+from qgis.PyQt.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+from qgis.core import QgsApplication, QgsFeature, QgsPointXY
+
+from gissupport_plugin.modules.uldk.uldk.api import ULDKPoint, NotFoundException, RequestException
+from gissupport_plugin.modules.uldk.uldk.metrics import ULDK_METRICS
+from gissupport_plugin.modules.uldk.uldk.parcel_index import ParcelIndex
+
+CACHE_PATH = os.path.join(QgsApplication.qgisSettingsDirPath(), "gissupport", "uldk_check_layer.sqlite")
+
+# Po tym czasie (w sekundach) odpowiedź ULDK zapisana dla obiektu jest pobierana ponownie
+CACHE_MAX_AGE = 7 * 24 * 3600
+
+STATUS_OK = "ok"
+STATUS_MISMATCH = "niezgodność"
+STATUS_NOT_FOUND = "brak"
+
+
+def feature_hash(feature: QgsFeature, crs_authid: str = "") -> str:
+    """
+    Skrót treści obiektu używany do wykrywania zmian pomiędzy sprawdzeniami.
+    Wynik sprawdzenia zależy wyłącznie od geometrii, dlatego atrybuty nie są uwzględniane.
+    """
+    geometry_hash = hashlib.sha1(crs_authid.encode())
+    geometry_hash.update(bytes(feature.geometry().asWkb()))
+    return geometry_hash.hexdigest()
+
+
+class VerificationCache:
+
+    """
+    Baza SQLite z wynikami sprawdzeń warstw:
+    - responses - odpowiedzi ULDK dla skrótów obiektów (pusty napis - brak działki),
+    - statuses - wyniki ostatniego sprawdzenia obiektów warstwy, na potrzeby raportu zmian.
+    Obiekt musi być używany w wątku, w którym został utworzony.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_age: float = CACHE_MAX_AGE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_age = max_age
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                hash TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                checked_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS statuses (
+                layer TEXT NOT NULL,
+                fid INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                teryt TEXT,
+                PRIMARY KEY (layer, fid)
+            );
+        """)
+
+    def get_response(self, feature_hash: str):
+        row = self.connection.execute(
+            "SELECT response FROM responses WHERE hash = ? AND checked_at >= ?",
+            (feature_hash, time.time() - self.max_age)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_responses(self, responses):
+        """Zapisuje pary (skrót, odpowiedź) w jednej transakcji"""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO responses (hash, response, checked_at) VALUES (?, ?, ?)",
+                ((feature_hash, response, now) for feature_hash, response in responses)
+            )
+
+    def get_statuses(self, layer: str) -> dict:
+        rows = self.connection.execute("SELECT fid, status, teryt FROM statuses WHERE layer = ?", (layer,))
+        return {fid: (status, teryt) for fid, status, teryt in rows}
+
+    def set_statuses(self, layer: str, statuses: dict, replace: bool = True):
+        """
+        :param statuses: słownik {fid: (status, teryt)}
+        :param replace: usunięcie wcześniejszych wyników warstwy (False przy sprawdzaniu zaznaczonych obiektów)
+        """
+        with self.connection:
+            if replace:
+                self.connection.execute("DELETE FROM statuses WHERE layer = ?", (layer,))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO statuses (layer, fid, status, teryt) VALUES (?, ?, ?, ?)",
+                ((layer, fid, status, teryt) for fid, (status, teryt) in statuses.items())
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class CheckLayerWorker(QObject):
+
+    """
+    Wyszukuje działki dla punktów sprawdzanych obiektów, ograniczając liczbę zapytań do ULDK:
+    - obiekty, których geometria nie zmieniła się od poprzedniego sprawdzenia, otrzymują zapisaną odpowiedź,
+    - punkty leżące w działce znalezionej już w trakcie sprawdzania nie są wysyłane do ULDK.
+    Sygnały są zgodne z ULDKSearchPointWorker i emitowane w kolejności punktów.
+    """
+
+    found = pyqtSignal(str)
+    not_found = pyqtSignal(ULDKPoint, Exception)
+    finished = pyqtSignal()
+    interrupted = pyqtSignal()
+    # liczba odpowiedzi z pamięci podręcznej, z indeksu działek oraz z ULDK
+    statistics = pyqtSignal(int, int, int)
+
+    SAVE_BATCH_SIZE = 500
+
+    def __init__(self, uldk_point_search, uldk_points, feature_hashes, use_cache=True, cache_path=CACHE_PATH):
+        super().__init__()
+        self.uldk_search = uldk_point_search
+        self.points = uldk_points
+        self.feature_hashes = feature_hashes
+        self.use_cache = use_cache
+        self.cache_path = cache_path
+
+    @pyqtSlot()
+    def search(self):
+        cache = VerificationCache(self.cache_path)
+        parcel_index = ParcelIndex(max_size=50000)
+        new_responses = []
+        cached_count = indexed_count = queried_count = 0
+
+        try:
+            for point, point_hash in zip(self.points, self.feature_hashes):
+                if QThread.currentThread().isInterruptionRequested():
+                    cache.set_responses(new_responses)
+                    self.record_metrics(cached_count, indexed_count, queried_count)
+                    self.interrupted.emit()
+                    return
+
+                response = cache.get_response(point_hash) if self.use_cache else None
+                if response is not None:
+                    cached_count += 1
+                else:
+                    response = parcel_index.find(QgsPointXY(point.x, point.y))
+                    if response is not None:
+                        indexed_count += 1
+                    else:
+                        queried_count += 1
+                        try:
+                            response = self.uldk_search.search(point)
+                        except NotFoundException as e:
+                            new_responses.append((point_hash, ""))
+                            self.not_found.emit(point, e)
+                            continue
+                        except (HTTPError, RequestException) as e:
+                            # Błędy połączenia nie są zapisywane - obiekt zostanie sprawdzony ponownie
+                            self.not_found.emit(point, e)
+                            continue
+                    new_responses.append((point_hash, response))
+
+                if response:
+                    parcel_index.add(response)
+                    self.found.emit(response)
+                else:
+                    self.not_found.emit(point, NotFoundException("Brak działki (poprzednie sprawdzenie)"))
+
+                if len(new_responses) >= self.SAVE_BATCH_SIZE:
+                    cache.set_responses(new_responses)
+                    new_responses = []
+
+            cache.set_responses(new_responses)
+        finally:
+            cache.close()
+
+        self.record_metrics(cached_count, indexed_count, queried_count)
+        self.finished.emit()
+
+    def record_metrics(self, cached_count, indexed_count, queried_count):
+        self.statistics.emit(cached_count, indexed_count, queried_count)
+        ULDK_METRICS.record_cache("check_layer", True, cached_count + indexed_count)
+        ULDK_METRICS.record_cache("check_layer", False, queried_count)
+
+
+def mismatch_report(previous_statuses: dict, current_statuses: dict) -> dict:
+    """
+    Porównuje wyniki dwóch sprawdzeń warstwy ({fid: (status, teryt)}).
+    Zwraca listy identyfikatorów obiektów z nowymi, ustąpionymi i utrzymującymi się niezgodnościami
+    oraz obiektów, dla których zmieniła się przypisana działka.
+    """
+    report = {"new": [], "resolved": [], "persisting": [], "parcel_changed": []}
+    for fid, (status, teryt) in current_statuses.items():
+        previous = previous_statuses.get(fid)
+        previous_status, previous_teryt = previous if previous else (None, None)
+        if status == STATUS_MISMATCH:
+            report["persisting" if previous_status == STATUS_MISMATCH else "new"].append(fid)
+        elif previous_status == STATUS_MISMATCH:
+            report["resolved"].append(fid)
+        if previous and teryt and previous_teryt and teryt != previous_teryt:
+            report["parcel_changed"].append(fid)
+    return report
@@ -8,8 +8,11 @@ from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform,
                        QgsProject, QgsVectorLayer, QgsField, QgsFeature, NULL, QgsMessageLog, Qgis)
 from qgis.utils import iface
 
-from gissupport_plugin.modules.uldk.uldk.api import ULDKPoint, ULDKSearchLogger, ULDKSearchPoint, ULDKSearchPointWorker
+from gissupport_plugin.tools.logger import LOG_BUFFER
+from gissupport_plugin.modules.uldk.uldk.api import ULDKPoint, ULDKSearchLogger, ULDKSearchPoint
 from gissupport_plugin.modules.uldk.uldk.resultcollector import ResultCollector
+from gissupport_plugin.modules.uldk.modules.check_layer.engine import (CheckLayerWorker, VerificationCache,
+    feature_hash, mismatch_report, STATUS_OK, STATUS_MISMATCH, STATUS_NOT_FOUND)
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), "main_base.ui"
@@ -61,6 +64,10 @@ class UI(QtWidgets.QFrame, FORM_CLASS):
         self.label_info_icon.setToolTip((
             "Narzędzie sprawdza dopasowanie geometrii warstwy źródłowej do obiektów w ULDK."))
 
+        self.checkbox_incremental.setToolTip((
+            "Obiekty, których geometria nie zmieniła się od poprzedniego sprawdzenia (nie dawniej niż 7 dni temu),\n"
+            "otrzymają zapisany wynik bez ponownego odpytywania ULDK."))
+
 
 class CheckLayer:
 
@@ -73,7 +80,9 @@ class CheckLayer:
         self.output_responses = []
         self.output_responses_features = []
         self.query_points = []
+        self.feature_hashes = []
         self.source_layer = None
+        self.search_statistics = (0, 0, 0)
 
         self.search_in_progress = False
         self.__init_ui()
@@ -148,6 +157,7 @@ class CheckLayer:
         self.output_responses = []
         self.output_responses_features = []
         self.query_points = []
+        self.feature_hashes = []
 
         uldk_search = ULDKSearchPoint(
             "dzialka",
@@ -157,6 +167,7 @@ class CheckLayer:
 
         source_crs = self.source_layer.sourceCrs()
         transformation = QgsCoordinateTransform(source_crs, CRS_2180, QgsCoordinateTransformContext())
+        crs_authid = source_crs.authid()
 
         features = self.source_layer.getSelectedFeatures() if bool(self.ui.checkbox_selected_only.isChecked()) else self.source_layer.getFeatures()
         for feature in features:
@@ -167,11 +178,14 @@ class CheckLayer:
                 query_point.transform(transformation)
 
             self.output_responses_features.append(output_feature)
+            self.feature_hashes.append(feature_hash(feature, crs_authid))
 
             uldk_point = ULDKPoint(query_point.asPoint().x(), query_point.asPoint().y(), 2180)
             self.query_points.append(uldk_point)
 
-        worker = ULDKSearchPointWorker(uldk_search, self.query_points)
+        worker = CheckLayerWorker(uldk_search, self.query_points, self.feature_hashes,
+                                  self.ui.checkbox_incremental.isChecked())
+        worker.statistics.connect(self.__handle_statistics)
         self.worker = worker
         thread = QThread()
         self.thread = thread
@@ -189,6 +203,9 @@ class CheckLayer:
 
         thread.start()
 
+    def __handle_statistics(self, cached_count, indexed_count, queried_count):
+        self.search_statistics = (cached_count, indexed_count, queried_count)
+
     def __handle_found(self, uldk_response_row):
         self.output_responses.append(uldk_response_row)
         self.progressed_count += 1
@@ -251,10 +268,14 @@ class CheckLayer:
         source_crs = self.source_layer.sourceCrs()
         transformation = QgsCoordinateTransform(source_crs, CRS_2180, QgsCoordinateTransformContext())
 
+        output_transformation = QgsCoordinateTransform(CRS_2180, source_crs, QgsCoordinateTransformContext())
+
         area_difference_tolerance = self.ui.input_percent.value()
+        statuses = {}
 
         for idx, feature in enumerate(self.output_responses):
             if self.output_responses[idx] == '':
+                statuses[self.output_responses_features[idx].id()] = (STATUS_NOT_FOUND, None)
                 continue
 
             current_feature = self.output_responses_features[idx]
@@ -276,9 +297,11 @@ class CheckLayer:
             area_difference_percent = (area_difference / geometry.area()) * 100
 
             if area_difference_percent <= area_difference_tolerance:
-                attributes.append("ok")
+                status = STATUS_OK
             else:
-                attributes.append("niezgodność")
+                status = STATUS_MISMATCH
+            attributes.append(status)
+            statuses[current_feature.id()] = (status, current_uldk_feature["teryt"])
 
             current_feature.setAttributes(
                 attributes
@@ -286,7 +309,6 @@ class CheckLayer:
 
             new_geometry = current_uldk_feature.geometry()
             if source_crs != CRS_2180:
-                output_transformation = QgsCoordinateTransform(CRS_2180, source_crs, QgsCoordinateTransformContext())
                 new_geometry.transform(output_transformation)
 
             current_feature.setGeometry(new_geometry)
@@ -294,3 +316,37 @@ class CheckLayer:
             output_data_provider.addFeature(current_feature)
 
         QgsProject.instance().addMapLayer(output_layer)
+
+        self.report_changes(statuses)
+
+    def report_changes(self, statuses):
+        """Porównuje wyniki z poprzednim sprawdzeniem warstwy i zapisuje bieżące wyniki"""
+        layer_key = self.source_layer.source()
+        cache = VerificationCache()
+        try:
+            previous_statuses = cache.get_statuses(layer_key)
+            cache.set_statuses(layer_key, statuses, replace=not self.ui.checkbox_selected_only.isChecked())
+        finally:
+            cache.close()
+
+        cached_count, indexed_count, queried_count = self.search_statistics
+        LOG_BUFFER.log(
+            f"Sprawdzenie warstwy {self.source_layer.name()}: odpowiedzi z poprzednich sprawdzeń: {cached_count}, "
+            f"z działek znalezionych wcześniej: {indexed_count}, zapytania do ULDK: {queried_count}",
+            "Wtyczka ULDK", Qgis.MessageLevel.Info)
+
+        if not previous_statuses:
+            return
+
+        report = mismatch_report(previous_statuses, statuses)
+        for key, description in (("new", "Nowe niezgodności"), ("resolved", "Usunięte niezgodności"),
+                                 ("parcel_changed", "Zmiana działki")):
+            if report[key]:
+                LOG_BUFFER.log(
+                    f"{description} (id obiektów): {', '.join(str(fid) for fid in report[key])}",
+                    "Wtyczka ULDK", Qgis.MessageLevel.Info)
+
+        iface.messageBar().pushInfo("Wtyczka GIS Support", (
+            f"Zmiany względem poprzedniego sprawdzenia: nowe niezgodności: {len(report['new'])}, "
+            f"usunięte: {len(report['resolved'])}, utrzymujące się: {len(report['persisting'])}, "
+            f"zmiana działki: {len(report['parcel_changed'])}. Szczegóły w dzienniku komunikatów."))
@@ -1,14 +1,26 @@
-from qgis.PyQt.QtCore import Qt, QThread, pyqtSignal
+from qgis.PyQt.QtCore import Qt, QThread, QTimer, pyqtSignal, QSettings
 from qgis.PyQt.QtGui import QCursor
-from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform,
-                       QgsCoordinateTransformContext, QgsFeature, QgsPoint)
+from qgis.core import QgsCoordinateReferenceSystem, QgsFeature, QgsPoint, QgsPointXY
 from qgis.gui import QgsMapToolEmitPoint
 from qgis.utils import iface
 
-from ...uldk.api import ULDKSearchLogger, ULDKSearchPoint, ULDKSearchPointWorker, ULDKPoint
+from gissupport_plugin.tools.transforms import get_transform
+from ...uldk.api import ULDKSearchLogger, ULDKSearchPoint, ULDKSearchPointWorker, ULDKPoint, ULDKSearchBudget
+from ...uldk.api_limits import RateLimitDecorator
+from ...uldk.metrics import ULDK_METRICS
+from ...uldk.parcel_index import ParcelIndex
 
 CRS_2180 = QgsCoordinateReferenceSystem.fromEpsgId(2180)
 
+PREFETCH_SETTINGS_KEY = "gissupport/uldk/map_point_search_prefetch"
+# Siatka punktów, pod którymi pobierane są działki widocznego obszaru mapy
+PREFETCH_GRID_SIZE = 4
+# Wstępne pobieranie działek ma sens tylko przy dużych skalach (obszar w m2, EPSG:2180)
+PREFETCH_MAX_EXTENT_AREA = 4_000_000
+# Część wspólnego limitu ULDK (5 zapytań / 3 s) przeznaczona na pobieranie w tle
+PREFETCH_BUDGET_CALLS = 2
+PREFETCH_BUDGET_PERIOD = 3
+
 class MapPointSearch(QgsMapToolEmitPoint):
 
     icon_path = ':/plugins/plugin/intersect.png'
@@ -23,25 +35,76 @@ class MapPointSearch(QgsMapToolEmitPoint):
 
         self.search_in_progress = False
 
+        self.parcel_index = ParcelIndex()
+        self.prefetch_enabled = QSettings().value(PREFETCH_SETTINGS_KEY, False, type=bool)
+        # Wątki pobierania w tle (wątek: worker) - przechowywane do czasu ich zakończenia
+        self.prefetch_jobs = {}
+        # Limit zapytań wspólny dla wszystkich zadań pobierania w tle - przerwane zadanie może jeszcze
+        # kończyć zapytanie, gdy po przesunięciu mapy rusza kolejne
+        self.prefetch_budget = RateLimitDecorator(calls = PREFETCH_BUDGET_CALLS, period = PREFETCH_BUDGET_PERIOD)
+        # Pobieranie rusza dopiero, gdy użytkownik przestanie przesuwać mapę
+        self.prefetch_timer = QTimer()
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(1000)
+        self.prefetch_timer.timeout.connect(self.__prefetch)
+
+    def activate(self):
+        super().activate()
+        self.canvas.extentsChanged.connect(self.prefetch_timer.start)
+        if self.prefetch_enabled:
+            self.prefetch_timer.start()
+
+    def deactivate(self):
+        try:
+            self.canvas.extentsChanged.disconnect(self.prefetch_timer.start)
+        except TypeError:
+            pass #w przypadku braku przypiętych slotów rzuca wyjątkiem
+        self.prefetch_timer.stop()
+        self.__stop_prefetch()
+        super().deactivate()
+
+    def set_prefetch_enabled(self, enabled):
+        """Włącza/wyłącza wstępne pobieranie działek z widocznego obszaru mapy"""
+        self.prefetch_enabled = bool(enabled)
+        QSettings().setValue(PREFETCH_SETTINGS_KEY, self.prefetch_enabled)
+        if not self.prefetch_enabled:
+            self.prefetch_timer.stop()
+            self.__stop_prefetch()
+        elif self.canvas.mapTool() is self:
+            self.prefetch_timer.start()
+
+    @staticmethod
+    def create_uldk_search():
+        uldk_search = ULDKSearchPoint(
+            "dzialka",
+            ("geom_wkt", "wojewodztwo", "powiat", "gmina", "obreb","numer","teryt")
+        )
+        return ULDKSearchLogger(uldk_search)
+
+    def __transform_to_2180(self):
+        canvas_crs = self.canvas.mapSettings().destinationCrs()
+        if canvas_crs != CRS_2180:
+            return get_transform(canvas_crs, CRS_2180)
+
     def __search(self, point):
         if self.search_in_progress:
             return
 
-        canvas_crs = self.canvas.mapSettings().destinationCrs()
-        if canvas_crs != CRS_2180:
-            transformation = QgsCoordinateTransform(canvas_crs, CRS_2180, QgsCoordinateTransformContext()) 
+        transformation = self.__transform_to_2180()
+        if transformation:
             point = transformation.transform(point)
 
         x = point.x()
         y = point.y()
         srid = 2180
 
-        uldk_search = ULDKSearchPoint(
-            "dzialka",
-            ("geom_wkt", "wojewodztwo", "powiat", "gmina", "obreb","numer","teryt")
-        )
+        uldk_response_row = self.parcel_index.find(QgsPointXY(x, y))
+        ULDK_METRICS.record_cache("map_point_search", bool(uldk_response_row))
+        if uldk_response_row:
+            self.__handle_found(uldk_response_row)
+            return
 
-        uldk_search = ULDKSearchLogger(uldk_search)
+        uldk_search = self.create_uldk_search()
         uldk_point = ULDKPoint(x,y,srid)
         worker = ULDKSearchPointWorker(uldk_search, (uldk_point,))
         self.worker = worker
@@ -58,6 +121,7 @@ class MapPointSearch(QgsMapToolEmitPoint):
         thread.start()
 
     def __handle_found(self, uldk_response_row):
+        self.parcel_index.add(uldk_response_row)
         try:
             added_feature = self.result_collector.update(uldk_response_row)
         except self.result_collector.BadGeometryException:
@@ -80,6 +144,50 @@ class MapPointSearch(QgsMapToolEmitPoint):
         self.setCursor(Qt.CursorShape.WaitCursor)
         # self.search_started.emit()
 
+    def __prefetch(self):
+        if not self.prefetch_enabled or self.canvas.mapTool() is not self:
+            return
+        self.__stop_prefetch()
+
+        extent = self.canvas.extent()
+        transformation = self.__transform_to_2180()
+        if transformation:
+            extent = transformation.transformBoundingBox(extent)
+        if extent.area() > PREFETCH_MAX_EXTENT_AREA:
+            return
+
+        step_x = extent.width() / PREFETCH_GRID_SIZE
+        step_y = extent.height() / PREFETCH_GRID_SIZE
+        uldk_points = []
+        for i in range(PREFETCH_GRID_SIZE):
+            for j in range(PREFETCH_GRID_SIZE):
+                x = extent.xMinimum() + (i + 0.5) * step_x
+                y = extent.yMinimum() + (j + 0.5) * step_y
+                if not self.parcel_index.find(QgsPointXY(x, y)):
+                    uldk_points.append(ULDKPoint(x, y, 2180))
+        if not uldk_points:
+            return
+
+        uldk_search = ULDKSearchBudget(self.create_uldk_search(), self.prefetch_budget)
+        worker = ULDKSearchPointWorker(uldk_search, uldk_points)
+        thread = QThread()
+        self.prefetch_jobs[thread] = worker
+        worker.moveToThread(thread)
+        thread.started.connect(worker.search)
+        # Brak działki pod punktem siatki nie jest zgłaszany użytkownikowi
+        worker.found.connect(self.parcel_index.add)
+        worker.finished.connect(lambda thread=thread, worker=worker: self.__prefetch_cleanup(thread, worker))
+        worker.interrupted.connect(lambda thread=thread, worker=worker: self.__prefetch_cleanup(thread, worker))
+        thread.start()
+
+    def __stop_prefetch(self):
+        for thread in self.prefetch_jobs:
+            thread.requestInterruption()
+
+    def __prefetch_cleanup(self, thread, worker):
+        self.prefetch_jobs.pop(thread, None)
+        self.__thread_cleanup(thread, worker)
+
     def __thread_cleanup(self, thread, worker):
         thread.quit()
         thread.wait()
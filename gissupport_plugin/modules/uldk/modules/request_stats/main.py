@@ -0,0 +1,123 @@
+import os
+
+from qgis.PyQt import uic
+from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QTableWidgetItem
+from qgis.utils import iface
+
+from gissupport_plugin.modules.uldk.uldk.api import ULDKSearchLogger
+from gissupport_plugin.modules.uldk.uldk.metrics import ULDK_METRICS
+
+FORM_CLASS, _ = uic.loadUiType(os.path.join(
+    os.path.dirname(__file__), "main_base.ui"
+))
+
+COLUMNS = (
+    ("Typ zapytania", None),
+    ("Zapytania", "requests"),
+    ("Błędy", "errors"),
+    ("Ponowienia", "retries"),
+    ("Średni czas [ms]", "latency_avg_ms"),
+    ("p50 [ms]", "latency_p50_ms"),
+    ("p95 [ms]", "latency_p95_ms"),
+    ("Maks. czas [ms]", "latency_max_ms"),
+    ("Pobrano [kB]", "bytes"),
+    ("Oczekiwanie na limit [s]", "rate_limit_sleep_s"),
+)
+
+CACHE_COLUMNS = (
+    ("Pamięć podręczna", None),
+    ("Trafienia", "hits"),
+    ("Chybienia", "misses"),
+    ("Skuteczność [%]", "hit_ratio"),
+)
+
+STAGE_COLUMNS = (
+    ("Etap", None),
+    ("Wywołania", "calls"),
+    ("Obiekty", "items"),
+    ("Łączny czas [s]", "duration_total_s"),
+    ("Średni czas [ms]", "duration_avg_ms"),
+    ("Maks. czas [ms]", "duration_max_ms"),
+)
+
+CACHE_NAMES = {
+    "negative_cache": "Działki nieznalezione w ULDK",
+    "map_point_search": "Działki wskazane na mapie",
+    "check_layer": "Sprawdzanie warstwy",
+}
+
+STAGE_NAMES = {
+    "parse": "Parsowanie odpowiedzi",
+    "layer_write": "Zapis do warstwy",
+}
+
+
+class RequestStatsDialog(QDialog, FORM_CLASS):
+    """
+    Okno ze statystykami zapytań do ULDK zebranymi od uruchomienia QGIS.
+    """
+
+    def __init__(self, parent=None):
+        super(RequestStatsDialog, self).__init__(parent=parent or iface.mainWindow())
+        self.setupUi(self)
+
+        for table, columns in ((self.table_stats, COLUMNS), (self.table_caches, CACHE_COLUMNS),
+                               (self.table_stages, STAGE_COLUMNS)):
+            table.setColumnCount(len(columns))
+            table.setHorizontalHeaderLabels([label for label, _ in columns])
+
+        self.checkbox_log_requests.setChecked(ULDKSearchLogger.log_requests)
+        self.spinbox_log_sample_rate.setValue(ULDKSearchLogger.log_sample_rate)
+        self.spinbox_log_sample_rate.setEnabled(ULDKSearchLogger.log_requests)
+        self.checkbox_log_requests.toggled.connect(self.save_logging_settings)
+        self.spinbox_log_sample_rate.valueChanged.connect(self.save_logging_settings)
+
+        self.button_refresh.clicked.connect(self.refresh)
+        self.button_reset.clicked.connect(self.reset)
+        self.button_export.clicked.connect(self.export_to_json)
+        self.button_close.clicked.connect(self.hide)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def refresh(self):
+        stats = ULDK_METRICS.as_dict()
+        self.label_since.setText(f"Statystyki od: {stats['started_at']}")
+
+        self.fill_table(self.table_stats, COLUMNS, stats["request_types"])
+        self.fill_table(self.table_caches, CACHE_COLUMNS, stats["caches"], CACHE_NAMES)
+        self.fill_table(self.table_stages, STAGE_COLUMNS, stats["stages"], STAGE_NAMES)
+
+    @staticmethod
+    def fill_table(table, columns, rows, names=None):
+        table.setRowCount(len(rows))
+        for row, (name, metrics) in enumerate(rows.items()):
+            for column, (_, key) in enumerate(columns):
+                if key is None:
+                    value = (names or {}).get(name, name)
+                elif key == "bytes":
+                    value = round(metrics[key] / 1024, 1)
+                else:
+                    value = metrics[key]
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
+
+    def reset(self):
+        ULDK_METRICS.reset()
+        self.refresh()
+
+    def save_logging_settings(self, *args):
+        log_requests = self.checkbox_log_requests.isChecked()
+        self.spinbox_log_sample_rate.setEnabled(log_requests)
+        ULDKSearchLogger.save_settings(log_requests, self.spinbox_log_sample_rate.value())
+
+    def export_to_json(self):
+        path, _ = QFileDialog.getSaveFileName(filter='*.json')
+        if not path:
+            return
+        if not path.endswith(".json"):
+            path += ".json"
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(ULDK_METRICS.to_json())
+        iface.messageBar().pushSuccess("Wtyczka GIS Support", f"Zapisano statystyki zapytań do pliku {path}")
@@ -1,14 +1,19 @@
 import os
 from itertools import chain
+from urllib.error import HTTPError
 
 from qgis.PyQt import QtWidgets, uic
-from qgis.PyQt.QtCore import Qt, QThread, pyqtSignal, QObject
-from qgis.PyQt.QtGui import QKeySequence, QPixmap
+from qgis.PyQt.QtCore import Qt, QThread, pyqtSignal, pyqtSlot, QObject
+from qgis.PyQt.QtGui import QKeySequence, QPixmap, QStandardItem, QStandardItemModel
+from qgis.core import QgsApplication
 from qgis.gui import QgsMessageBarItem
 from qgis.utils import iface
 
-from ...uldk.api import ULDKSearchTeryt, ULDKSearchParcel, ULDKSearchLogger, ULDKSearchWorker
+from gissupport_plugin.tools.teryt import POWIATY
+from ...uldk.api import ULDKSearchTeryt, ULDKSearchParcel, ULDKSearchLogger, ULDKSearchWorker, RequestException, \
+    ULDKSearchParallelWorker, ULDK_NEGATIVE_CACHE
 from ...uldk.resultcollector import ResultCollectorMultiple
+from ...uldk.search_index import AdministrativeIndex
 from ...uldk import validators
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
@@ -35,11 +40,53 @@ class UI(QtWidgets.QFrame, FORM_CLASS):
         self.label_info_precinct_unknown.setToolTip(("Wyszukanie zostaną działki na terenie całej gminy, co może być czasochłonne."))
         self.label_info_parcel_id.setPixmap(QPixmap(self.icon_info_path))
         self.label_info_parcel_id.setToolTip("Numer działki można podać z numerem arkusza mapy ewidencyjnej np. AR_1.2")
+        self.label_info_quick_search.setPixmap(QPixmap(self.icon_info_path))
+        self.label_info_quick_search.setToolTip(("Wpisz fragment nazwy gminy lub obrębu (polskie znaki nie są wymagane)\n"
+            "albo początek kodu TERYT. Wybranie podpowiedzi uzupełni listy poniżej.\n"
+            "Przy pierwszym użyciu lista gmin pobierana jest w tle, obręby dodawane są po wczytaniu gminy."))
+        self.completer_quick_search = QtWidgets.QCompleter(self)
+        self.completer_quick_search.setCompletionMode(QtWidgets.QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.completer_quick_search.setModel(QStandardItemModel(self.completer_quick_search))
+        self.lineedit_quick_search.setCompleter(self.completer_quick_search)
         self.progress_bar_precinct_unknown.hide()
         target_layout.layout().addWidget(self)
 
+class AdministrativeIndexWorker(QObject):
+
+    """
+    Pobiera w tle listy gmin powiatów do indeksu szybkiego wyszukiwania. Sygnał `finished` przekazuje,
+    czy pobrano gminy wszystkich powiatów (bez błędów i bez przerwania).
+    """
+
+    loaded = pyqtSignal(str, str, list)
+    finished = pyqtSignal(bool)
+
+    def __init__(self, counties):
+        super().__init__()
+        self.counties = counties
+
+    @pyqtSlot()
+    def load(self):
+        search = ULDKSearchLogger(ULDKSearchTeryt("gmina", ("nazwa", "teryt")))
+        failed = 0
+        for county in self.counties:
+            if QThread.currentThread().isInterruptionRequested():
+                self.finished.emit(False)
+                return
+            county_name, county_teryt = [part.strip() for part in county.split("|")]
+            try:
+                rows = search.search(county_teryt)
+            except (HTTPError, RequestException):
+                failed += 1
+                continue
+            self.loaded.emit("gmina", county_name, [row.replace("|", " | ") for row in rows])
+        self.finished.emit(not failed)
+
+
 class TerytSearch(QObject):
 
+    QUICK_SEARCH_LIMIT = 15
+
     def __init__(self, parent, target_layout, result_collector):
         super().__init__()
         self.parent = parent
@@ -51,12 +98,19 @@ class TerytSearch(QObject):
         self.provinces_downloaded = False
 
         self.message_bar_item = None
+        self.administrative_index = AdministrativeIndex.load(
+            os.path.join(QgsApplication.qgisSettingsDirPath(), "gissupport", "uldk_administratives.json"))
+        self.administrative_index_thread = None
+        self.quick_search_results = {}
         self.__init_ui()
 
-        self.uldk_search = ULDKSearchParcel("dzialka",
-             ("geom_wkt", "wojewodztwo", "powiat", "gmina", "obreb","numer","teryt"))
+        self.uldk_search = self.create_uldk_search()
 
-        self.uldk_search = ULDKSearchLogger(self.uldk_search)
+    @staticmethod
+    def create_uldk_search():
+        uldk_search = ULDKSearchParcel("dzialka",
+             ("geom_wkt", "wojewodztwo", "powiat", "gmina", "obreb","numer","teryt"))
+        return ULDKSearchLogger(uldk_search)
 
     def search(self, teryt):
         if self.ui.checkbox_precinct_unknown.isChecked():
@@ -69,7 +123,13 @@ class TerytSearch(QObject):
         self.ui.button_search_uldk.setEnabled(False)
         self.ui.button_search_uldk.setText("Wyszukiwanie...")
 
-        self.uldk_search_worker = ULDKSearchWorker(self.uldk_search, teryts)
+        if self.ui.checkbox_precinct_unknown.isChecked():
+            # Zapytania o działkę w poszczególnych obrębach są niezależne - wykonywane są równolegle
+            self.uldk_search_worker = ULDKSearchParallelWorker(
+                self.create_uldk_search, teryts, max_found=self.ui.spinbox_max_found.value(),
+                negative_cache=ULDK_NEGATIVE_CACHE)
+        else:
+            self.uldk_search_worker = ULDKSearchWorker(self.uldk_search, teryts)
         self.thread = QThread()
         self.uldk_search_worker.moveToThread(self.thread)
         
@@ -163,6 +223,9 @@ class TerytSearch(QObject):
 
     def fill_combobox_municipality(self, county_teryt):
         municipalities = self.get_administratives("gmina", county_teryt) if county_teryt else []
+        if self.administrative_index.add_rows(
+                "gmina", municipalities, self.ui.combobox_county.currentText().split(" | ")[0]):
+            self.administrative_index.save()
         self.ui.combobox_municipality.blockSignals(True)
         self.ui.combobox_municipality.clear()
         self.ui.combobox_municipality.addItems([""] + municipalities)
@@ -170,11 +233,78 @@ class TerytSearch(QObject):
 
     def fill_combobox_precinct(self, municipality_teryt):
         precincts = self.get_administratives("obreb", municipality_teryt) if municipality_teryt else []
+        if self.administrative_index.add_rows(
+                "obreb", precincts, self.ui.combobox_municipality.currentText().split(" | ")[0]):
+            self.administrative_index.save()
         self.ui.combobox_precinct.blockSignals(True)
         self.ui.combobox_precinct.clear()
         self.ui.combobox_precinct.addItems([""] + precincts)
         self.ui.combobox_precinct.blockSignals(False)
 
+    def fill_quick_search_results(self, text):
+        """Wyświetla podpowiedzi z indeksu gmin i obrębów dla wpisanego tekstu"""
+        self.load_administrative_index()
+
+        model = self.ui.completer_quick_search.model()
+        model.clear()
+        self.quick_search_results = {}
+        for unit in self.administrative_index.search(text, self.QUICK_SEARCH_LIMIT):
+            label = unit.label()
+            self.quick_search_results[label] = unit
+            model.appendRow(QStandardItem(label))
+
+        if self.quick_search_results:
+            self.ui.completer_quick_search.complete()
+
+    def load_administrative_index(self):
+        """
+        Uruchamia pobranie w tle listy wszystkich gmin do indeksu. Pobierane są tylko powiaty, których gmin
+        nie ma jeszcze w indeksie (np. po błędzie pobierania w poprzedniej próbie).
+        """
+        if "gmina" in self.administrative_index.complete_levels or self.administrative_index_thread is not None:
+            return
+
+        counties = [county for county in chain.from_iterable(POWIATY.values())
+                    if not self.administrative_index.search(county.split("|")[1].strip(), 1)]
+        self.administrative_index_worker = AdministrativeIndexWorker(counties)
+        self.administrative_index_thread = QThread()
+        self.administrative_index_worker.moveToThread(self.administrative_index_thread)
+        # Indeks uzupełniany jest w wątku głównym (metoda obiektu wątku głównego) - nie w trakcie wyszukiwania
+        self.administrative_index_worker.loaded.connect(self.__handle_administrative_rows_loaded)
+        self.administrative_index_worker.finished.connect(self.__handle_administrative_index_loaded)
+        self.administrative_index_worker.finished.connect(self.administrative_index_thread.quit)
+        self.administrative_index_worker.finished.connect(self.administrative_index_worker.deleteLater)
+        self.administrative_index_thread.started.connect(self.administrative_index_worker.load)
+        self.administrative_index_thread.start()
+
+    def select_administrative_unit(self, label):
+        """Ustawia listy województw, powiatów, gmin i obrębów na jednostkę wybraną z podpowiedzi"""
+        unit = self.quick_search_results.get(label)
+        if unit is None:
+            return
+
+        municipality_teryt = unit.municipality_teryt
+        self.fill_combobox_province()
+        # Zmiana pozycji listy wczytuje listę kolejnego poziomu (sygnał currentIndexChanged)
+        for combobox, teryt in ((self.ui.combobox_province, municipality_teryt[:2]),
+                                (self.ui.combobox_county, municipality_teryt[:4]),
+                                (self.ui.combobox_municipality, municipality_teryt)):
+            index = self.find_combobox_teryt(combobox, teryt)
+            if index < 0:
+                return
+            combobox.setCurrentIndex(index)
+
+        if unit.level == "obreb":
+            index = self.find_combobox_teryt(self.ui.combobox_precinct, unit.teryt)
+            if index >= 0:
+                self.ui.combobox_precinct.setCurrentIndex(index)
+
+    def find_combobox_teryt(self, combobox, teryt):
+        for index in range(1, combobox.count()):
+            if combobox.itemText(index).split(" | ")[-1] == teryt:
+                return index
+        return -1
+
     def fill_lineedit_full_teryt(self):
         current_plot_id = self.ui.lineedit_plot_id.text()
         current_municipality = self.ui.combobox_municipality.currentText()
@@ -232,6 +362,8 @@ class TerytSearch(QObject):
         self.ui.button_search_uldk.clicked.connect(self.search)
         self.ui.checkbox_precinct_unknown.stateChanged.connect(self.__on_checkbox_precinct_unknown_switched)
         self.ui.combobox_province.addItems([""])
+        self.ui.lineedit_quick_search.textEdited.connect(self.fill_quick_search_results)
+        self.ui.completer_quick_search.activated.connect(self.select_administrative_unit)
 
     def __search_from_sheet(self):
         self.__handle_found({0:[self.ui.combobox_sheet.currentData()]})
@@ -308,9 +440,21 @@ class TerytSearch(QObject):
         self._handle_input_changed()
         self.ui.label_precinct.setEnabled(not new_state)
         self.ui.combobox_precinct.setEnabled(not new_state)
+        self.ui.spinbox_max_found.setEnabled(bool(new_state))
 
     def _search_buttons_set_enabled(self, new_state):
         self.ui.button_search_uldk.setEnabled(new_state)
 
+    def __handle_administrative_rows_loaded(self, level, parent_name, rows):
+        self.administrative_index.add_rows(level, rows, parent_name)
+
+    def __handle_administrative_index_loaded(self, complete):
+        # Poziom oznaczany jest jako kompletny tylko wtedy, gdy pobrano gminy wszystkich powiatów
+        if complete:
+            self.administrative_index.set_level_complete("gmina")
+        self.administrative_index.save()
+        self.administrative_index_thread.deleteLater()
+        self.administrative_index_thread = None
+
     def __delete_message_bar(self):
         self.message_bar_item = None
@@ -1,17 +1,28 @@
+import queue
+import threading
+import time
 from urllib.error import HTTPError
 from urllib.parse import quote
 
-from qgis.PyQt.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+from qgis.PyQt.QtCore import QObject, QThread, QSettings, pyqtSignal, pyqtSlot
 
 from .api_limits import RateLimitDecorator, sleep_and_retry
 
-from qgis.core import QgsMessageLog
 from qgis.core import Qgis
+from gissupport_plugin.tools.logger import LOG_BUFFER
 from gissupport_plugin.tools.requests import NetworkHandler
+from .metrics import ULDK_METRICS
+
+# Wspólny limit zapytań do ULDK dla wszystkich obiektów ULDKSearch
+ULDK_RATE_LIMIT = RateLimitDecorator(calls = 5, period = 3)
 
 class RequestException(Exception):
     pass
 
+class NotFoundException(RequestException):
+    """Usługa ULDK odpowiedziała poprawnie, ale nie znalazła szukanego obiektu"""
+    pass
+
 class URL:
 
     def __init__(self, base_url, **params):
@@ -61,20 +72,35 @@ class ULDKSearch:
         self.url = URL(self.gugik_url, obiekt=target, wynik=results)
         if method:
             self.url.set_param("request", method)
+        # Dane ostatniego zapytania (moment rozpoczęcia, czas odpowiedzi, rozmiar, liczba ponowień) na potrzeby statystyk
+        self.last_request = {}
+
+    @property
+    def request_type(self):
+        return self.url.params.get("request") or self.url.params.get("obiekt", "")
 
     @sleep_and_retry
-    @RateLimitDecorator(calls = 5, period = 3)
+    @ULDK_RATE_LIMIT
     def search(self):
+        started = time.monotonic()
+        self.last_request = {"started": started, "latency": 0.0, "bytes": 0, "retries": 0}
         content = NetworkHandler().get(str(self.url))
 
         if "error" in content:
             self.url = URL(self.gugik_url, **self.url.params)
+            self.last_request["retries"] = 1
             content = NetworkHandler().get(str(self.url))
             if "error" in content:
+                self.last_request["latency"] = time.monotonic() - started
                 raise RequestException(content.get('msg', "Brak odpowiedzi"))
 
+        self.last_request["latency"] = time.monotonic() - started
+        self.last_request["bytes"] = len(content["data"])
+
         lines = content["data"].strip().split("\n")
 
+        if lines[0].startswith("-1"):
+            raise NotFoundException(lines[0])
         if lines[0] != "0":
             raise RequestException(lines[0])
 
@@ -82,27 +108,76 @@ class ULDKSearch:
 
 class ULDKSearchLogger(ULDKSearch):
 
-    """Dekorator obiektów ULDKSearch, służący do zapisywania logu wyszukiwań"""
+    """
+    Dekorator obiektów ULDKSearch, służący do zapisywania logu wyszukiwań
+    oraz statystyk zapytań (ULDK_METRICS).
+    Wpisy o udanych zapytaniach mogą być wyłączone lub zapisywane co n-te zapytanie,
+    błędy zapisywane są zawsze.
+    """
 
     message_group_name = "GIS Support - wyszukiwarka działek"
 
+    LOG_REQUESTS_SETTINGS_KEY = "gissupport/uldk/log_requests"
+    LOG_SAMPLE_RATE_SETTINGS_KEY = "gissupport/uldk/log_sample_rate"
+
+    log_requests = True
+    log_sample_rate = 1
+
     def __init__(self, decorated: ULDKSearch):
         self._decorated = decorated
 
+    @property
+    def url(self):
+        return self._decorated.url
+
+    @classmethod
+    def load_settings(cls):
+        settings = QSettings()
+        cls.log_requests = settings.value(cls.LOG_REQUESTS_SETTINGS_KEY, True, type=bool)
+        cls.log_sample_rate = max(1, settings.value(cls.LOG_SAMPLE_RATE_SETTINGS_KEY, 1, type=int))
+        LOG_BUFFER.set_sampling(cls.message_group_name, cls.log_sample_rate)
+
+    @classmethod
+    def save_settings(cls, log_requests, log_sample_rate):
+        cls.log_requests = bool(log_requests)
+        cls.log_sample_rate = max(1, int(log_sample_rate))
+        LOG_BUFFER.set_sampling(cls.message_group_name, cls.log_sample_rate)
+        settings = QSettings()
+        settings.setValue(cls.LOG_REQUESTS_SETTINGS_KEY, cls.log_requests)
+        settings.setValue(cls.LOG_SAMPLE_RATE_SETTINGS_KEY, cls.log_sample_rate)
+
     def search(self, *args, **kwargs):
+        called = time.monotonic()
         try:
             result = self._decorated.search(*args, **kwargs)
-            url = str(self._decorated.url)
-            self.log_message("{} - pobrano".format(url))
+            self.record_metrics(called)
+            if self.log_requests:
+                url = str(self._decorated.url)
+                self.log_message("{} - pobrano".format(url))
             return result
         except Exception as e:
+            self.record_metrics(called, error=not isinstance(e, NotFoundException))
             url = str(self._decorated.url)
             message = "{} - błąd {} ({})".format(url, type(e), e)
             self.log_message(message, Qgis.MessageLevel.Critical)
             raise e
 
+    def record_metrics(self, called, error=False):
+        last_request = getattr(self._decorated, "last_request", None)
+        if not last_request:
+            return
+        ULDK_METRICS.record_request(
+            self._decorated.request_type,
+            latency = last_request["latency"],
+            size = last_request["bytes"],
+            retries = last_request["retries"],
+            # czas od wywołania do faktycznego rozpoczęcia zapytania to oczekiwanie na limit zapytań
+            rate_limit_sleep = max(0.0, last_request["started"] - called),
+            error = error
+        )
+
     def log_message(self, message, level=Qgis.MessageLevel.Info):
-        QgsMessageLog.logMessage(message, self.message_group_name, level)
+        LOG_BUFFER.log(message, self.message_group_name, level)
 
 class ULDKSearchTeryt(ULDKSearch):
     def __init__(self, target, results):
@@ -173,4 +248,164 @@ class ULDKSearchPointWorker(QObject):
                 self.found.emit(result)
             except (HTTPError, RequestException) as e:
                 self.not_found.emit(point, e)
-        self.finished.emit()
\ No newline at end of file
+        self.finished.emit()
+
+class ULDKNegativeCache:
+
+    """
+    Pamięć podręczna identyfikatorów, dla których ULDK zwróciło brak wyników.
+    Wpisy wygasają po `ttl` sekundach, aby uwzględnić zmiany w ewidencji.
+    """
+
+    def __init__(self, ttl=3600, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v >= now}
+                if len(self._entries) >= self.max_size:
+                    self._entries.clear()
+            self._entries[key] = time.monotonic() + self.ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+ULDK_NEGATIVE_CACHE = ULDKNegativeCache()
+
+class ULDKSearchThread(QThread):
+
+    """
+    Wątek pobierający kolejne identyfikatory ze wspólnej kolejki.
+    Limit zapytań ULDKSearch.search jest wspólny dla wszystkich wątków.
+    """
+
+    def __init__(self, uldk_search, tasks, results, stop_event):
+        super().__init__()
+        self.uldk_search = uldk_search
+        self.tasks = tasks
+        self.results = results
+        self.stop_event = stop_event
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                key, teryt = self.tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.results.put((key, teryt, self.uldk_search.search(teryt), None))
+            except Exception as e:
+                # Każde zadanie musi dać wynik - inaczej ULDKSearchParallelWorker czekałby na niego bez końca
+                self.results.put((key, teryt, None, e))
+
+class ULDKSearchParallelWorker(QObject):
+
+    """
+    Odpowiednik ULDKSearchWorker wykonujący zapytania w kilku wątkach jednocześnie.
+    Wyniki emitowane są na bieżąco, w kolejności otrzymania odpowiedzi.
+    """
+
+    found = pyqtSignal(dict)
+    not_found = pyqtSignal(str, Exception)
+    finished = pyqtSignal()
+    interrupted = pyqtSignal()
+    def __init__(self, uldk_search_factory, teryt_ids, threads_count=4, max_found=0, negative_cache=None):
+        """
+        :param uldk_search_factory: funkcja tworząca obiekt ULDKSearch - każdy wątek używa osobnego obiektu
+        :param max_found: liczba znalezionych obiektów, po której wyszukiwanie jest przerywane (0 - bez limitu)
+        :param negative_cache: ULDKNegativeCache z identyfikatorami pomijanymi bez odpytywania ULDK
+        """
+        super().__init__()
+        self.uldk_search_factory = uldk_search_factory
+        self.teryt_ids = teryt_ids
+        self.threads_count = threads_count
+        self.max_found = max_found
+        self.negative_cache = negative_cache
+
+    @pyqtSlot()
+    def search(self):
+        tasks = queue.Queue()
+        results = queue.Queue()
+        stop_event = threading.Event()
+
+        pending = 0
+        for k, v in self.teryt_ids.items():
+            teryt = v.get("teryt")
+            if self.negative_cache is not None:
+                cached = teryt in self.negative_cache
+                ULDK_METRICS.record_cache("negative_cache", cached)
+                if cached:
+                    self.not_found.emit(teryt, NotFoundException("Brak wyników (zapisane w pamięci podręcznej)"))
+                    continue
+            tasks.put((k, teryt))
+            pending += 1
+
+        threads = [ULDKSearchThread(self.uldk_search_factory(), tasks, results, stop_event)
+                   for _ in range(min(self.threads_count, pending))]
+        for thread in threads:
+            thread.start()
+
+        found_count = 0
+        interrupted = False
+        while pending:
+            if QThread.currentThread().isInterruptionRequested():
+                interrupted = True
+                break
+            try:
+                key, teryt, result, exception = results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            pending -= 1
+            if exception is None:
+                self.found.emit({key: result})
+                found_count += len(result)
+                if self.max_found and found_count >= self.max_found:
+                    break
+            else:
+                if self.negative_cache is not None and isinstance(exception, NotFoundException):
+                    self.negative_cache.add(teryt)
+                self.not_found.emit(teryt, exception)
+
+        stop_event.set()
+        for thread in threads:
+            thread.wait()
+
+        if interrupted:
+            self.interrupted.emit()
+        else:
+            self.finished.emit()
+
+class ULDKSearchBudget(ULDKSearch):
+
+    """
+    Dekorator obiektów ULDKSearch ograniczający liczbę ich zapytań do części wspólnego limitu ULDK.
+    Używany przez zapytania wykonywane w tle, aby nie opóźniały zapytań użytkownika.
+    Limit `budget` może być współdzielony przez wiele obiektów (np. kolejne zadania pobierania w tle).
+    """
+
+    def __init__(self, decorated: ULDKSearch, budget: RateLimitDecorator):
+        self._decorated = decorated
+        self._search = sleep_and_retry(budget(decorated.search))
+
+    @property
+    def url(self):
+        return self._decorated.url
+
+    def search(self, *args, **kwargs):
+        return self._search(*args, **kwargs)
@@ -0,0 +1,173 @@
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict
+
+# Górne granice przedziałów histogramu czasu odpowiedzi (ms); ostatni przedział jest otwarty
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class RequestTypeMetrics:
+
+    __slots__ = ("requests", "errors", "retries", "bytes", "latency_total", "latency_max",
+                 "latency_histogram", "rate_limit_sleep")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.rate_limit_sleep = 0.0
+
+    def latency_percentile(self, percentile: float) -> float:
+        """Szacuje percentyl czasu odpowiedzi (ms) na podstawie histogramu - zwraca górną granicę przedziału"""
+        if not self.requests:
+            return 0.0
+        threshold = self.requests * percentile / 100
+        cumulative = 0
+        for bucket, count in enumerate(self.latency_histogram):
+            cumulative += count
+            if cumulative >= threshold:
+                if bucket < len(LATENCY_BUCKETS_MS):
+                    return float(LATENCY_BUCKETS_MS[bucket])
+                break
+        return self.latency_max * 1000
+
+    def as_dict(self) -> dict:
+        histogram_labels = [f"<={bucket}" for bucket in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "latency_avg_ms": round(self.latency_total / self.requests * 1000, 1) if self.requests else 0.0,
+            "latency_p50_ms": self.latency_percentile(50),
+            "latency_p95_ms": self.latency_percentile(95),
+            "latency_max_ms": round(self.latency_max * 1000, 1),
+            "latency_histogram_ms": dict(zip(histogram_labels, self.latency_histogram)),
+            "rate_limit_sleep_s": round(self.rate_limit_sleep, 3),
+        }
+
+
+class CacheMetrics:
+
+    __slots__ = ("hits", "misses")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+        }
+
+
+class StageMetrics:
+
+    """Czas etapu przetwarzania odpowiedzi (np. parsowania lub zapisu do warstwy)"""
+
+    __slots__ = ("calls", "items", "duration_total", "duration_max")
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.duration_total = 0.0
+        self.duration_max = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "items": self.items,
+            "duration_total_s": round(self.duration_total, 3),
+            "duration_avg_ms": round(self.duration_total / self.calls * 1000, 1) if self.calls else 0.0,
+            "duration_max_ms": round(self.duration_max * 1000, 1),
+        }
+
+
+class ULDKMetrics:
+
+    """
+    Zbiorcze statystyki zapytań do ULDK, grupowane według typu zapytania
+    (np. 'GetParcelById', 'GetParcelByXY', 'gmina'), oraz - osobno - trafienia w pamięci podręcznej
+    (według nazwy pamięci) i czasy etapów przetwarzania odpowiedzi (parsowanie, zapis do warstwy).
+    Bezpieczne przy użyciu z wielu wątków.
+    """
+
+    # Etapy przetwarzania odpowiedzi
+    STAGE_PARSE = "parse"
+    STAGE_LAYER_WRITE = "layer_write"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = defaultdict(RequestTypeMetrics)
+        self._caches = defaultdict(CacheMetrics)
+        self._stages = defaultdict(StageMetrics)
+        self.started_at = time.time()
+
+    def record_request(self, request_type: str, latency: float, size: int = 0, retries: int = 0,
+                       rate_limit_sleep: float = 0.0, error: bool = False):
+        """
+        :param latency: czas oczekiwania na odpowiedź (s), bez czasu oczekiwania na limit zapytań
+        :param rate_limit_sleep: czas oczekiwania na zwolnienie limitu zapytań (s)
+        """
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, latency * 1000)
+        with self._lock:
+            metrics = self._metrics[request_type]
+            metrics.requests += 1
+            metrics.errors += int(error)
+            metrics.retries += retries
+            metrics.bytes += size
+            metrics.latency_total += latency
+            metrics.latency_max = max(metrics.latency_max, latency)
+            metrics.latency_histogram[bucket] += 1
+            metrics.rate_limit_sleep += rate_limit_sleep
+
+    def record_cache(self, cache_name: str, hit: bool, count: int = 1):
+        with self._lock:
+            metrics = self._caches[cache_name]
+            if hit:
+                metrics.hits += count
+            else:
+                metrics.misses += count
+
+    def record_stage(self, stage: str, duration: float, items: int = 1):
+        """
+        :param duration: czas etapu (s)
+        :param items: liczba obiektów przetworzonych w tym czasie
+        """
+        with self._lock:
+            metrics = self._stages[stage]
+            metrics.calls += 1
+            metrics.items += items
+            metrics.duration_total += duration
+            metrics.duration_max = max(metrics.duration_max, duration)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+                "request_types": {name: metrics.as_dict() for name, metrics in sorted(self._metrics.items())},
+                "caches": {name: metrics.as_dict() for name, metrics in sorted(self._caches.items())},
+                "stages": {name: metrics.as_dict() for name, metrics in sorted(self._stages.items())}
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2, ensure_ascii=False)
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+            self._caches.clear()
+            self._stages.clear()
+            self.started_at = time.time()
+
+
+ULDK_METRICS = ULDKMetrics()
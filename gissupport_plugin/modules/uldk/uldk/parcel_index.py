@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from typing import Optional
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsSpatialIndex
+
+
+class ParcelIndex:
+
+    """
+    Lokalny indeks przestrzenny działek pobranych z ULDK (w układzie EPSG:2180).
+    Przechowuje surowe wiersze odpowiedzi ULDK, dzięki czemu wyszukanie działki
+    z indeksu może zostać obsłużone tak samo jak odpowiedź usługi.
+    Po przekroczeniu `max_size` usuwane są najdawniej dodane działki.
+    """
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self._parcels = OrderedDict()
+        self._ids_by_teryt = {}
+        self._index = QgsSpatialIndex()
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._parcels)
+
+    def add(self, uldk_response_row: str) -> bool:
+        """Dodaje działkę z wiersza 'geom_wkt|wojewodztwo|powiat|gmina|obreb|numer|teryt'"""
+        split = uldk_response_row.split("|")
+        if len(split) != 7:
+            return False
+        teryt = split[-1]
+        if teryt in self._ids_by_teryt:
+            return False
+
+        geometry = QgsGeometry.fromWkt(split[0].split(";")[-1])
+        if geometry.isNull() or geometry.isEmpty():
+            return False
+
+        feature = QgsFeature(self._next_id)
+        feature.setGeometry(geometry)
+        self._index.addFeature(feature)
+        self._parcels[self._next_id] = (teryt, geometry, uldk_response_row)
+        self._ids_by_teryt[teryt] = self._next_id
+        self._next_id += 1
+
+        if len(self._parcels) > self.max_size:
+            self._remove_oldest()
+        return True
+
+    def find(self, point: QgsPointXY) -> Optional[str]:
+        """Zwraca wiersz ULDK działki zawierającej punkt (EPSG:2180) lub None"""
+        point_geometry = QgsGeometry.fromPointXY(point)
+        for parcel_id in self._index.intersects(point_geometry.boundingBox()):
+            _, geometry, uldk_response_row = self._parcels[parcel_id]
+            if geometry.contains(point_geometry):
+                return uldk_response_row
+        return None
+
+    def clear(self):
+        self._parcels.clear()
+        self._ids_by_teryt.clear()
+        self._index = QgsSpatialIndex()
+
+    def _remove_oldest(self):
+        parcel_id, (teryt, geometry, _) = self._parcels.popitem(last=False)
+        del self._ids_by_teryt[teryt]
+        feature = QgsFeature(parcel_id)
+        feature.setGeometry(geometry)
+        self._index.deleteFeature(feature)
@@ -1,3 +1,5 @@
+import time
+
 from qgis.PyQt.QtCore import QVariant
 from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform,
                        QgsCoordinateTransformContext, QgsFeature, QgsField,
@@ -5,6 +7,9 @@ from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform,
 from qgis.utils import iface
 from typing import Optional, List
 
+from gissupport_plugin.tools.transforms import get_transform
+from .metrics import ULDK_METRICS
+
 PLOTS_LAYER_DEFAULT_FIELDS = [
     QgsField("wojewodztwo", QVariant.String),
     QgsField("powiat", QVariant.String),
@@ -62,6 +67,8 @@ class ResultCollector:
 
     @classmethod
     def uldk_response_to_qgs_feature(cls, response_row: str, additional_attributes: list = [], additional_fields_defs: list = []) -> QgsFeature:
+        started = time.perf_counter()
+
         def get_sheet(teryt):
             split = teryt.split(".")
             if len(split) == 4:
@@ -108,6 +115,7 @@ class ResultCollector:
             if not geometry.isGeosValid():
                 raise cls.BadGeometryException(feature)
 
+        ULDK_METRICS.record_stage(ULDK_METRICS.STAGE_PARSE, time.perf_counter() - started)
         return feature
 
     def map_attributes_by_name(self, source_feature: QgsFeature) -> QgsFeature:
@@ -120,7 +128,7 @@ class ResultCollector:
 
         # Transformacja jeśli są różne
         if self.SOURCE_CRS != target_crs:
-            geometry.transform(QgsCoordinateTransform(self.SOURCE_CRS, target_crs, QgsProject.instance()))
+            geometry.transform(get_transform(self.SOURCE_CRS, target_crs))
 
         new_feat.setGeometry(geometry)
 
@@ -218,15 +226,16 @@ class ResultCollectorSingle(ResultCollector):
                 level=Qgis.MessageLevel.Warning)
             return False
 
+        started = time.perf_counter()
         if not was_editable:
             self.layer.startEditing()
 
         success = self.layer.addFeature(feature_to_add)
 
         if success:
-            return self.layer.commitChanges(stopEditing=not was_editable)
-
-        return False
+            success = self.layer.commitChanges(stopEditing=not was_editable)
+        ULDK_METRICS.record_stage(ULDK_METRICS.STAGE_LAYER_WRITE, time.perf_counter() - started)
+        return success
 
 
 class ResultCollectorMultiple(ResultCollector):
@@ -268,6 +277,7 @@ class ResultCollectorMultiple(ResultCollector):
                 level=Qgis.MessageLevel.Warning)
             return
 
+        started = time.perf_counter()
         if not was_editable:
             self.layer.startEditing()
 
@@ -279,13 +289,15 @@ class ResultCollectorMultiple(ResultCollector):
                 target_crs = self.layer.crs()
                 if self.SOURCE_CRS != target_crs:
                     geometry = feature_to_add.geometry()
-                    geometry.transform(QgsCoordinateTransform(self.SOURCE_CRS, target_crs, QgsProject.instance()))
+                    geometry.transform(get_transform(self.SOURCE_CRS, target_crs))
                     feature_to_add.setGeometry(geometry)
 
             self.layer.addFeature(feature_to_add)
 
         # Zakończenie edycji i zapis (sukcesywne dopisywanie)
-        if self.layer.commitChanges(stopEditing=not was_editable):
+        committed = self.layer.commitChanges(stopEditing=not was_editable)
+        ULDK_METRICS.record_stage(ULDK_METRICS.STAGE_LAYER_WRITE, time.perf_counter() - started, len(features))
+        if committed:
             self.layer.updateExtents()
             if not self._layer_added_to_project:
                 QgsProject.instance().addMapLayer(self.layer)
@@ -0,0 +1,197 @@
+import bisect
+import heapq
+import json
+import math
+import os
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+# Litery, których NFKD nie rozkłada na literę bazową i znak diakrytyczny
+_SPECIAL_CHARACTERS = str.maketrans({"ł": "l", "Ł": "l"})
+
+
+def normalize(text: str) -> str:
+    """Sprowadza tekst do małych liter bez polskich znaków diakrytycznych"""
+    text = text.translate(_SPECIAL_CHARACTERS).lower()
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in text if not unicodedata.combining(char)).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AdministrativeUnit:
+
+    __slots__ = ("level", "name", "teryt", "parent_name", "normalized", "words")
+
+    def __init__(self, level: str, name: str, teryt: str, parent_name: str = ""):
+        self.level = level
+        self.name = name
+        self.teryt = teryt
+        self.parent_name = parent_name
+        self.normalized = normalize(name)
+        self.words = self.normalized.replace("-", " ").split()
+
+    @property
+    def municipality_teryt(self) -> str:
+        return self.teryt.split(".")[0]
+
+    def label(self) -> str:
+        prefix = "gm." if self.level == "gmina" else "obręb"
+        parent = f" ({self.parent_name})" if self.parent_name else ""
+        return f"{prefix} {self.name}{parent} | {self.teryt}"
+
+    def as_dict(self) -> dict:
+        return {"level": self.level, "name": self.name, "teryt": self.teryt, "parent_name": self.parent_name}
+
+
+class AdministrativeIndex:
+
+    """
+    Indeks n-gramowy nazw gmin i obrębów. Pozwala wyszukiwać jednostki po fragmencie nazwy
+    (bez względu na wielkość liter i polskie znaki) lub po początku kodu TERYT.
+    """
+
+    LEVELS = ("gmina", "obreb")
+    # Kolejność wyników o tej samej trafności - gminy przed obrębami
+    LEVEL_ORDER = {"gmina": 0, "obreb": 1}
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.modified = False
+        # Poziomy, dla których indeks zawiera komplet jednostek z całego kraju
+        self.complete_levels = set()
+        self._units: List[AdministrativeUnit] = []
+        self._by_teryt: Dict[str, int] = {}
+        self._trigrams: Dict[str, List[int]] = defaultdict(list)
+        self._prefixes: Dict[str, List[int]] = defaultdict(list)
+        self._sorted_teryts: Optional[List[str]] = None
+
+    def __len__(self):
+        return len(self._units)
+
+    def __contains__(self, teryt: str):
+        return teryt in self._by_teryt
+
+    def add(self, level: str, name: str, teryt: str, parent_name: str = "") -> bool:
+        if level not in self.LEVELS or not teryt or teryt in self._by_teryt:
+            return False
+
+        unit = AdministrativeUnit(level, name, teryt, parent_name)
+        unit_id = len(self._units)
+        self._units.append(unit)
+        self._by_teryt[teryt] = unit_id
+        self._sorted_teryts = None
+
+        for trigram in trigrams(unit.normalized):
+            self._trigrams[trigram].append(unit_id)
+        # Krótkie zapytania (1-2 znaki) obsługiwane są przez indeks początków słów
+        for word in set(unit.words):
+            self._prefixes[word[:1]].append(unit_id)
+            if len(word) > 1:
+                self._prefixes[word[:2]].append(unit_id)
+
+        self.modified = True
+        return True
+
+    def add_rows(self, level: str, rows: Iterable[str], parent_name: str = "") -> int:
+        """Dodaje wiersze w formacie 'nazwa | teryt', zwracanym przez TerytSearch.get_administratives"""
+        added = 0
+        for row in rows:
+            try:
+                name, teryt = [part.strip() for part in row.split("|")]
+            except ValueError:
+                continue
+            added += self.add(level, name, teryt, parent_name)
+        return added
+
+    def set_level_complete(self, level: str) -> None:
+        self.complete_levels.add(level)
+        self.modified = True
+
+    def search(self, query: str, limit: int = 20) -> List[AdministrativeUnit]:
+        query = normalize(query)
+        if not query:
+            return []
+
+        if query[0].isdigit():
+            return self._search_teryt(query, limit)
+
+        query_trigrams = trigrams(query)
+        if len(query) < 3:
+            candidates = dict.fromkeys(self._prefixes.get(query, ()), 0)
+        else:
+            candidates = Counter()
+            for trigram in query_trigrams:
+                candidates.update(self._trigrams.get(trigram, ()))
+            # Fragment nazwy ze środka słowa nie trafia w trigramy z dopełnieniem na początku i końcu zapytania
+            min_hits = max(1, min(len(query_trigrams) - 3, math.ceil(len(query_trigrams) / 2)))
+            candidates = {unit_id: hits for unit_id, hits in candidates.items() if hits >= min_hits}
+
+        query_words = query.replace("-", " ").split()
+        scored = []
+        for unit_id, hits in candidates.items():
+            unit = self._units[unit_id]
+            score = self._score(unit, query, query_words, hits / len(query_trigrams))
+            if score > 0:
+                scored.append((-score, self.LEVEL_ORDER[unit.level], len(unit.name), unit.name, unit_id))
+
+        return [self._units[item[-1]] for item in heapq.nsmallest(limit, scored)]
+
+    @staticmethod
+    def _score(unit: AdministrativeUnit, query: str, query_words: List[str], similarity: float) -> float:
+        if unit.normalized == query:
+            return 100
+        if unit.normalized.startswith(query):
+            return 80
+        if all(any(word.startswith(query_word) for word in unit.words) for query_word in query_words):
+            return 60
+        if query in unit.normalized:
+            return 40
+        # Dopasowanie rozmyte (literówki) - wymagamy zgodności co najmniej połowy trigramów
+        if similarity >= 0.5:
+            return 30 * similarity
+        return 0
+
+    def _search_teryt(self, query: str, limit: int) -> List[AdministrativeUnit]:
+        if self._sorted_teryts is None:
+            self._sorted_teryts = sorted(self._by_teryt)
+        start = bisect.bisect_left(self._sorted_teryts, query)
+        found = []
+        for teryt in self._sorted_teryts[start:start + limit]:
+            if not teryt.startswith(query):
+                break
+            found.append(self._units[self._by_teryt[teryt]])
+        return found
+
+    @classmethod
+    def load(cls, path: str) -> "AdministrativeIndex":
+        index = cls(path)
+        if not os.path.exists(path):
+            return index
+        try:
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return index
+        for unit in data.get("units", []):
+            index.add(unit["level"], unit["name"], unit["teryt"], unit.get("parent_name", ""))
+        index.complete_levels = set(data.get("complete_levels", []))
+        index.modified = False
+        return index
+
+    def save(self) -> None:
+        if not self.path or not self.modified:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({
+                "complete_levels": sorted(self.complete_levels),
+                "units": [unit.as_dict() for unit in self._units]
+            }, file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self.modified = False
@@ -4,9 +4,10 @@ import uuid
 
 from qgis.PyQt.QtCore import QObject, QUrl, pyqtSignal, QSettings
 from qgis.PyQt.QtNetwork import QNetworkRequest
-from qgis.core import QgsNetworkAccessManager, Qgis
+from qgis.core import Qgis
 import json
 
+from .http_client import HttpClient, HttpFuture
 from .logger import Logger
 from ..modules.gis_box.gui.two_fa import TwoFADialog
 
@@ -16,8 +17,7 @@ class GisboxConnection(QObject, Logger):
     on_disconnect = pyqtSignal()
     on_error = pyqtSignal(dict)
 
-    MANAGER = QgsNetworkAccessManager()
-    MANAGER.setTransferTimeout(600000)
+    TIMEOUT = 600000
     QUEUE = {}
 
     def __init__(self, parent=None):
@@ -32,9 +32,18 @@ class GisboxConnection(QObject, Logger):
 
         self.current_user = None
 
+    @property
+    def client(self) -> HttpClient:
+        return HttpClient.instance()
+
     @classmethod
-    def _exec_callback(cls, uuid_: str):
-        reply, callback = cls.QUEUE[uuid_]
+    def _exec_callback(cls, uuid_: str, reply):
+        callback = cls.QUEUE[uuid_]
+
+        if reply is None:
+            # Zapytanie przerwane, zanim zostało wysłane (np. oczekujące w kolejce HttpClient)
+            del cls.QUEUE[uuid_]
+            return
 
         try:
             response_data = json.loads(bytearray(reply.readAll()))
@@ -82,7 +91,7 @@ class GisboxConnection(QObject, Logger):
                 'password': settings.value('pass')
             }
         }
-        reply = self.MANAGER.blockingPost(request, json.dumps(payload).encode('utf-8'))
+        reply = self.client.blocking(request, "POST", json.dumps(payload).encode('utf-8'), timeout=self.TIMEOUT)
         response_raw = bytearray(reply.content())
         status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
         if not response_raw:
@@ -125,7 +134,7 @@ class GisboxConnection(QObject, Logger):
         if not self.current_user:
 
             request = self._createRequest('/api/users/current_user')
-            response = self.MANAGER.blockingGet(request, forceRefresh=True)
+            response = self.client.blocking(request, timeout=self.TIMEOUT, force_refresh=True)
 
             response_data = json.loads(bytearray(response.content()))
             data = response_data['data']
@@ -145,7 +154,7 @@ class GisboxConnection(QObject, Logger):
         if self.token:
             request = self._createRequest('/api/logout')
             request.setRawHeader(b'X-Access-Token', bytes(self.token.encode()))
-            self.MANAGER.blockingGet(request)
+            self.client.blocking(request, timeout=self.TIMEOUT)
         self.log("Rozłączono")
         self.on_disconnect.emit()
         self.is_connected = False
@@ -168,20 +177,24 @@ class GisboxConnection(QObject, Logger):
         request = self._createRequest(endpoint)
 
         if sync:
-            reply = self.MANAGER.blockingGet(request)
+            reply = self.client.blocking(request, timeout=self.TIMEOUT)
 
             response = json.loads(bytearray(reply.content()))
             return response
 
-        reply = self.MANAGER.get(request)
+        pending = self.client.send(request, timeout=self.TIMEOUT)
 
         if callback:
             random_uuid = self.generate_random_uuid()
-            self.QUEUE[random_uuid] = (reply, callback)
-            reply.finished.connect(lambda: self._exec_callback(random_uuid))
+            self.QUEUE[random_uuid] = callback
+            pending.finished.connect(lambda reply: self._exec_callback(random_uuid, reply))
 
-        return reply
+        return pending
     
+    def submit(self, endpoint: str) -> HttpFuture:
+        """ Asynchroniczne zapytanie GET zwracające HttpFuture - do równoległego pobierania (gather) """
+        return self.client.submit(self._createRequest(endpoint), timeout=self.TIMEOUT)
+
     def post(self, endpoint: str, payload: dict, callback: any = None, srid: str = None, sync:bool = False):
         request = self._createRequest(endpoint)
         if srid:
@@ -190,7 +203,7 @@ class GisboxConnection(QObject, Logger):
         data = json.dumps(payload).encode()
 
         if sync:
-            reply = self.MANAGER.blockingPost(request, data)
+            reply = self.client.blocking(request, "POST", data, timeout=self.TIMEOUT)
             response = json.loads(bytearray(reply.content()))
 
             if callback:
@@ -198,15 +211,14 @@ class GisboxConnection(QObject, Logger):
 
             return response
         
-        reply = self.MANAGER.post(request, data)
-        response = reply.readAll()
+        pending = self.client.send(request, "POST", data, timeout=self.TIMEOUT)
 
         if callback:
             random_uuid = self.generate_random_uuid()
-            self.QUEUE[random_uuid] = (reply, callback)
-            reply.finished.connect(lambda: self._exec_callback(random_uuid))
+            self.QUEUE[random_uuid] = callback
+            pending.finished.connect(lambda reply: self._exec_callback(random_uuid, reply))
 
-        return response
+        return pending
 
     def verify_code(self, code: int):
         settings = QSettings()
@@ -219,7 +231,7 @@ class GisboxConnection(QObject, Logger):
             }
         }
         request = self._createRequest('/api/login', with_token=False)
-        reply = self.MANAGER.blockingPost(request, json.dumps(payload).encode('utf-8'))
+        reply = self.client.blocking(request, "POST", json.dumps(payload).encode('utf-8'), timeout=self.TIMEOUT)
         response_raw = bytearray(reply.content())
         status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
         if not response_raw:
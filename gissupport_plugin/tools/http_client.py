@@ -0,0 +1,521 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import CancelledError
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from qgis.core import Qgis, QgsFeedback, QgsNetworkAccessManager, QgsNetworkReplyContent, QgsTask
+from qgis.PyQt.QtCore import QByteArray, QCoreApplication, QEventLoop, QObject, QTimer, pyqtSignal
+from qgis.PyQt.QtNetwork import QHttpMultiPart, QNetworkReply, QNetworkRequest
+
+from gissupport_plugin.tools.logger import LOG_BUFFER
+
+RETRY_NETWORK_ERRORS = (
+    QNetworkReply.NetworkError.TimeoutError,
+    QNetworkReply.NetworkError.OperationCanceledError,
+    QNetworkReply.NetworkError.RemoteHostClosedError,
+    QNetworkReply.NetworkError.TemporaryNetworkFailureError,
+    QNetworkReply.NetworkError.ProxyTimeoutError,
+    QNetworkReply.NetworkError.UnknownNetworkError,
+)
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+# Bufor zapisu pobieranych plików i bufor odczytu odpowiedzi - pamięć zajęta przez pobieranie nie zależy od rozmiaru pliku
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+
+class HostPolicy:
+    """
+    Zasady wykonywania zapytań do jednego serwera.
+
+    max_connections - maksymalna liczba jednocześnie wykonywanych zapytań (w obrębie wątku),
+    timeout - czas bez przesyłu danych [ms], po którym zapytanie jest przerywane (0 - bez limitu),
+    retries, retry_delay - liczba ponowień zapytań GET po błędach przejściowych i opóźnienie pierwszego z nich [ms],
+        kolejne opóźnienia są podwajane,
+    rate_limit - (liczba zapytań, okres w sekundach) wspólny dla wszystkich wątków albo None.
+    """
+
+    def __init__(self, max_connections: int = 6, timeout: int = 60000, retries: int = 0, retry_delay: int = 1000,
+                 rate_limit: Optional[tuple] = None):
+        self.max_connections = max(1, max_connections)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.rate_limit = rate_limit
+
+
+class PendingRequest(QObject):
+    """
+    Zapytanie przekazane do HttpClient. Odpowiedź (QNetworkReply) jest dostępna po sygnale `finished`
+    - wcześniej zapytanie może czekać w kolejce na wolne połączenie. Zapytanie przerwane w kolejce (abort())
+    kończy się sygnałem `finished` z None zamiast odpowiedzi - obsługa sygnału musi to uwzględniać.
+    """
+
+    finished = pyqtSignal(object)
+    downloadProgress = pyqtSignal('qint64', 'qint64')
+
+    def __init__(self, request: QNetworkRequest, method: str, data, priority, timeout: Optional[int], limited: bool,
+                 output_path: Optional[str] = None, resume: bool = False):
+        super().__init__()
+        self.request = request
+        self.method = method
+        self.data = data
+        self.priority = priority
+        self.timeout = timeout
+        self.limited = limited
+        self.host = request.url().host()
+        self.output_path = output_path
+        self.resume = resume
+        self.output = None
+        self.offset = 0
+        self.bytes_received = 0
+
+        self.client = None
+        self.reply = None
+        self.attempts = 0
+        self.aborted = False
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+        self._finished = False
+
+    def isFinished(self) -> bool:
+        return self._finished
+
+    def abort(self):
+        if self._finished:
+            return
+        self.aborted = True
+        if self.reply is not None and not self.reply.isFinished():
+            self.reply.abort()
+        elif self.reply is None and self.client is not None:
+            # Zapytanie czeka w kolejce lub na ponowienie - kończone jest od razu, bez odpowiedzi
+            self.client._finish(self, None)
+
+
+class HttpClient(QObject):
+    """
+    Wspólna warstwa zapytań HTTP wtyczki oparta na QgsNetworkAccessManager (ustawienia proxy i uwierzytelniania QGIS).
+
+    Każdy wątek korzysta z własnej instancji (HttpClient.instance()), bo QgsNetworkAccessManager działa w wątku,
+    w którym został utworzony. Zapytania do jednego serwera wykonywane są najwyżej po `max_connections` naraz,
+    pozostałe czekają w kolejce według priorytetu QNetworkRequest. Kompresji gzip/deflate nie trzeba ustawiać -
+    Qt sam dodaje nagłówek Accept-Encoding i rozpakowuje odpowiedź, o ile nagłówek nie został ustawiony ręcznie.
+    Połączenia HTTP/1.1 są utrzymywane między zapytaniami przez Qt.
+    """
+
+    DEFAULT_POLICY = HostPolicy()
+
+    _policies = {}
+    _rate_limit_calls = defaultdict(deque)
+    _metrics_hooks = []
+    _shared_lock = threading.Lock()
+    _local = threading.local()
+
+    def __init__(self):
+        super().__init__()
+        self.manager = QgsNetworkAccessManager.instance()
+        self._queues = defaultdict(list)
+        self._active = defaultdict(int)
+        self._sequence = itertools.count()
+        self._scheduled_hosts = set()
+
+    @classmethod
+    def instance(cls) -> 'HttpClient':
+        client = getattr(cls._local, "client", None)
+        if client is None:
+            client = cls._local.client = cls()
+        return client
+
+    @classmethod
+    def set_host_policy(cls, host: str, policy: HostPolicy):
+        with cls._shared_lock:
+            cls._policies[host] = policy
+
+    @classmethod
+    def host_policy(cls, host: str) -> HostPolicy:
+        return cls._policies.get(host, cls.DEFAULT_POLICY)
+
+    @classmethod
+    def add_metrics_hook(cls, hook: Callable[[dict], None]):
+        """Rejestruje funkcję wywoływaną po każdym zakończonym zapytaniu ze słownikiem metryk"""
+        with cls._shared_lock:
+            if hook not in cls._metrics_hooks:
+                cls._metrics_hooks.append(hook)
+
+    @classmethod
+    def remove_metrics_hook(cls, hook: Callable[[dict], None]):
+        with cls._shared_lock:
+            if hook in cls._metrics_hooks:
+                cls._metrics_hooks.remove(hook)
+
+    @classmethod
+    def _emit_metrics(cls, metrics: dict):
+        for hook in list(cls._metrics_hooks):
+            try:
+                hook(metrics)
+            except Exception as e:
+                LOG_BUFFER.log(f"Błąd funkcji metryk zapytań HTTP: {e}", "GIS Support HTTP", Qgis.MessageLevel.Warning)
+
+    @classmethod
+    def _rate_limit_wait(cls, host: str, policy: HostPolicy) -> float:
+        """Rejestruje zapytanie w limicie serwera albo zwraca czas [s], po którym będzie to możliwe"""
+        if not policy.rate_limit:
+            return 0.0
+        calls, period = policy.rate_limit
+        with cls._shared_lock:
+            now = time.monotonic()
+            history = cls._rate_limit_calls[host]
+            while history and now - history[0] >= period:
+                history.popleft()
+            if len(history) >= calls:
+                return period - (now - history[0])
+            history.append(now)
+            return 0.0
+
+    def send(self, request: QNetworkRequest, method: str = "GET",
+             data: Union[bytes, QByteArray, QHttpMultiPart, None] = None,
+             priority: QNetworkRequest.Priority = QNetworkRequest.Priority.NormalPriority,
+             timeout: Optional[int] = None, limited: bool = True, output_path: Optional[str] = None,
+             resume: bool = False) -> PendingRequest:
+        """
+        Asynchroniczne zapytanie HTTP. Zapytania z `limited=False` (np. strumienie zdarzeń) pomijają kolejkę
+        i limit połączeń serwera. Z `output_path` treść odpowiedzi zapisywana jest na bieżąco do pliku
+        `output_path`.part, przemianowanego na `output_path` po poprawnym zakończeniu pobierania. Z `resume`
+        pobieranie jest wznawiane od końca istniejącego pliku .part (nagłówek Range), a po błędzie plik .part
+        nie jest usuwany.
+        """
+        pending = PendingRequest(request, method.upper(), data, priority, timeout, limited, output_path, resume)
+        pending.client = self
+        if not limited:
+            self._start(pending)
+            return pending
+
+        priority_value = getattr(priority, "value", priority)
+        heapq.heappush(self._queues[pending.host], (priority_value, next(self._sequence), pending))
+        self._dispatch(pending.host)
+        return pending
+
+    def submit(self, request: QNetworkRequest, method: str = "GET",
+               data: Union[bytes, QByteArray, QHttpMultiPart, None] = None,
+               priority: QNetworkRequest.Priority = QNetworkRequest.Priority.NormalPriority,
+               timeout: Optional[int] = None) -> 'HttpFuture':
+        """Wysyła zapytanie i zwraca obiekt HttpFuture - do łączenia z gather() i as_completed()"""
+        return HttpFuture(self.send(request, method, data, priority, timeout))
+
+    def download(self, request: QNetworkRequest, output_path: str,
+                 priority: QNetworkRequest.Priority = QNetworkRequest.Priority.NormalPriority,
+                 timeout: Optional[int] = None, resume: bool = False) -> 'HttpFuture':
+        """
+        Pobiera plik strumieniowo prosto na dysk (bez gromadzenia odpowiedzi w pamięci). Odpowiedź zwracana
+        przez HttpFuture.result() służy tylko do sprawdzenia błędu - jej treść jest już zapisana w `output_path`.
+        Postęp (liczba zapisanych bajtów) przekazuje sygnał `downloadProgress` obiektu `future.pending`.
+        Odpowiedź 304 (nagłówki If-None-Match/If-Modified-Since ustawione w `request`) pozostawia istniejący plik.
+        """
+        return HttpFuture(self.send(request, priority=priority, timeout=timeout, output_path=output_path,
+                                    resume=resume))
+
+    def blocking(self, request: QNetworkRequest, method: str = "GET", data: Union[bytes, QByteArray, None] = None,
+                 timeout: Optional[int] = None, force_refresh: bool = False) -> QgsNetworkReplyContent:
+        """
+        Synchroniczne zapytanie GET lub POST (QgsNetworkAccessManager.blockingGet/blockingPost).
+        Zapytania synchroniczne nie czekają w kolejce, ale podlegają limitowi zapytań, ponowieniom i metrykom.
+        """
+        method = method.upper()
+        host = request.url().host()
+        policy = self.host_policy(host)
+        self._apply_request_options(request, policy, timeout, request.priority())
+
+        queued_at = time.perf_counter()
+        attempts = 0
+        while True:
+            wait = self._rate_limit_wait(host, policy)
+            while wait > 0:
+                time.sleep(wait)
+                wait = self._rate_limit_wait(host, policy)
+
+            attempts += 1
+            started_at = time.perf_counter()
+            if method == "POST":
+                content = self.manager.blockingPost(request, data if data is not None else b"", forceRefresh=force_refresh)
+            else:
+                content = self.manager.blockingGet(request, forceRefresh=force_refresh)
+
+            status_code = content.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+            if method in IDEMPOTENT_METHODS and attempts <= policy.retries \
+                    and self._is_retriable(content.error(), status_code):
+                time.sleep(policy.retry_delay * 2 ** (attempts - 1) / 1000)
+                continue
+
+            self._emit_metrics({
+                "host": host,
+                "method": method,
+                "url": request.url().toString(),
+                "status": status_code,
+                "error": content.errorString() if content.error() != QNetworkReply.NetworkError.NoError else None,
+                "bytes": len(content.content()),
+                "attempts": attempts,
+                "queued_ms": round((started_at - queued_at) * 1000, 1),
+                "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 1),
+            })
+            return content
+
+    @staticmethod
+    def _is_retriable(error, status_code) -> bool:
+        return error in RETRY_NETWORK_ERRORS or status_code in RETRY_STATUS_CODES
+
+    @staticmethod
+    def _apply_request_options(request: QNetworkRequest, policy: HostPolicy, timeout: Optional[int], priority):
+        request.setPriority(priority)
+        request.setTransferTimeout(policy.timeout if timeout is None else timeout)
+
+    def _dispatch(self, host: str):
+        self._scheduled_hosts.discard(host)
+        policy = self.host_policy(host)
+        queue = self._queues[host]
+        while queue and self._active[host] < policy.max_connections:
+            wait = self._rate_limit_wait(host, policy)
+            if wait > 0:
+                if host not in self._scheduled_hosts:
+                    self._scheduled_hosts.add(host)
+                    QTimer.singleShot(int(wait * 1000) + 1, lambda: self._dispatch(host))
+                return
+            _, _, pending = heapq.heappop(queue)
+            if pending.aborted:
+                continue
+            self._start(pending)
+
+    def _start(self, pending: PendingRequest):
+        policy = self.host_policy(pending.host)
+        if pending.timeout != 0:
+            self._apply_request_options(pending.request, policy, pending.timeout, pending.priority)
+        else:
+            pending.request.setPriority(pending.priority)
+
+        pending.attempts += 1
+        pending.started_at = time.perf_counter()
+        if pending.limited:
+            self._active[pending.host] += 1
+        if pending.output_path:
+            self._prepare_range(pending)
+
+        data = pending.data if pending.data is not None else QByteArray()
+        if pending.method == "GET":
+            reply = self.manager.get(pending.request)
+        elif pending.method == "POST":
+            reply = self.manager.post(pending.request, data)
+        elif pending.method == "PUT":
+            reply = self.manager.put(pending.request, data)
+        elif pending.method == "HEAD":
+            reply = self.manager.head(pending.request)
+        else:
+            reply = self.manager.sendCustomRequest(pending.request, QByteArray(pending.method.encode()), data)
+
+        pending.reply = reply
+        if pending.output_path:
+            self._open_output(pending, reply)
+        else:
+            reply.downloadProgress.connect(pending.downloadProgress.emit)
+        reply.finished.connect(lambda: self._on_reply_finished(pending, reply))
+
+    def _open_output(self, pending: PendingRequest, reply: QNetworkReply):
+        pending.output = None
+        pending.bytes_received = 0
+        # Ograniczony bufor odpowiedzi - Qt wstrzymuje odbiór danych, dopóki nie zostaną zapisane
+        reply.setReadBufferSize(4 * OUTPUT_BUFFER_SIZE)
+        reply.readyRead.connect(lambda: self._write_output(pending, reply))
+
+    @staticmethod
+    def _prepare_range(pending: PendingRequest):
+        """Nagłówek Range wznawiający pobieranie od końca pliku .part (przed każdą próbą zapytania)"""
+        part_path = f"{pending.output_path}.part"
+        pending.offset = os.path.getsize(part_path) if pending.resume and os.path.exists(part_path) else 0
+        # Pusta (null) wartość usuwa nagłówek z poprzedniej próby
+        pending.request.setRawHeader(b"Range", QByteArray(f"bytes={pending.offset}-".encode()) if pending.offset else QByteArray())
+
+    def _write_output(self, pending: PendingRequest, reply: QNetworkReply):
+        status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if status_code not in (200, 206):
+            # Treść odpowiedzi błędnej nie może nadpisać pobranej części pliku
+            reply.read(reply.bytesAvailable())
+            return
+        if pending.output is None:
+            append = pending.resume and status_code == 206
+            pending.output = open(f"{pending.output_path}.part", "ab" if append else "wb", buffering=OUTPUT_BUFFER_SIZE)
+            if not append:
+                pending.offset = 0
+        data = reply.read(reply.bytesAvailable())
+        if not data:
+            return
+        pending.output.write(data)
+        pending.bytes_received += len(data)
+        total = reply.header(QNetworkRequest.KnownHeaders.ContentLengthHeader)
+        pending.downloadProgress.emit(pending.offset + pending.bytes_received,
+                                      pending.offset + int(total) if total is not None else -1)
+
+    def _close_output(self, pending: PendingRequest, reply: Optional[QNetworkReply]):
+        """
+        Zamyka plik pobierania - po poprawnej odpowiedzi przenosi go pod `output_path`, po odpowiedzi 304
+        pozostawia istniejący plik, a w pozostałych przypadkach usuwa plik .part (przy wznawianiu - zachowuje go)
+        """
+        if not pending.output_path:
+            return
+        status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute) if reply is not None else None
+        completed = reply is not None and not pending.aborted and reply.error() == QNetworkReply.NetworkError.NoError
+        part_path = f"{pending.output_path}.part"
+        if completed and status_code != 304:
+            self._write_output(pending, reply)
+            if pending.output is None:
+                pending.output = open(part_path, "wb")
+        if pending.output is not None:
+            pending.output.close()
+            pending.output = None
+        if completed:
+            if status_code != 304:
+                os.replace(part_path, pending.output_path)
+            return
+        if pending.resume and status_code != 416:
+            return
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+    def _on_reply_finished(self, pending: PendingRequest, reply: QNetworkReply):
+        if pending.limited:
+            self._active[pending.host] -= 1
+
+        policy = self.host_policy(pending.host)
+        status_code = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if not pending.aborted and pending.method in IDEMPOTENT_METHODS and pending.attempts <= policy.retries \
+                and self._is_retriable(reply.error(), status_code):
+            self._close_output(pending, reply)
+            reply.deleteLater()
+            pending.reply = None
+            delay = policy.retry_delay * 2 ** (pending.attempts - 1)
+            QTimer.singleShot(delay, lambda: self._retry(pending))
+        else:
+            self._finish(pending, reply)
+
+        if pending.limited:
+            self._dispatch(pending.host)
+
+    def _retry(self, pending: PendingRequest):
+        if pending.aborted:
+            return
+        if not pending.limited:
+            self._start(pending)
+            return
+        priority_value = getattr(pending.priority, "value", pending.priority)
+        heapq.heappush(self._queues[pending.host], (priority_value, next(self._sequence), pending))
+        self._dispatch(pending.host)
+
+    def _finish(self, pending: PendingRequest, reply: Optional[QNetworkReply]):
+        if pending._finished:
+            return
+        pending._finished = True
+        self._close_output(pending, reply)
+        if reply is not None:
+            self._emit_metrics({
+                "host": pending.host,
+                "method": pending.method,
+                "url": pending.request.url().toString(),
+                "status": reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute),
+                "error": reply.errorString() if reply.error() != QNetworkReply.NetworkError.NoError else None,
+                "bytes": pending.bytes_received if pending.output_path else reply.bytesAvailable(),
+                "attempts": pending.attempts,
+                "queued_ms": round((pending.started_at - pending.queued_at) * 1000, 1),
+                "elapsed_ms": round((time.perf_counter() - pending.started_at) * 1000, 1),
+            })
+        pending.finished.emit(reply)
+
+
+class HttpFuture:
+    """
+    Wynik zapytania wysłanego przez HttpClient.submit(). Na wynik trzeba czekać w wątku, w którym wysłano
+    zapytanie (w wątku głównym lub w zadaniu QgsTask) - oczekiwanie obsługuje zdarzenia Qt tego wątku.
+    """
+
+    def __init__(self, pending: PendingRequest):
+        self.pending = pending
+
+    def done(self) -> bool:
+        return self.pending.isFinished()
+
+    def cancelled(self) -> bool:
+        return self.pending.aborted
+
+    def cancel(self) -> bool:
+        """Przerywa zapytanie (również oczekujące w kolejce); zwraca False, jeśli zapytanie już się zakończyło"""
+        if self.done():
+            return False
+        self.pending.abort()
+        return True
+
+    def add_done_callback(self, callback: Callable[['HttpFuture'], None]):
+        if self.done():
+            callback(self)
+        else:
+            self.pending.finished.connect(lambda _: callback(self))
+
+    def result(self, timeout: Optional[float] = None,
+               feedback: Union[QgsTask, QgsFeedback, None] = None) -> QNetworkReply:
+        """Odpowiedź serwera (również błędna - do sprawdzenia przez reply.error())"""
+        wait([self], timeout, feedback)
+        if self.pending.aborted or self.pending.reply is None:
+            raise CancelledError()
+        return self.pending.reply
+
+
+def wait(futures: Iterable[HttpFuture], timeout: Optional[float] = None,
+         feedback: Union[QgsTask, QgsFeedback, None] = None, return_when_first: bool = False):
+    """
+    Obsługuje zdarzenia Qt do zakończenia zapytań (lub pierwszego z nich).
+    Po anulowaniu zadania/feedback przerywa niezakończone zapytania i zgłasza CancelledError,
+    po upływie `timeout` sekund zgłasza TimeoutError (zapytania nie są przerywane).
+    """
+    futures = list(futures)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    app = QCoreApplication.instance()
+
+    # Zegar wybudza pętlę, żeby sprawdzić anulowanie i limit czasu także wtedy, gdy nie ma innych zdarzeń
+    wakeup = QTimer()
+    wakeup.setInterval(100)
+    wakeup.start()
+    try:
+        while True:
+            finished = [future for future in futures if future.done()]
+            if len(finished) == len(futures) or (return_when_first and finished):
+                return
+            if feedback is not None and feedback.isCanceled():
+                for future in futures:
+                    future.cancel()
+                raise CancelledError()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError()
+            app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+    finally:
+        wakeup.stop()
+
+
+def gather(futures: Iterable[HttpFuture], timeout: Optional[float] = None,
+           feedback: Union[QgsTask, QgsFeedback, None] = None) -> List[Optional[QNetworkReply]]:
+    """Czeka na wszystkie zapytania i zwraca odpowiedzi w kolejności zapytań (None dla przerwanych)"""
+    futures = list(futures)
+    wait(futures, timeout, feedback)
+    return [None if future.cancelled() else future.pending.reply for future in futures]
+
+
+def as_completed(futures: Iterable[HttpFuture], timeout: Optional[float] = None,
+                 feedback: Union[QgsTask, QgsFeedback, None] = None) -> Iterator[HttpFuture]:
+    """Zwraca zapytania w kolejności ich zakończenia; `timeout` dotyczy wszystkich zapytań łącznie"""
+    remaining = list(futures)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while remaining:
+        wait(remaining, None if deadline is None else max(0.0, deadline - time.monotonic()), feedback,
+             return_when_first=True)
+        for future in [future for future in remaining if future.done()]:
+            remaining.remove(future)
+            yield future
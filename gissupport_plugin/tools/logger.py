@@ -1,9 +1,16 @@
 import configparser
+import json
+import logging
 import os
+import threading
+import time
+from collections import deque, defaultdict
+from logging.handlers import RotatingFileHandler
 
-from qgis.core import QgsMessageLog, Qgis
+from qgis.core import QgsApplication, QgsMessageLog, Qgis
+from qgis.PyQt.QtCore import QSettings, QTimer
 from qgis.utils import iface
-from typing import Any
+from typing import Any, Optional
 
 config = configparser.ConfigParser()
 config.read(os.path.join(os.path.dirname(__file__), '..', 'metadata.txt'))
@@ -11,11 +18,156 @@ config.read(os.path.join(os.path.dirname(__file__), '..', 'metadata.txt'))
 PLUGIN_NAME = config['general']['name']
 
 
+class LogBuffer:
+    """
+    Buforowane logowanie do panelu komunikatów QGIS.
+
+    Wpisy z dowolnego wątku trafiają do bufora, który co `interval` ms jest opróżniany w wątku głównym -
+    wpisy tej samej kategorii i poziomu przekazywane są do QgsMessageLog jednym wywołaniem (najwyżej
+    po MAX_BATCH_LINES wierszy), a zbiorcze wpisy informacyjne nie powiadamiają użytkownika.
+    Wpisy poniżej minimalnego poziomu są pomijane, a wpisy informacyjne kategorii z ustawionym
+    próbkowaniem zapisywane są co n-ty raz. Opcjonalnie wpisy zapisywane są do rotowanego pliku JSON Lines.
+    """
+
+    # Maksymalna liczba wierszy jednego zbiorczego wpisu w dzienniku komunikatów
+    MAX_BATCH_LINES = 50
+
+    MIN_LEVEL_SETTINGS_KEY = "gissupport/log/min_level"
+    FILE_ENABLED_SETTINGS_KEY = "gissupport/log/file_enabled"
+
+    LEVEL_ORDER = {
+        Qgis.MessageLevel.Info: 0,
+        Qgis.MessageLevel.Success: 0,
+        Qgis.MessageLevel.Warning: 1,
+        Qgis.MessageLevel.Critical: 2,
+    }
+    LEVEL_NAMES = {
+        Qgis.MessageLevel.Info: "info",
+        Qgis.MessageLevel.Success: "success",
+        Qgis.MessageLevel.Warning: "warning",
+        Qgis.MessageLevel.Critical: "critical",
+    }
+
+    def __init__(self, interval: int = 500, max_size: int = 10000):
+        self.interval = interval
+        self.min_level = 0
+        self._entries = deque(maxlen=max_size)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._sampling = {}
+        self._sampling_counters = defaultdict(int)
+        self._timer = None
+        self._file_logger = None
+
+    @property
+    def started(self) -> bool:
+        return self._timer is not None
+
+    def start(self):
+        """Uruchamia dostarczanie wpisów - musi być wywołane w wątku głównym"""
+        if self._timer is not None:
+            return
+        settings = QSettings()
+        self.min_level = settings.value(self.MIN_LEVEL_SETTINGS_KEY, 0, type=int)
+        self.set_file_enabled(settings.value(self.FILE_ENABLED_SETTINGS_KEY, False, type=bool))
+        self._timer = QTimer()
+        self._timer.setInterval(self.interval)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start()
+
+    def stop(self):
+        if self._timer is None:
+            return
+        self._timer.stop()
+        self._timer = None
+        self.flush()
+        self.set_file_enabled(False)
+
+    def set_sampling(self, category: str, rate: int):
+        """Zapisuje co `rate`-ty wpis informacyjny kategorii (1 - wszystkie); ostrzeżenia i błędy zawsze"""
+        with self._lock:
+            if rate > 1:
+                self._sampling[category] = rate
+            else:
+                self._sampling.pop(category, None)
+
+    def set_file_enabled(self, enabled: bool, path: Optional[str] = None,
+                         max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        if self._file_logger is not None:
+            for handler in self._file_logger.handlers[:]:
+                handler.close()
+                self._file_logger.removeHandler(handler)
+            self._file_logger = None
+        if not enabled:
+            return
+
+        path = path or os.path.join(QgsApplication.qgisSettingsDirPath(), "gissupport", "logs", "gissupport.jsonl")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._file_logger = logging.getLogger("gissupport_plugin.log_buffer")
+        self._file_logger.propagate = False
+        self._file_logger.setLevel(logging.INFO)
+        self._file_logger.addHandler(handler)
+
+    def log(self, message: Any, category: str, level: Qgis.MessageLevel = Qgis.MessageLevel.Info) -> None:
+        level_order = self.LEVEL_ORDER.get(level, 0)
+        if level_order < self.min_level:
+            return
+
+        if self._timer is None:
+            # Bez uruchomionego bufora (np. poza QGIS) wpis trafia bezpośrednio do dziennika
+            QgsMessageLog.logMessage(str(message), category, level)
+            return
+
+        with self._lock:
+            rate = self._sampling.get(category)
+            if rate and level_order == 0:
+                self._sampling_counters[category] += 1
+                if (self._sampling_counters[category] - 1) % rate:
+                    return
+            if len(self._entries) == self._entries.maxlen:
+                self._dropped += 1
+            self._entries.append((time.time(), category, level, str(message)))
+
+    def flush(self):
+        with self._lock:
+            entries = list(self._entries)
+            self._entries.clear()
+            dropped, self._dropped = self._dropped, 0
+
+        if not entries and not dropped:
+            return
+
+        grouped = defaultdict(list)
+        for timestamp, category, level, message in entries:
+            grouped[(category, level)].append(message)
+        for (category, level), messages in grouped.items():
+            for start in range(0, len(messages), self.MAX_BATCH_LINES):
+                QgsMessageLog.logMessage("\n".join(messages[start:start + self.MAX_BATCH_LINES]), category, level,
+                                         notifyUser=level != Qgis.MessageLevel.Info)
+        if dropped:
+            QgsMessageLog.logMessage(f"Pominięto {dropped} wpisów - przepełnienie bufora dziennika",
+                                     f'{PLUGIN_NAME} Log', Qgis.MessageLevel.Warning)
+
+        if self._file_logger is not None:
+            for timestamp, category, level, message in entries:
+                self._file_logger.info(json.dumps({
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(timestamp)),
+                    "category": category,
+                    "level": self.LEVEL_NAMES.get(level, "info"),
+                    "message": message
+                }, ensure_ascii=False))
+
+
+LOG_BUFFER = LogBuffer()
+
+
 class Logger:
     @staticmethod
     def log( message: Any, level: Qgis.MessageLevel = Qgis.MessageLevel.Info) -> None:
         """ Skrót do logowania informacji w konsoli QGIS """
-        QgsMessageLog.logMessage(str(message), f'{PLUGIN_NAME} Log', level)
+        LOG_BUFFER.log(message, f'{PLUGIN_NAME} Log', level)
 
     @staticmethod
     def message(message: Any, title: str = PLUGIN_NAME, level: Qgis.MessageLevel = Qgis.MessageLevel.Info, duration: int = 0) -> None:
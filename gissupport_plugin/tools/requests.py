@@ -1,7 +1,6 @@
 import json
 from typing import Union
 
-from qgis.core import QgsNetworkAccessManager
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
 from qgis.PyQt.QtCore import QCoreApplication, QUrl
 from qgis.PyQt.QtCore import QObject, pyqtSignal
@@ -9,20 +8,26 @@ from qgis.PyQt.QtCore import QObject, pyqtSignal
 from urllib.parse import urlencode
 
 from gissupport_plugin.tools.gisbox_connection import GISBOX_CONNECTION
+from gissupport_plugin.tools.http_client import HttpClient, PendingRequest
 
 
 class NetworkHandler(QObject):
     downloadProgress: pyqtSignal = pyqtSignal(int)
 
-    def __init__(self):
+    def __init__(self, priority: QNetworkRequest.Priority = QNetworkRequest.Priority.NormalPriority):
         super().__init__()
-        self.network_manager = QgsNetworkAccessManager.instance()
+        self.client = HttpClient.instance()
+        self.priority = priority
         self.result = None
 
     def handle_response(self, reply, retry_callback=None, reply_only: bool=False):
         if reply_only:
             self.result = reply
             return
+        if reply is None:
+            # Zapytanie przerwane, zanim zostało wysłane (np. oczekujące w kolejce HttpClient)
+            self.result = {'error': 'Operation canceled', 'msg': 'Zapytanie zostało przerwane.'}
+            return
         if reply.error() == QNetworkReply.NetworkError.NoError:
             data = reply.readAll().data().decode()
             self.result = {'data': data}
@@ -43,47 +48,13 @@ class NetworkHandler(QObject):
 
     def get(self, url, reply_only: bool=False, params: dict=None) -> Union[dict, QNetworkReply]:
         """Wykonuje żądanie GET do podanego URL"""
-        self.result = None
-        self.error_occurred = False
-
-        def try_request(url, retry_callback=None):
-            request = QNetworkRequest(QUrl(url))
-            
-            reply = self.network_manager.get(request)
-            reply.downloadProgress.connect( lambda recv, total: self.downloadProgress.emit(self.set_progress(recv, total)))
-            reply.finished.connect(lambda: self.handle_response(reply, retry_callback, reply_only))
-            return reply
-
         if params:
             url += "?" + urlencode(params)
 
-        reply = try_request(url)
-
-        app = QCoreApplication.instance()
-        while self.result is None and not reply.isFinished():
-            app.processEvents()
-
-        return self.result
+        return self.wait_for(self.client.send(QNetworkRequest(QUrl(url)), priority=self.priority), reply_only)
 
     def post(self, url, reply_only: bool = False, params: dict = None, data: dict = None, srid: str = None, databox: bool = False, token: bool = False) -> Union[dict, QNetworkReply]:
         """Wykonuje żądanie POST do podanego URL"""
-        self.result = None
-        self.error_occurred = False
-
-        def try_request(url, body, srid: str = None, retry_callback=None, token: bool = False):
-            request = QNetworkRequest(QUrl(url))
-            if srid:
-                request.setRawHeader(b'X-Response-SRID', srid.encode())
-            if token:
-                request.setRawHeader(b'X-User-Agent', b'qgis_gs')
-                request.setRawHeader(b'X-Access-Token', GISBOX_CONNECTION.token.encode())
-            if databox:
-                request.setHeader(QNetworkRequest.KnownHeaders.ContentTypeHeader, "application/json")
-            reply = self.network_manager.post(request, body)
-            reply.downloadProgress.connect( lambda recv, total: self.downloadProgress.emit(self.set_progress(recv, total)))
-            reply.finished.connect(lambda: self.handle_response(reply, retry_callback, reply_only))
-            return reply
-
         if params:
             url += "?" + urlencode(params)
 
@@ -92,10 +63,27 @@ class NetworkHandler(QObject):
         else:
             data = b''
 
-        reply = try_request(url, data, srid, token=token)
+        request = QNetworkRequest(QUrl(url))
+        if srid:
+            request.setRawHeader(b'X-Response-SRID', srid.encode())
+        if token:
+            request.setRawHeader(b'X-User-Agent', b'qgis_gs')
+            request.setRawHeader(b'X-Access-Token', GISBOX_CONNECTION.token.encode())
+        if databox:
+            request.setHeader(QNetworkRequest.KnownHeaders.ContentTypeHeader, "application/json")
+
+        return self.wait_for(self.client.send(request, "POST", data, priority=self.priority), reply_only)
+
+    def wait_for(self, pending: PendingRequest, reply_only: bool) -> Union[dict, QNetworkReply]:
+        """Czeka na zakończenie zapytania, obsługując zdarzenia Qt (również w wątku QThread)"""
+        self.result = None
+        self.error_occurred = False
+
+        pending.downloadProgress.connect(lambda recv, total: self.downloadProgress.emit(self.set_progress(recv, total)))
+        pending.finished.connect(lambda reply: self.handle_response(reply, None, reply_only))
 
         app = QCoreApplication.instance()
-        while self.result is None and not reply.isFinished():
+        while self.result is None and not pending.isFinished():
             app.processEvents()
 
         return self.result
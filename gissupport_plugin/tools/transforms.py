@@ -0,0 +1,99 @@
+import threading
+from typing import Optional, Union
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsCoordinateTransformContext, QgsProject
+
+
+class TransformCache:
+    """
+    Pamięć podręczna obiektów QgsCoordinateTransform współdzielona przez całą wtyczkę.
+
+    Transformacje są indeksowane układem źródłowym, docelowym i kontekstem transformacji.
+    Brak kontekstu oznacza kontekst aktywnego projektu - transformacje w tym kontekście są usuwane
+    po jego zmianie (np. po wczytaniu innego projektu lub zmianie ustawień transformacji), o ile
+    pamięć podręczna została podłączona do projektu przez connect_project().
+    """
+
+    PROJECT_CONTEXT = "project"
+
+    def __init__(self):
+        self._transforms = {}
+        self._contexts = []
+        self._lock = threading.Lock()
+        self._project_connected = False
+
+    @staticmethod
+    def crs_key(crs: Union[QgsCoordinateReferenceSystem, str]) -> str:
+        if isinstance(crs, str):
+            return crs
+        # Układy użytkownika nie mają identyfikatora, wtedy kluczem jest definicja WKT
+        return crs.authid() or crs.toWkt()
+
+    def context_key(self, context: Optional[QgsCoordinateTransformContext]):
+        if context is None:
+            return self.PROJECT_CONTEXT
+        # QgsCoordinateTransformContext nie jest haszowalny - kontekst identyfikowany jest pozycją na liście
+        for index, known_context in enumerate(self._contexts):
+            if known_context == context:
+                return index
+        self._contexts.append(QgsCoordinateTransformContext(context))
+        return len(self._contexts) - 1
+
+    def get(self, source_crs: Union[QgsCoordinateReferenceSystem, str],
+            destination_crs: Union[QgsCoordinateReferenceSystem, str],
+            context: Optional[QgsCoordinateTransformContext] = None) -> QgsCoordinateTransform:
+        """
+        Zwraca transformację między układami; układy mogą być podane jako obiekty lub identyfikatory (np. 'EPSG:2180').
+        Zwracana jest kopia (współdzielona niejawnie przez QGIS), którą można używać w dowolnym wątku.
+        """
+        with self._lock:
+            key = (self.crs_key(source_crs), self.crs_key(destination_crs), self.context_key(context))
+            transform = self._transforms.get(key)
+            if transform is None:
+                if isinstance(source_crs, str):
+                    source_crs = QgsCoordinateReferenceSystem(source_crs)
+                if isinstance(destination_crs, str):
+                    destination_crs = QgsCoordinateReferenceSystem(destination_crs)
+                if context is None:
+                    transform = QgsCoordinateTransform(source_crs, destination_crs, QgsProject.instance())
+                else:
+                    transform = QgsCoordinateTransform(source_crs, destination_crs, context)
+                self._transforms[key] = transform
+            return QgsCoordinateTransform(transform)
+
+    def connect_project(self):
+        """Podłączenie do sygnałów projektu - wywoływane raz, w wątku głównym (przy uruchomieniu wtyczki)"""
+        if self._project_connected:
+            return
+        self._project_connected = True
+        project = QgsProject.instance()
+        project.transformContextChanged.connect(self.clear_project_transforms)
+        project.cleared.connect(self.clear_project_transforms)
+
+    def disconnect_project(self):
+        if not self._project_connected:
+            return
+        self._project_connected = False
+        project = QgsProject.instance()
+        project.transformContextChanged.disconnect(self.clear_project_transforms)
+        project.cleared.disconnect(self.clear_project_transforms)
+
+    def clear_project_transforms(self):
+        with self._lock:
+            self._transforms = {key: transform for key, transform in self._transforms.items()
+                                if key[2] != self.PROJECT_CONTEXT}
+
+    def clear(self):
+        with self._lock:
+            self._transforms.clear()
+            self._contexts.clear()
+
+
+TRANSFORM_CACHE = TransformCache()
+
+
+def get_transform(source_crs: Union[QgsCoordinateReferenceSystem, str],
+                  destination_crs: Union[QgsCoordinateReferenceSystem, str],
+                  context: Optional[QgsCoordinateTransformContext] = None) -> QgsCoordinateTransform:
+    """ Skrót do pobierania transformacji z pamięci podręcznej wtyczki """
+    return TRANSFORM_CACHE.get(source_crs, destination_crs, context)
@@ -3,12 +3,12 @@ import uuid
 import os
 from typing import Union
 
-from qgis.core import QgsNetworkAccessManager
 from qgis.PyQt.QtCore import QObject, QUrl, QByteArray, pyqtSignal, QTimer, QCoreApplication
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
 from qgis.PyQt.QtNetwork import QHttpMultiPart, QHttpPart
 from qgis.PyQt.QtCore import QFile, QIODevice, QEventLoop
 
+from gissupport_plugin.tools.http_client import HttpClient
 from gissupport_plugin.tools.usemaps_lite.translations import TRANSLATOR
 
 class ApiClient(QObject):
@@ -25,7 +25,6 @@ class ApiClient(QObject):
         super().__init__()
         self.base_url = "https://usemaps-lite.gis.support/api/"
         self.auth_token = None
-        self.nam = QgsNetworkAccessManager.instance()
         self._pending_callbacks = {}
 
         self._sse_reply = None
@@ -36,6 +35,14 @@ class ApiClient(QObject):
         self._sse_max_reconnect_delay = 30000
         self._is_sse_listening_requested = False
 
+    @property
+    def client(self) -> HttpClient:
+        """
+        Klient HTTP bieżącego wątku (zapytania synchroniczne wykonywane są również w zadaniach QgsTask).
+        """
+
+        return HttpClient.instance()
+
     def _make_request(self, endpoint, method="GET", data=None, callback=None) -> None:
         """
         Bazowa funkcja do wykonywania requestów.
@@ -53,28 +60,29 @@ class ApiClient(QObject):
             self._pending_callbacks[request_id] = callback
 
         if method == "GET":
-            reply = self.nam.get(request)
+            pending = self.client.send(request)
         elif method == "POST":
             json_data = QByteArray(json.dumps(data).encode("utf-8"))
-            reply = self.nam.post(request, json_data)
+            pending = self.client.send(request, "POST", json_data)
         elif method == "DELETE":
             json_data = QByteArray(json.dumps(data).encode("utf-8")) if data else QByteArray()
-            reply = self.nam.sendCustomRequest(request, QByteArray(b"DELETE"), json_data)
+            pending = self.client.send(request, "DELETE", json_data)
 
-        reply.setProperty("request_id", request_id)
-        reply.setProperty("endpoint", endpoint)
-        reply.finished.connect(lambda: self._handle_response(reply))
+        pending.finished.connect(lambda reply: self._handle_response(reply, request_id))
 
-    def _handle_response(self, reply) -> None:
+    def _handle_response(self, reply, request_id=None) -> None:
         """
         Funkcja do przetwarzania otrzymanej odpowiedzi z requesta.
         """
 
-        request_id = reply.property("request_id")
         callback = self._pending_callbacks.pop(request_id, None)
         response_data = {}
 
-        if reply.error() != QNetworkReply.NetworkError.NoError:
+        if reply is None:
+            # Zapytanie przerwane, zanim zostało wysłane (np. oczekujące w kolejce HttpClient)
+            response_data["error"] = {"error": "Operation canceled", "details": ""}
+
+        elif reply.error() != QNetworkReply.NetworkError.NoError:
             error_msg_raw = reply.readAll().data().decode('utf-8', errors='ignore')
             parsed_error = {"error": reply.errorString(), "details": error_msg_raw}
             try:
@@ -97,7 +105,8 @@ class ApiClient(QObject):
         self.result = response_data
         if callback:
             callback(response_data)
-        reply.deleteLater()
+        if reply is not None:
+            reply.deleteLater()
 
     def get(self, endpoint, callback=None) -> None:
         """
@@ -149,12 +158,10 @@ class ApiClient(QObject):
         if callback:
             self._pending_callbacks[request_id] = callback
 
-        reply = self.nam.post(request, multi_part)
-        reply.setProperty("request_id", request_id)
-        reply.setProperty("endpoint", endpoint)
-        reply.finished.connect(lambda: self._handle_response(reply))
+        pending = self.client.send(request, "POST", multi_part)
+        pending.finished.connect(lambda reply: self._handle_response(reply, request_id))
 
-        multi_part.setParent(reply)
+        multi_part.setParent(pending)
 
     def simple_get(self, url) -> Union[dict, QNetworkReply]:
         """Wykonuje synchroniczny request GET"""
@@ -171,17 +178,11 @@ class ApiClient(QObject):
             if self.auth_token:
                 request.setRawHeader(b"Authorization", f"Bearer {self.auth_token}".encode("utf-8"))
 
-            reply = self.nam.get(request)
+            pending = self.client.send(request)
+            pending.finished.connect(self._handle_response)
+            return pending
 
-            # reply.downloadProgress.connect( lambda recv, total: self.downloadProgress.emit(self.set_progress(recv, total)))
-            reply.finished.connect(lambda: self._handle_response(reply))
-            return reply
-
-        reply = try_request(url)
-
-        loop = QEventLoop()
-        reply.finished.connect(loop.quit)
-        loop.exec()
+        self.wait_for(try_request(url))
 
         return self.result
 
@@ -213,15 +214,12 @@ class ApiClient(QObject):
         file.setParent(multi_part)
         multi_part.append(file_part)
 
-        reply = self.nam.post(request, multi_part)
-        reply.setProperty("endpoint", endpoint)
-        reply.finished.connect(lambda: self._handle_response(reply))
+        pending = self.client.send(request, "POST", multi_part)
+        pending.finished.connect(self._handle_response)
 
-        multi_part.setParent(reply)
+        multi_part.setParent(pending)
 
-        loop = QEventLoop()
-        reply.finished.connect(loop.quit)
-        loop.exec()
+        self.wait_for(pending)
 
         file.close()
 
@@ -241,24 +239,31 @@ class ApiClient(QObject):
             if self.auth_token:
                 request.setRawHeader(b"Authorization", f"Bearer {self.auth_token}".encode("utf-8"))
 
-            reply = self.nam.post(request, body)
-            # reply.downloadProgress.connect( lambda recv, total: self.downloadProgress.emit(self.set_progress(recv, total)))
-            reply.finished.connect(lambda: self._handle_response(reply))
-            return reply
+            pending = self.client.send(request, "POST", body)
+            pending.finished.connect(self._handle_response)
+            return pending
 
         if data:
             data = str.encode(json.dumps(data))
         else:
             data = b''
 
-        reply = try_request(url, data)
+        self.wait_for(try_request(url, data))
+
+        return self.result
 
+    @staticmethod
+    def wait_for(pending) -> None:
+        """
+        Czeka w lokalnej pętli zdarzeń na zakończenie zapytania.
+        """
+
+        if pending.isFinished():
+            return
         loop = QEventLoop()
-        reply.finished.connect(loop.quit)
+        pending.finished.connect(loop.quit)
         loop.exec()
 
-        return self.result
-
     def start_listening(self) -> None:
         """
         Rozpoczyna nasłuchiwanie zdarzeń SSE z endpointu /org/notify.
@@ -281,8 +286,8 @@ class ApiClient(QObject):
         request.setRawHeader(b"Accept", b"text/event-stream")
         request.setAttribute(QNetworkRequest.Attribute.RedirectPolicyAttribute, QNetworkRequest.RedirectPolicy.NoLessSafeRedirectPolicy)
 
-        reply = self.nam.get(request)
-        reply.setProperty("endpoint", sse_endpoint)
+        # Strumień zdarzeń jest otwarty bez końca - pomija kolejkę i limit czasu zapytań
+        reply = self.client.send(request, timeout=0, limited=False).reply
 
         if self._sse_reply:
             self._sse_reply.abort()